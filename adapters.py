@@ -0,0 +1,130 @@
+"""
+Several LoRA adapters served from one shared base model.
+
+Adapters are loaded into the `PeftModel` on first use. The active adapter is model-wide
+state, so generations for the active adapter run concurrently, while a switch to another
+adapter waits until they finish. Requests that arrive for the active adapter while another
+one is waiting queue behind the switch, so adapters take turns instead of starving. When the
+loaded adapters exceed the memory budget, the least recently used inactive ones are unloaded.
+"""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import metrics
+from config_log import get_logger
+logger = get_logger(__name__)
+
+ADAPTER_LOADS = metrics.counter("summarimer_adapter_loads_total", "Adapters loaded into the base model.")
+ADAPTER_EVICTIONS = metrics.counter("summarimer_adapter_evictions_total", "Adapters unloaded to stay under the memory budget.")
+
+
+def parse_adapters(spec: str) -> dict:
+    """
+    Parses an adapter list such as "headline=./lora-headline,finance=org/lora-finance".
+    parameters:
+        spec (str): Comma-separated `name=path` pairs.
+    returns:
+        dict: Adapter name to PEFT adapter name or path.
+    """
+    adapters = {}
+    for entry in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, sep, path = entry.partition("=")
+        if not sep or not name.strip() or not path.strip():
+            raise ValueError(f"Invalid adapter entry: {entry!r}, expected name=path")
+        adapters[name.strip()] = path.strip()
+    return adapters
+
+
+class AdapterManager:
+    """
+    Loads and unloads named LoRA adapters on a `PeftModel` under a memory budget.
+
+    The adapter the model was created with ("default") always stays loaded.
+    """
+
+    def __init__(self, model, paths: dict, memory_budget_mb: float = 256):
+        if "default" in paths:
+            raise ValueError("The adapter name 'default' is reserved for the base adapter")
+        self.model = model
+        self.paths = dict(paths)
+        self.memory_budget_mb = memory_budget_mb
+        # Adapter đã nạp theo thứ tự dùng gần nhất: tên -> dung lượng (MiB)
+        self._loaded = OrderedDict()
+        # Adapter đang active, số lượt generate đang dùng nó, số lần đổi adapter và số lượt chờ theo adapter
+        self._active = "default"
+        self._users = 0
+        self._epoch = 0
+        self._waiting = {}
+        self._cond = threading.Condition()
+        metrics.gauge("summarimer_adapters_loaded", "Adapters currently loaded.", callback=lambda: len(self._loaded))
+        metrics.gauge("summarimer_adapters_memory_mb", "Memory used by loaded adapters.", callback=self.memory_mb)
+
+    def memory_mb(self) -> float:
+        return sum(self._loaded.values())
+
+    def _size_mb(self, name: str) -> float:
+        marker = f".{name}."
+        size = sum(p.numel() * p.element_size() for n, p in self.model.named_parameters() if marker in n)
+        return size / (1024 * 1024)
+
+    def _load(self, name: str):
+        self.model.load_adapter(self.paths[name], adapter_name=name)
+        self._loaded[name] = self._size_mb(name)
+        ADAPTER_LOADS.inc()
+        logger.info("Loaded adapter %s (%.1f MiB, %d loaded).", name, self._loaded[name], len(self._loaded))
+
+    def _evict(self):
+        for name in list(self._loaded):
+            if self.memory_mb() <= self.memory_budget_mb:
+                return
+            if name != self._active:
+                self.model.delete_adapter(name)
+                del self._loaded[name]
+                ADAPTER_EVICTIONS.inc()
+                logger.info("Unloaded adapter %s to stay under %.0f MiB.", name, self.memory_budget_mb)
+        if self.memory_mb() > self.memory_budget_mb:
+            logger.warning("Adapters in use take %.1f MiB, over the %.0f MiB budget.", self.memory_mb(), self.memory_budget_mb)
+
+    def _can_enter(self, name: str, epoch: int) -> bool:
+        if name == self._active:
+            # Đã chờ từ trước lần đổi sang adapter này, hoặc không có adapter khác đang chờ
+            return epoch < self._epoch or not any(count for other, count in self._waiting.items() if other != name)
+        return self._users == 0
+
+    @contextmanager
+    def use(self, name: str = None):
+        """
+        Makes an adapter active and keeps it so for the duration of a generate call.
+        parameters:
+            name (str): A key of `paths`, or None for the default adapter.
+        raises:
+            ValueError: If the adapter is not configured.
+        """
+        name = name or "default"
+        if name != "default" and name not in self.paths:
+            raise ValueError(f"Unknown adapter: {name}")
+        with self._cond:
+            epoch = self._epoch
+            self._waiting[name] = self._waiting.get(name, 0) + 1
+            try:
+                self._cond.wait_for(lambda: self._can_enter(name, epoch))
+            finally:
+                self._waiting[name] -= 1
+            if name != self._active:
+                if name != "default" and name not in self._loaded:
+                    self._load(name)
+                self.model.set_adapter(name)
+                self._active = name
+                self._epoch += 1
+                self._cond.notify_all()
+            self._users += 1
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                self._evict()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._users -= 1
+                self._cond.notify_all()
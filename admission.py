@@ -0,0 +1,192 @@
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from config_log import get_logger
+logger = get_logger(__name__)
+
+# Mức ưu tiên: số nhỏ hơn được phục vụ trước
+PRIORITIES = {"interactive": 0, "bulk": 1}
+
+
+class Overloaded(Exception):
+    """
+    Raised when the admission queue is full.
+
+    Attributes:
+        retry_after (int): Suggested seconds before retrying.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a request waited in the queue past its deadline.
+
+    Attributes:
+        retry_after (int): Suggested seconds before retrying.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__("Request deadline exceeded while queued")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounded, prioritized admission queue in front of the model.
+
+    At most `max_concurrency` requests run inference at a time and at most `max_queue`
+    wait for a slot. Waiting requests are served by priority, then arrival order, and
+    give up when their deadline passes. HTTP handlers wait with `acquire_async`, which
+    holds no thread while queued; background jobs wait with the blocking `acquire`.
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_queue: int = 64, timeout: float = 30.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self.running = 0
+        self._waiting = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        # Thời gian phục vụ trung bình (EMA, giây), dùng để ước lượng Retry-After
+        self._service_time = 1.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiting)
+
+    def retry_after(self) -> int:
+        """
+        Estimates how long until a new request could be admitted.
+        returns:
+            int: Seconds, at least 1.
+        """
+        waves = (len(self._waiting) + 1) / self.max_concurrency
+        return max(1, math.ceil(waves * self._service_time))
+
+    def acquire(self, priority: str = "interactive", deadline: float = None) -> float:
+        """
+        Waits for an inference slot.
+        parameters:
+            priority (str): A key of `PRIORITIES`.
+            deadline (float): Absolute `time.monotonic()` deadline; defaults to now + `timeout`.
+        returns:
+            float: The admission time, to be passed to `release`.
+        raises:
+            Overloaded: If the queue is full.
+            DeadlineExceeded: If no slot was granted before the deadline.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + self.timeout
+        with self._cond:
+            if self.running < self.max_concurrency and not self._waiting:
+                self.running += 1
+                return time.monotonic()
+            if len(self._waiting) >= self.max_queue:
+                logger.warning("Rejecting request: %d requests queued.", len(self._waiting))
+                raise Overloaded(self.retry_after())
+
+            # [ưu tiên, thứ tự đến, đã được cấp slot, hàm đánh thức (None: chờ trên _cond)]
+            entry = [PRIORITIES.get(priority, PRIORITIES["bulk"]), next(self._counter), False, None]
+            heapq.heappush(self._waiting, entry)
+            while not entry[2]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    logger.warning("Request deadline exceeded after queueing.")
+                    raise DeadlineExceeded(self.retry_after())
+                self._cond.wait(remaining)
+            return time.monotonic()
+
+    async def acquire_async(self, priority: str = "interactive", deadline: float = None) -> float:
+        """
+        Waits for an inference slot without blocking a thread.
+        parameters:
+            priority (str): A key of `PRIORITIES`.
+            deadline (float): Absolute `time.monotonic()` deadline; defaults to now + `timeout`.
+        returns:
+            float: The admission time, to be passed to `release`.
+        raises:
+            Overloaded: If the queue is full.
+            DeadlineExceeded: If no slot was granted before the deadline.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + self.timeout
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: waiter.done() or waiter.set_result(None))
+
+        with self._cond:
+            if self.running < self.max_concurrency and not self._waiting:
+                self.running += 1
+                return time.monotonic()
+            if len(self._waiting) >= self.max_queue:
+                logger.warning("Rejecting request: %d requests queued.", len(self._waiting))
+                raise Overloaded(self.retry_after())
+            entry = [PRIORITIES.get(priority, PRIORITIES["bulk"]), next(self._counter), False, wake]
+            heapq.heappush(self._waiting, entry)
+        try:
+            await asyncio.wait_for(waiter, max(0.0, deadline - time.monotonic()))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._cond:
+                granted = entry[2]
+                if not granted:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+            if granted:
+                if isinstance(e, asyncio.TimeoutError):
+                    # Slot được cấp đúng lúc hết hạn: dùng luôn
+                    return time.monotonic()
+                # Request bị hủy (client ngắt kết nối) sau khi đã được cấp slot: chuyển slot cho request khác
+                self._hand_over()
+                raise
+            if isinstance(e, asyncio.TimeoutError):
+                logger.warning("Request deadline exceeded after queueing.")
+                raise DeadlineExceeded(self.retry_after())
+            raise
+        return time.monotonic()
+
+    def release(self, admitted_at: float):
+        """
+        Frees the slot taken by `acquire` and hands it to the next waiting request.
+        parameters:
+            admitted_at (float): The value returned by `acquire`.
+        """
+        with self._cond:
+            self._service_time = 0.9 * self._service_time + 0.1 * (time.monotonic() - admitted_at)
+            self._hand_over()
+
+    def _hand_over(self):
+        with self._cond:
+            if self._waiting:
+                # Chuyển thẳng slot cho request ưu tiên cao nhất, không giảm `running`
+                entry = heapq.heappop(self._waiting)
+                entry[2] = True
+                if entry[3] is not None:
+                    entry[3]()
+                self._cond.notify_all()
+            else:
+                self.running -= 1
+
+    @contextmanager
+    def slot(self, priority: str = "interactive", deadline: float = None):
+        """
+        Context manager around `acquire`/`release`.
+        """
+        admitted_at = self.acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self.release(admitted_at)
@@ -0,0 +1,173 @@
+"""
+Inference backends for Summarimer.
+
+- "peft": the base model wrapped with the LoRA adapter in fp32 (reference path).
+- "int8": LoRA weights merged into the base model, Linear layers dynamically quantized to int8 (CPU).
+- "onnx": the merged model exported to ONNX Runtime (needs `optimum[onnxruntime]`).
+
+Parity against the fp32 PEFT path can be checked with:
+
+    python backends.py --backend int8 --input samples.jsonl
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from difflib import SequenceMatcher
+
+import torch
+from peft import PeftModel
+
+from config_log import get_logger
+logger = get_logger(__name__)
+
+BACKENDS = ("peft", "int8", "onnx")
+# Thư mục gốc mặc định của các đồ thị ONNX đã xuất, mỗi mô hình một thư mục con
+ONNX_CACHE_DIR = os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "summarimer", "onnx")
+
+
+def _fingerprint(name: str):
+    # Mô hình lưu cục bộ có thể được huấn luyện lại tại chỗ: tính cả kích thước và thời điểm sửa của file
+    if name and os.path.isdir(name):
+        return sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+                      for entry in os.scandir(name) if entry.is_file())
+    return name
+
+
+def model_manifest(base_model, adapter: str) -> dict:
+    """
+    Describes the weights an ONNX export is built from.
+    parameters:
+        base_model: The loaded base seq2seq model.
+        adapter (str): The PEFT adapter name or path, or None for a merged snapshot.
+    returns:
+        dict: The base model and adapter names with the fingerprints of local weight directories.
+    """
+    base = getattr(base_model, "name_or_path", None) or base_model.config._name_or_path
+    return {"base_model": base, "adapter": adapter, "files": [_fingerprint(base), _fingerprint(adapter)]}
+
+
+def manifest_digest(manifest: dict) -> str:
+    """
+    Returns a short hash of `manifest`, which changes whenever the local weights change.
+    """
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def onnx_export_dir(root: str, manifest: dict) -> str:
+    """
+    Returns the directory of the ONNX export of `manifest` under `root`, keyed on its hash.
+    """
+    return os.path.join(root or ONNX_CACHE_DIR, manifest_digest(manifest))
+
+
+def build_model(base_model, adapter: str, backend: str, device: str, onnx_dir: str = None):
+    """
+    Builds the generation model for the selected backend.
+    parameters:
+        base_model: The loaded base seq2seq model.
+        adapter (str): The PEFT adapter name or path, or None for a merged snapshot (see bake.py).
+        backend (str): One of `BACKENDS`.
+        device (str): The torch device.
+        onnx_dir (str): The root under which exported ONNX graphs are stored and reused, one
+            directory per model identity; defaults to `ONNX_CACHE_DIR`.
+    returns:
+        The model used for `generate`.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    # Snapshot đã gộp sẵn adapter thì không cần bọc PeftModel
+    model = PeftModel.from_pretrained(base_model, adapter) if adapter else base_model
+    if backend == "peft":
+        return model.to(device).eval()
+
+    if device != "cpu":
+        raise ValueError(f"The {backend} backend only runs on CPU")
+    merged = (model.merge_and_unload() if adapter else model).eval()
+    if backend == "int8":
+        return torch.ao.quantization.quantize_dynamic(merged, {torch.nn.Linear}, dtype=torch.qint8)
+
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError as e:
+        raise ImportError("The onnx backend requires `pip install optimum[onnxruntime]`") from e
+    manifest = model_manifest(base_model, adapter)
+    export_dir = onnx_export_dir(onnx_dir, manifest)
+    manifest_path = os.path.join(export_dir, "summarimer_manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            # So lại manifest: chỉ dùng đồ thị được xuất từ đúng mô hình này
+            if json.load(f) == json.loads(json.dumps(manifest)):
+                logger.info("Reusing ONNX graph from %s", export_dir)
+                return ORTModelForSeq2SeqLM.from_pretrained(export_dir)
+        logger.warning("ONNX graph in %s was exported from another model, exporting again.", export_dir)
+    # Xuất đồ thị ONNX một lần, các lần khởi động sau dùng lại
+    merged_dir = os.path.join(export_dir, "merged")
+    merged.save_pretrained(merged_dir)
+    model = ORTModelForSeq2SeqLM.from_pretrained(merged_dir, export=True)
+    model.save_pretrained(export_dir)
+    # Manifest ghi sau cùng: lần xuất bị ngắt giữa chừng sẽ được làm lại
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    logger.info("Exported ONNX graph to %s", export_dir)
+    return model
+
+
+def check_parity(reference, candidate, texts: list) -> dict:
+    """
+    Compares the summaries of two Summarimer instances on the same texts.
+    parameters:
+        reference (Summarimer): The fp32 PEFT summarizer, with deterministic decoding.
+        candidate (Summarimer): The summarizer under test, with deterministic decoding.
+        texts (list): The texts to summarize.
+    returns:
+        dict: Exact-match rate, mean token overlap and mean latency of both.
+    """
+    exact, overlap = 0, 0.0
+    latency = {"reference": 0.0, "candidate": 0.0}
+    for text in texts:
+        start = time.perf_counter()
+        expected = reference.summarize(text)
+        latency["reference"] += time.perf_counter() - start
+        start = time.perf_counter()
+        actual = candidate.summarize(text)
+        latency["candidate"] += time.perf_counter() - start
+
+        exact += expected == actual
+        overlap += SequenceMatcher(None, expected.split(), actual.split()).ratio()
+    n = max(len(texts), 1)
+    return {
+        "samples": len(texts),
+        "exact_match": exact / n,
+        "token_overlap": overlap / n,
+        "reference_latency_s": latency["reference"] / n,
+        "candidate_latency_s": latency["candidate"] / n,
+    }
+
+
+def main():
+    from dotenv import load_dotenv
+    from summarimer import Summarimer
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Check a backend against the fp32 PEFT path.")
+    parser.add_argument("--backend", choices=BACKENDS, required=True)
+    parser.add_argument("--input", required=True, help="JSONL file with a 'message' field per line")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    texts = []
+    with open(args.input, encoding="utf-8") as f:
+        for line in f:
+            if line.strip() and len(texts) < args.limit:
+                texts.append(json.loads(line)["message"])
+
+    base_model, peft_model = os.getenv("BASE_MODEL"), os.getenv("PEFT_MODEL")
+    reference = Summarimer(base_model, peft_model, device="cpu", deterministic=True)
+    candidate = Summarimer(base_model, peft_model, device="cpu", deterministic=True, backend=args.backend)
+    print(json.dumps(check_parity(reference, candidate, texts), indent=2))
+
+
+if __name__ == "__main__":
+    main()
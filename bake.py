@@ -0,0 +1,51 @@
+"""
+One-time "bake" step: merges the LoRA adapter into the base weights and writes a single
+safetensors snapshot plus the tokenizer.
+
+    python bake.py --output ./merged-model
+
+Point MERGED_MODEL at the output directory and the server loads it with mmap-backed weight
+loading, skipping the base model + PEFT wrapping at startup.
+"""
+import argparse
+import os
+import time
+
+from dotenv import load_dotenv
+from peft import PeftModel
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+from config_log import get_logger
+logger = get_logger(__name__)
+
+
+def bake(base_model: str, peft_model: str, output: str):
+    """
+    Merges the adapter into the base model and saves the snapshot.
+    parameters:
+        base_model (str): The base model name or path.
+        peft_model (str): The PEFT adapter name or path.
+        output (str): The snapshot directory.
+    """
+    start = time.perf_counter()
+    base = AutoModelForSeq2SeqLM.from_pretrained(base_model)
+    merged = PeftModel.from_pretrained(base, peft_model).merge_and_unload()
+    # Một file safetensors duy nhất để nạp bằng mmap khi khởi động
+    merged.save_pretrained(output, safe_serialization=True, max_shard_size="100GB")
+    AutoTokenizer.from_pretrained(peft_model).save_pretrained(output)
+    logger.info("Baked %s + %s into %s in %.2fs", base_model, peft_model, output, time.perf_counter() - start)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Merge the LoRA adapter into a safetensors snapshot.")
+    parser.add_argument("--base-model", default=os.getenv("BASE_MODEL"))
+    parser.add_argument("--peft-model", default=os.getenv("PEFT_MODEL"))
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+    bake(args.base_model, args.peft_model, args.output)
+    print(f"Snapshot written to {args.output}, set MERGED_MODEL={args.output} to use it.")
+
+
+if __name__ == "__main__":
+    main()
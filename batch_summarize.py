@@ -0,0 +1,189 @@
+"""
+Offline, resumable batch summarization over a JSONL corpus.
+
+Each input line is a JSON object with an id and a text field. Results are appended to the
+output JSONL file as `{"id": ..., "summary": ...}` or `{"id": ..., "error": ...}`, and a
+checkpoint next to it records how far the input has been fully processed, so a killed run
+picks up where it stopped:
+
+    python batch_summarize.py --input archive.jsonl --output summaries.jsonl --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+
+import torch
+from dotenv import load_dotenv
+
+from bulk import bucket_by_length, summarize_bucket
+from config_log import get_logger, use_process_log_file
+logger = get_logger(__name__)
+
+# Summarimer riêng của từng worker process
+_worker_summarizer = None
+
+
+def _init_worker(base_model: str, peft_model: str, threads: int, chunk_batch_size: int, deterministic: bool,
+                 backend: str):
+    global _worker_summarizer
+    # Process spawn không chạy register_at_fork: chuyển sang file log riêng trước khi ghi log
+    use_process_log_file()
+    from summarimer import Summarimer
+
+    # Chia đều số core cho các worker để tránh tranh chấp thread của torch
+    torch.set_num_threads(threads)
+    _worker_summarizer = Summarimer(
+        base_model=base_model,
+        mmodel_name=peft_model,
+        device="cpu",
+        chunk_batch_size=chunk_batch_size,
+        deterministic=deterministic,
+        backend=backend,
+    )
+
+
+def _run_bucket(bucket: list) -> list:
+    return summarize_bucket(_worker_summarizer, bucket)
+
+
+def _encode_line(record: dict) -> bytes:
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def read_windows(path: str, offset: int, window: int, id_field: str, text_field: str):
+    """
+    Streams the input file in windows of items without loading it all into memory.
+    parameters:
+        path (str): The JSONL input.
+        offset (int): Byte offset to start reading from.
+        window (int): The number of lines per window.
+    yields:
+        tuple: `(items, end_offset)` - the parsed items and the byte offset after the window.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        items = []
+        while True:
+            line_start = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                    item_id = record.get(id_field, f"offset:{line_start}")
+                    if isinstance(record.get(text_field), str):
+                        items.append({"id": item_id, "message": record[text_field]})
+                    else:
+                        items.append({"id": item_id, "error": f"Missing '{text_field}' string"})
+                except (json.JSONDecodeError, AttributeError) as e:
+                    items.append({"id": f"offset:{line_start}", "error": f"Invalid JSON: {e}"})
+            if len(items) >= window:
+                yield items, f.tell()
+                items = []
+        if items:
+            yield items, f.tell()
+
+
+def load_checkpoint(output: str) -> dict:
+    checkpoint_path = output + ".ckpt"
+    if not os.path.exists(checkpoint_path):
+        return {"input_offset": 0, "output_offset": 0, "done": 0}
+    with open(checkpoint_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(output: str, checkpoint: dict):
+    # Ghi ra file tạm rồi đổi tên để checkpoint không bao giờ bị ghi dở
+    tmp_path = output + ".ckpt.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, output + ".ckpt")
+
+
+def recover_output(output: str, checkpoint: dict) -> set:
+    """
+    Prepares the output file for appending after a crash.
+    parameters:
+        output (str): The output JSONL path.
+        checkpoint (dict): The last saved checkpoint.
+    returns:
+        set: Ids already written after the checkpoint (from a partially finished window).
+    """
+    if not os.path.exists(output):
+        return set()
+    done = set()
+    with open(output, "rb+") as f:
+        f.seek(checkpoint["output_offset"])
+        valid_end = f.tell()
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                done.add(json.loads(line)["id"])
+            except (json.JSONDecodeError, KeyError):
+                break
+            valid_end += len(line)
+        # Bỏ dòng cuối ghi dở khi tiến trình bị dừng đột ngột
+        f.truncate(valid_end)
+    return done
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Summarize a JSONL corpus with Summarimer.")
+    parser.add_argument("--input", required=True, help="JSONL file with one article per line")
+    parser.add_argument("--output", required=True, help="JSONL file the results are appended to")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--text-field", default="message")
+    parser.add_argument("--base-model", default=os.getenv("BASE_MODEL"))
+    parser.add_argument("--peft-model", default=os.getenv("PEFT_MODEL"))
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--batch-size", type=int, default=8, help="Articles per generate call")
+    parser.add_argument("--window", type=int, default=512,
+                        help="Articles read ahead and sorted by length; a checkpoint is written after each window")
+    parser.add_argument("--backend", default=os.getenv("INFERENCE_BACKEND", "peft"), help="peft, int8 or onnx")
+    parser.add_argument("--deterministic", action="store_true", help="Use greedy decoding")
+    args = parser.parse_args()
+
+    checkpoint = load_checkpoint(args.output)
+    already_done = recover_output(args.output, checkpoint)
+    if checkpoint["input_offset"]:
+        logger.info("Resuming at input byte %d, %d articles done.", checkpoint['input_offset'], checkpoint['done'])
+
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(
+        processes=args.workers,
+        initializer=_init_worker,
+        initargs=(args.base_model, args.peft_model, threads, args.batch_size, args.deterministic,
+                  args.backend),
+    ) as pool, open(args.output, "ab") as out:
+        for items, end_offset in read_windows(args.input, checkpoint["input_offset"], args.window,
+                                              args.id_field, args.text_field):
+            pending = [item for item in items if item["id"] not in already_done]
+            for item in pending:
+                if "error" in item:
+                    out.write(_encode_line(item))
+            valid = [item for item in pending if "message" in item]
+            for results in pool.imap_unordered(_run_bucket, bucket_by_length(valid, args.batch_size)):
+                for result in results:
+                    out.write(_encode_line(result))
+                out.flush()
+
+            out.flush()
+            os.fsync(out.fileno())
+            already_done.clear()
+            checkpoint = {
+                "input_offset": end_offset,
+                "output_offset": out.tell(),
+                "done": checkpoint["done"] + len(items),
+            }
+            save_checkpoint(args.output, checkpoint)
+            logger.info("Checkpoint: %d articles done.", checkpoint['done'])
+    print(f"Done: {checkpoint['done']} articles summarized into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from config_log import get_logger
+logger = get_logger(__name__)
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent summarization requests for a short window and runs them
+    through `Summarimer.summarize_batch` as one batched generate call.
+
+    Each caller gets a `Future` holding its own summary. A batch is flushed as soon
+    as it reaches `max_batch_size` or when `max_wait_ms` has passed since its first
+    request arrived, so the extra latency added by batching is bounded by `max_wait_ms`.
+    Up to `max_concurrent_batches` batches run at once (one per inference worker).
+    """
+
+    def __init__(self, summarizer, max_batch_size: int = 8, max_wait_ms: float = 10.0,
+                 max_concurrent_batches: int = 1):
+        self.summarizer = summarizer
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        self._start()
+        # Thread nền không còn sau fork (chế độ prefork): khởi động lại trong process con
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._queue = queue.Queue()
+        # Các batch chạy song song trên executor; semaphore giữ batch tiếp theo gom thêm request
+        # cho tới khi có chỗ thay vì xếp hàng nhiều batch nhỏ
+        self._slots = threading.Semaphore(self.max_concurrent_batches)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent_batches, thread_name_prefix="micro-batch") \
+            if self.max_concurrent_batches > 1 else None
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str, max_cap: int = 512, ratio: float = 0.7, adapter: str = None,
+               long_mode: str = None, encoding=None) -> Future:
+        """
+        Queues a text for summarization.
+
+        Args:
+            text (str): The text to summarize.
+            adapter (str): The named LoRA adapter, None for the default one.
+            long_mode (str): The long-document mode, None for the default one.
+            encoding (chunker.Encoding): The output of `Summarimer.encode` for `text`, if already computed.
+
+        Returns:
+            Future: Resolves to the summarized text.
+        """
+        future = Future()
+        self._queue.put((text, max_cap, ratio, adapter, long_mode, encoding, future))
+        return future
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Chỉ gộp các request có cùng tham số sinh, cùng adapter và cùng chế độ văn bản dài
+            groups = {}
+            for text, max_cap, ratio, adapter, long_mode, encoding, future in batch:
+                if future.set_running_or_notify_cancel():
+                    groups.setdefault((max_cap, ratio, adapter, long_mode), []).append((text, encoding, future))
+
+            for params, items in groups.items():
+                if self._executor is None:
+                    self._dispatch(params, items)
+                    continue
+                self._slots.acquire()
+                self._executor.submit(self._dispatch, params, items, release=True)
+
+    def _dispatch(self, params: tuple, items: list, release: bool = False):
+        max_cap, ratio, adapter, long_mode = params
+        logger.info("Dispatching micro-batch of %d requests (adapter %s).", len(items), adapter or "default")
+        try:
+            summaries = self.summarizer.summarize_batch(
+                [text for text, _, _ in items], max_cap=max_cap, ratio=ratio, adapter=adapter, long_mode=long_mode,
+                encodings=[encoding for _, encoding, _ in items],
+            )
+        except Exception as e:
+            logger.error("Batched summarization failed: %s", e)
+            for _, _, future in items:
+                future.set_exception(e)
+            return
+        finally:
+            if release:
+                self._slots.release()
+        for (_, _, future), summary in zip(items, summaries):
+            future.set_result(summary)
@@ -0,0 +1,293 @@
+"""
+Reproducible latency/throughput benchmark for Summarimer and the HTTP API.
+
+Runs against a small local seq2seq model (loaded like a merged snapshot, no adapter) on
+synthetic Vietnamese articles in the three routing bands of `summarize`, and writes
+machine-readable JSON:
+
+    python benchmark.py --model ./tiny-t5 --output bench.json
+    python benchmark.py --model ./tiny-t5 --baseline bench.json --threshold 0.15
+
+The HTTP part drives the FastAPI app in-process with `TestClient` (needs `httpx`).
+With `--layouts 1x32,2x16,4x8`, the medium band and the HTTP API are also run with each
+layout of pinned inference workers (see workers.py), and the layouts with the highest
+throughput and the lowest latency are reported.
+With `--compile-buckets 256,512,1024`, the short and medium bands are run again in the
+compiled, shape-bucketed mode with a static KV cache (see compiled.py). Every summarize
+latency comes with the minor page faults per call, a proxy for allocator churn on CPU.
+With `--baseline`, the run exits with status 1 if any metric regressed by more than the
+threshold (latencies higher, throughputs lower).
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+import preprocess
+from summarimer import Summarimer, MIN_SUMMARY_TOKENS, MAX_INPUT_TOKENS
+from compiled import parse_buckets
+from workers import WorkerPool, parse_layout
+
+# Âm tiết tiếng Việt thường gặp để sinh văn bản giả lập
+SYLLABLES = (
+    "người dân thành phố kinh tế xã hội phát triển chính phủ cho biết trong năm nay đã được "
+    "các doanh nghiệp đầu tư công trình giao thông giáo dục y tế sức khỏe thị trường giá cả "
+    "tăng giảm theo báo cáo hội nghị tổ chức triển khai nhiệm vụ trọng tâm vốn ngân sách "
+    "chuyên gia nhận định khu vực quốc tế Việt Nam Hà Nội hồ chí minh cơ quan chức năng"
+).split()
+
+# Số token mục tiêu cho ba nhánh định tuyến: < 100, 100-1024, > 1024
+BANDS = {
+    "short": MIN_SUMMARY_TOKENS // 2,
+    "medium": (MIN_SUMMARY_TOKENS + MAX_INPUT_TOKENS) // 2,
+    "long": MAX_INPUT_TOKENS * 2,
+}
+
+
+def synthetic_article(tokenizer, target_tokens: int, rng: random.Random) -> str:
+    """
+    Builds a Vietnamese-looking article of roughly `target_tokens` tokens.
+    """
+    sentences, length = [], 0
+    while length < target_tokens:
+        words = [rng.choice(SYLLABLES) for _ in range(rng.randint(12, 24))]
+        sentence = " ".join(words).capitalize() + rng.choice([".", ".", ".", "?", "!"])
+        sentences.append(sentence)
+        length += len(tokenizer(sentence, add_special_tokens=False)["input_ids"])
+    return " ".join(sentences)
+
+
+def with_boilerplate(text: str) -> str:
+    """
+    Wraps an article the way it arrives when pasted from a news site: NFD diacritics, HTML,
+    doubled spaces, a photo caption, a related-article block and a byline.
+    """
+    paragraphs = "".join(f"<p>{sentence}.</p>\n" for sentence in text.split(". "))
+    return unicodedata.normalize("NFD", (
+        f"<div class=\"article\">\n<figure><img src=\"a.jpg\"><figcaption>Người dân đi làm sáng nay. "
+        f"Ảnh: Ngọc Thành</figcaption></figure>\n{paragraphs.replace(' ', '  ')}"
+        "Xem thêm:\nGiá vàng hôm nay tăng mạnh\nTỷ giá USD biến động\n\n"
+        "<p>(Theo TTXVN)</p></div>"
+    ))
+
+
+def bench_preprocess(summarizer, text: str, iterations: int) -> dict:
+    raw = with_boilerplate(text)
+    latencies = []
+    normalize_latencies = []
+    for _ in range(iterations * 10):
+        start = time.perf_counter()
+        normalized = preprocess.normalize(raw)
+        normalize_latencies.append(time.perf_counter() - start)
+        # Toàn bộ chi phí mỗi request, kể cả metrics và log của Summarimer.preprocess
+        start = time.perf_counter()
+        summarizer.preprocess(raw)
+        latencies.append(time.perf_counter() - start)
+    count = lambda t: len(summarizer.tokenizer(t, add_special_tokens=False)["input_ids"])
+    return {"latency_s": percentiles(latencies), "normalize_latency_s": percentiles(normalize_latencies),
+            "tokens_saved": count(raw) - count(normalized)}
+
+
+def percentiles(samples: list) -> dict:
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "mean": statistics.fmean(ordered)}
+
+
+def bench_summarize(summarizer, text: str, iterations: int, **kwargs) -> dict:
+    latencies, faults = [], []
+    for _ in range(iterations):
+        minflt = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+        start = time.perf_counter()
+        summarizer.summarize(text, **kwargs)
+        latencies.append(time.perf_counter() - start)
+        faults.append(resource.getrusage(resource.RUSAGE_SELF).ru_minflt - minflt)
+    return {"latency_s": percentiles(latencies), "minor_faults": percentiles(faults)}
+
+
+def bench_stream(summarizer, text: str, iterations: int) -> dict:
+    ttfts, rates = [], []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        first, parts = None, []
+        for part in summarizer.summarize_stream(text):
+            if first is None:
+                first = time.perf_counter() - start
+            parts.append(part)
+        elapsed = time.perf_counter() - start
+        tokens = len(summarizer.tokenizer("".join(parts), add_special_tokens=False)["input_ids"])
+        ttfts.append(first if first is not None else elapsed)
+        rates.append(tokens / elapsed if elapsed else 0.0)
+    return {"ttft_s": percentiles(ttfts), "tokens_per_s": percentiles(rates)}
+
+
+def bench_http(summarizer, texts: list, concurrency_levels: list, requests_per_level: int) -> dict:
+    from fastapi.testclient import TestClient
+    from batcher import MicroBatcher
+    import server
+
+    # Dùng mô hình benchmark thay vì nạp mô hình từ .env (không chạy lifespan)
+    server.summarizer = summarizer
+    server.batcher = MicroBatcher(summarizer, max_batch_size=server.BATCH_MAX_SIZE, max_wait_ms=server.BATCH_MAX_WAIT_MS,
+                                  max_concurrent_batches=len(summarizer.workers.workers) if summarizer.workers is not None else 1)
+    server.incremental = None
+    server.state["status"] = "ready"
+    client = TestClient(server.app)
+
+    results = {}
+    for concurrency in concurrency_levels:
+        def call(i):
+            start = time.perf_counter()
+            response = client.post("/summary", json={"thread_id": f"bench-{i}", "message": texts[i % len(texts)]})
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(call, range(requests_per_level)))
+        elapsed = time.perf_counter() - start
+        results[str(concurrency)] = {"articles_per_s": requests_per_level / elapsed, "latency_s": percentiles(latencies)}
+    return results
+
+
+def bench_layouts(summarizer, text: str, layouts: list, concurrency_levels: list, iterations: int,
+                  requests_per_level: int) -> dict:
+    """
+    Runs the medium band and the HTTP API once per worker layout.
+    """
+    results = {}
+    for layout in layouts:
+        summarizer.workers = WorkerPool(parse_layout(layout))
+        try:
+            results[layout] = {
+                "summarize": bench_summarize(summarizer, text, iterations),
+                "http": bench_http(summarizer, [text], concurrency_levels, requests_per_level),
+            }
+        finally:
+            summarizer.workers.close()
+            summarizer.workers = None
+    return results
+
+
+def best_layouts(results: dict) -> dict:
+    """
+    Picks the layout with the highest throughput and the one with the lowest single-request latency.
+    """
+    top = str(max(int(level) for level in next(iter(results.values()))["http"]))
+    return {
+        "throughput": max(results, key=lambda layout: results[layout]["http"][top]["articles_per_s"]),
+        "latency": min(results, key=lambda layout: results[layout]["summarize"]["latency_s"]["p50"]),
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Lists the metrics that regressed by more than `threshold` against the baseline.
+    """
+    current, previous = flatten(results["metrics"]), flatten(baseline["metrics"])
+    regressions = []
+    for name, old in previous.items():
+        new = current.get(name)
+        if new is None or not old:
+            continue
+        higher_is_better = "per_s" in name or name.endswith("_rate") or name.endswith("_saved")
+        change = (old - new) / old if higher_is_better else (new - old) / old
+        if change > threshold:
+            regressions.append(f"{name}: {old:.4f} -> {new:.4f} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Summarimer and the HTTP API.")
+    parser.add_argument("--model", default=os.getenv("BENCH_MODEL"), help="Small local seq2seq model path")
+    parser.add_argument("--draft", help="Small seq2seq draft model for assisted decoding")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--concurrency", default="1,4,8", help="Comma-separated HTTP concurrency levels")
+    parser.add_argument("--http-requests", type=int, default=32, help="Requests per concurrency level")
+    parser.add_argument("--compile-buckets", help="Input length buckets for the compiled mode, e.g. 256,512,1024")
+    parser.add_argument("--layouts", help="Comma-separated worker layouts to compare, e.g. 1x32,2x16,4x8")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative regression")
+    args = parser.parse_args()
+    if not args.model:
+        parser.error("--model (or BENCH_MODEL) is required")
+
+    torch.manual_seed(args.seed)
+    rng = random.Random(args.seed)
+    summarizer = Summarimer(args.model, None, device="cpu", deterministic=True, draft_model=args.draft,
+                            compile_buckets=parse_buckets(args.compile_buckets))
+    texts = {band: synthetic_article(summarizer.tokenizer, tokens, rng) for band, tokens in BANDS.items()}
+    # Các phép đo chính chạy eager; chế độ compile được đo riêng ở cuối
+    compiled, summarizer.compiled = summarizer.compiled, None
+
+    metrics = {"summarize": {}, "stream": {}}
+    for band, text in texts.items():
+        metrics["summarize"][band] = bench_summarize(summarizer, text, args.iterations)
+        metrics["stream"][band] = bench_stream(summarizer, text, args.iterations)
+    # Bài dài gấp đôi và gấp bốn cửa sổ mô hình ở chế độ extractive: latency gần như không đổi
+    for scale in (2, 4):
+        text = texts["long"] if scale == 2 else synthetic_article(summarizer.tokenizer, MAX_INPUT_TOKENS * scale, rng)
+        metrics["summarize"][f"long_x{scale}_extractive"] = bench_summarize(summarizer, text, args.iterations, long_mode="extractive")
+    levels = [int(level) for level in args.concurrency.split(",")]
+    metrics["preprocess"] = {band: bench_preprocess(summarizer, text, args.iterations) for band, text in texts.items()}
+    metrics["http"] = bench_http(summarizer, [texts["medium"]], levels, args.http_requests)
+    if summarizer.draft is not None:
+        metrics["draft_acceptance_rate"] = summarizer.draft_acceptance_rate()
+    if compiled is not None:
+        summarizer.compiled = compiled
+        summarizer.warmup([texts["medium"], texts["short"]])
+        metrics["compiled"] = {band: bench_summarize(summarizer, texts[band], args.iterations) for band in ("short", "medium")}
+    if args.layouts:
+        metrics["layouts"] = bench_layouts(summarizer, texts["medium"], args.layouts.split(","), levels,
+                                           args.iterations, args.http_requests)
+
+    results = {
+        "model": args.model,
+        "torch_threads": torch.get_num_threads(),
+        "iterations": args.iterations,
+        "seed": args.seed,
+        "draft": args.draft,
+        "compile_buckets": args.compile_buckets,
+        "best_layouts": best_layouts(metrics["layouts"]) if args.layouts else None,
+        "metrics": metrics,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("Regressions:\n" + "\n".join(regressions), file=sys.stderr)
+            sys.exit(1)
+        print("No regressions against baseline.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import json
+
+from config_log import get_logger
+logger = get_logger(__name__)
+
+
+def parse_items(body: str) -> list:
+    """
+    Parses a bulk request body.
+    parameters:
+        body (str): A JSON array or NDJSON of `{"id": ..., "message": ..., "adapter": ...}` objects,
+            `adapter` being optional.
+    returns:
+        list: Dicts with `id` and either `message` (and `adapter`) or `error` (for lines that could not be parsed).
+    """
+    body = body.strip()
+    items = []
+    if body.startswith('['):
+        try:
+            records = json.loads(body)
+        except json.JSONDecodeError as e:
+            return [{"id": None, "error": f"Invalid JSON array: {e}"}]
+    else:
+        records = []
+        for line_no, line in enumerate(body.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                items.append({"id": f"line:{line_no}", "error": f"Invalid JSON: {e}"})
+
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            items.append({"id": f"index:{i}", "error": "Item must be an object"})
+        elif not isinstance(record.get("message"), str):
+            items.append({"id": record.get("id", f"index:{i}"), "error": "Missing 'message' string"})
+        elif record.get("adapter") is not None and not isinstance(record["adapter"], str):
+            items.append({"id": record.get("id", f"index:{i}"), "error": "'adapter' must be a string"})
+        else:
+            items.append({"id": record.get("id", f"index:{i}"), "message": record["message"],
+                          "adapter": record.get("adapter")})
+    return items
+
+
+def bucket_by_length(items: list, bucket_size: int) -> list:
+    """
+    Groups items of the same adapter and similar length so that batched generation wastes little padding.
+    parameters:
+        items (list): Dicts with a `message` field and an optional `adapter`.
+        bucket_size (int): The maximum number of items per bucket.
+    returns:
+        list: A list of buckets, each for a single adapter, shortest messages first.
+    """
+    groups = {}
+    for item in items:
+        groups.setdefault(item.get("adapter"), []).append(item)
+    buckets = []
+    for group in groups.values():
+        ordered = sorted(group, key=lambda item: len(item["message"]))
+        buckets.extend(ordered[i:i + bucket_size] for i in range(0, len(ordered), bucket_size))
+    return buckets
+
+
+def summarize_bucket(summarizer, bucket: list) -> list:
+    """
+    Summarizes a bucket in one batched call, isolating per-item failures.
+    parameters:
+        summarizer (Summarimer): The summarizer.
+        bucket (list): Dicts with `id`, `message` and `adapter`, all for the same adapter.
+    returns:
+        list: Result dicts with `id` and either `summary` or `error`.
+    """
+    try:
+        summaries = summarizer.summarize_batch([item["message"] for item in bucket], adapter=bucket[0].get("adapter"))
+        return [{"id": item["id"], "summary": summary} for item, summary in zip(bucket, summaries)]
+    except Exception as e:
+        if len(bucket) == 1:
+            logger.error("Bulk item %s failed: %s", bucket[0]['id'], e)
+            return [{"id": bucket[0]["id"], "error": str(e)}]
+    # Batch lỗi: chạy lại từng item để chỉ item lỗi bị đánh dấu
+    results = []
+    for item in bucket:
+        results.extend(summarize_bucket(summarizer, [item]))
+    return results
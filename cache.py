@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from config_log import get_logger
+logger = get_logger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes the text so that trivially different copies share one cache entry.
+    parameters:
+        text (str): The text to normalize.
+    returns:
+        str: The NFC-normalized text with collapsed whitespace.
+    """
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFC', text)).strip()
+
+
+def make_key(text: str, model_id: str, params: dict) -> str:
+    """
+    Builds a content-addressed cache key.
+    parameters:
+        text (str): The input text.
+        model_id (str): The model/adapter identity.
+        params (dict): The generation parameters that affect the output.
+    returns:
+        str: A sha256 hex digest.
+    """
+    payload = json.dumps([model_id, params], sort_keys=True, ensure_ascii=False)
+    digest = hashlib.sha256(payload.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(normalize_text(text).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class SummaryCache:
+    """
+    A bounded in-memory LRU of summaries with an optional SQLite tier that survives restarts.
+
+    Attributes:
+        hits (int): Lookups answered from memory or disk.
+        misses (int): Lookups that required a generation.
+    """
+
+    def __init__(self, max_entries: int = 1024, path: str = None):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.path = path
+        self._entries = OrderedDict()
+        self._connect()
+        if path:
+            logger.info("Summary cache persisted to %s", path)
+        # Kết nối SQLite không dùng chung được giữa các process: mở lại sau fork
+        os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        self._lock = threading.Lock()
+        self._db = None
+        if self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, summary TEXT NOT NULL)")
+            self._db.commit()
+
+    def get(self, key: str):
+        """
+        Looks up a summary.
+        parameters:
+            key (str): The key built by `make_key`.
+        returns:
+            str | None: The cached summary, or None on a miss.
+        """
+        with self._lock:
+            summary = self._entries.get(key)
+            if summary is not None:
+                self._entries.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    summary = row[0]
+                    self._remember(key, summary)
+
+            if summary is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return summary
+
+    def put(self, key: str, summary: str):
+        """
+        Stores a summary in memory and, if configured, on disk.
+        parameters:
+            key (str): The key built by `make_key`.
+            summary (str): The summary to store.
+        """
+        with self._lock:
+            self._remember(key, summary)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO summaries (key, summary) VALUES (?, ?)", (key, summary))
+                self._db.commit()
+
+    def _remember(self, key: str, summary: str):
+        self._entries[key] = summary
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters.
+        returns:
+            dict: Entry count, hits, misses and hit rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+class EncoderCache:
+    """
+    A bounded LRU of encoder hidden states per input sequence, so that summarizing the same
+    article (or chunk) again with other decoder settings skips the encoder pass.
+
+    Entries are evicted least recently used first once their total size exceeds `max_bytes`.
+
+    Attributes:
+        hits (int): Sequences whose encoder states were reused.
+        misses (int): Sequences that required an encoder pass.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model_id: str, input_ids: list) -> str:
+        """
+        Builds the key of a sequence from the model identity and its input ids.
+        """
+        digest = hashlib.sha256(model_id.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(array('q', input_ids).tobytes())
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """
+        Looks up the encoder states of a sequence.
+        returns:
+            torch.Tensor | None: The `(length, hidden)` states, or None on a miss.
+        """
+        with self._lock:
+            states = self._entries.get(key)
+            if states is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return states
+
+    def put(self, key: str, states):
+        """
+        Stores the encoder states of a sequence, evicting old entries to stay within `max_bytes`.
+        """
+        size = states.numel() * states.element_size()
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous.numel() * previous.element_size()
+            self._entries[key] = states
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.numel() * evicted.element_size()
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters.
+        returns:
+            dict: Entry count, size in bytes, hits, misses and hit rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
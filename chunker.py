@@ -0,0 +1,125 @@
+import re
+from bisect import bisect_right
+from typing import NamedTuple
+
+# Ranh giới câu tiếng Việt: dấu kết câu (kể cả "…" và "...") có thể kèm dấu đóng
+# ngoặc/ngoặc kép phía sau, hoặc một hay nhiều dấu xuống dòng
+SENTENCE_END = re.compile(r'[.?!…]+["”’»)\]]*(?=\s|$)|\n+')
+
+
+class Encoding(NamedTuple):
+    """
+    A document tokenized once with the real tokenizer.
+
+    Attributes:
+        ids (list): Token ids of the whole document, without special tokens.
+        sentences (list): `(char_start, char_end, tok_start, tok_end)` per sentence.
+    """
+    ids: list
+    sentences: list
+
+
+class Chunk(NamedTuple):
+    """
+    A piece of a document that fits in one encoder pass.
+
+    Attributes:
+        text (str): The chunk text.
+        input_ids (list): Model-ready ids, special tokens included.
+    """
+    text: str
+    input_ids: list
+
+
+def sentence_spans(text: str) -> list:
+    """
+    Splits the text into sentences.
+    parameters:
+        text (str): The text to split.
+    returns:
+        list: `(start, end)` character spans of the non-empty sentences.
+    """
+    spans, start = [], 0
+    for match in SENTENCE_END.finditer(text):
+        end = match.end()
+        if text[start:end].strip():
+            spans.append((start, end))
+        start = end
+    if text[start:].strip():
+        spans.append((start, len(text)))
+    return spans
+
+
+def encode(tokenizer, text: str) -> Encoding:
+    """
+    Tokenizes the document once and maps each sentence to its token range.
+    parameters:
+        tokenizer: The model tokenizer.
+        text (str): The text to encode.
+    returns:
+        Encoding: The token ids and sentence boundaries.
+    """
+    spans = sentence_spans(text)
+    if not spans:
+        return Encoding([], [])
+
+    if tokenizer.is_fast:
+        encoded = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        ids, offsets = encoded["input_ids"], encoded["offset_mapping"]
+        starts = [start for start, _ in spans]
+        # Token thuộc câu chứa vị trí ký tự bắt đầu của nó
+        owners = [max(bisect_right(starts, start) - 1, 0) for start, _ in offsets]
+        sentences, tok_start = [], 0
+        for i, (char_start, char_end) in enumerate(spans):
+            tok_end = tok_start
+            while tok_end < len(owners) and owners[tok_end] <= i:
+                tok_end += 1
+            sentences.append((char_start, char_end, tok_start, tok_end))
+            tok_start = tok_end
+        return Encoding(ids, sentences)
+
+    # Tokenizer chậm không có offset mapping: tokenize từng câu trong một lần gọi
+    encoded = tokenizer([text[start:end] for start, end in spans], add_special_tokens=False)
+    ids, sentences = [], []
+    for (char_start, char_end), sentence_ids in zip(spans, encoded["input_ids"]):
+        sentences.append((char_start, char_end, len(ids), len(ids) + len(sentence_ids)))
+        ids.extend(sentence_ids)
+    return Encoding(ids, sentences)
+
+
+def pack(tokenizer, text: str, encoding: Encoding, max_tokens: int, prefix_ids: list = ()) -> list:
+    """
+    Packs whole sentences into chunks by exact token count.
+    parameters:
+        tokenizer: The model tokenizer.
+        text (str): The encoded text.
+        encoding (Encoding): The output of `encode` for `text`.
+        max_tokens (int): The maximum number of model input tokens per chunk.
+        prefix_ids (list): Task prefix ids prepended to every chunk.
+    returns:
+        list: A list of `Chunk`, in document order.
+    """
+    budget = max_tokens - tokenizer.num_special_tokens_to_add(False) - len(prefix_ids)
+    if budget <= 0:
+        raise ValueError("max_tokens is too small for the model special tokens")
+
+    def make_chunk(chunk_text, tok_start, tok_end):
+        ids = tokenizer.build_inputs_with_special_tokens(encoding.ids[tok_start:tok_end])
+        return Chunk(chunk_text, list(prefix_ids) + ids)
+
+    chunks, group = [], []
+    for sentence in encoding.sentences:
+        char_start, char_end, tok_start, tok_end = sentence
+        if group and tok_end - group[0][2] > budget:
+            chunks.append(make_chunk(text[group[0][0]:group[-1][1]].strip(), group[0][2], group[-1][3]))
+            group = []
+        if tok_end - tok_start > budget:
+            # Câu dài hơn cả một chunk: cắt cứng theo token
+            for start in range(tok_start, tok_end, budget):
+                end = min(start + budget, tok_end)
+                chunks.append(make_chunk(tokenizer.decode(encoding.ids[start:end]).strip(), start, end))
+            continue
+        group.append(sentence)
+    if group:
+        chunks.append(make_chunk(text[group[0][0]:group[-1][1]].strip(), group[0][2], group[-1][3]))
+    return chunks
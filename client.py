@@ -307,6 +307,7 @@ with col1:
             data = {
                 "message": st.session_state.original_text,
                 "thread_id": st.session_state.thread_id,
+                "priority": "interactive",
             }
             
             if st.session_state.use_streaming:
@@ -365,7 +366,8 @@ with col2:
             try:
                 with requests.post(API_STREAM_ENDPOINT, json={
                     "message": st.session_state.original_text,
-                    "thread_id": st.session_state.thread_id
+                    "thread_id": st.session_state.thread_id,
+                    "priority": "interactive",
                 }, headers=HEADERS, stream=True) as response:
                     
                     complete_summary = ""
@@ -0,0 +1,175 @@
+"""
+Compiled, shape-bucketed generation with a static decoder cache.
+
+Eager `generate` sees a different input length on almost every call, so every call allocates
+differently shaped tensors. In this mode inputs are padded to a small set of length buckets
+(and batches to a few batch sizes), the decoder uses a preallocated static cache of
+`cache_tokens` positions, and the encoder and the decode step run through `torch.compile`,
+so each (batch size, bucket) pair maps to one compiled graph. The pairs are compiled at
+startup by `warmup`. Calls with any other shape, or that need more than `cache_tokens` new
+tokens, run eagerly.
+"""
+import threading
+from contextlib import contextmanager
+
+import torch
+import torch.nn.functional as F
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+import metrics
+from config_log import get_logger
+logger = get_logger(__name__)
+
+COMPILED_CALLS = metrics.counter("summarimer_compiled_generate_total", "Generate calls by execution path (compiled or eager).")
+BUCKET_PADDING = metrics.histogram("summarimer_bucket_padding_tokens", "Padding added to reach a length bucket.", metrics.TOKEN_BUCKETS)
+
+
+def parse_buckets(spec: str) -> list:
+    """
+    Parses a comma-separated list of positive integers such as "256,512,1024".
+    parameters:
+        spec (str): The list, possibly empty.
+    returns:
+        list: The sorted values.
+    """
+    values = sorted({int(part) for part in (spec or "").split(",") if part.strip()})
+    if any(value < 1 for value in values):
+        raise ValueError(f"Invalid bucket list: {spec!r}")
+    return values
+
+
+class LengthCriteria(StoppingCriteria):
+    """
+    Stops once the decoder sequences reach `max_length` tokens. `generate` rejects a second
+    MaxLengthCriteria next to the one it builds from `max_new_tokens`.
+    """
+
+    def __init__(self, max_length: int):
+        self.max_length = max_length
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), input_ids.shape[-1] >= self.max_length, dtype=torch.bool,
+                          device=input_ids.device)
+
+
+class CompiledGenerate:
+    """
+    Routes generate calls of a seq2seq model to compiled graphs for a fixed set of shapes.
+
+    The model's `forward` and its encoder's `forward` are replaced by dispatchers that call
+    the compiled function only inside `active(True)`, so eager and compiled calls can run
+    side by side on different threads.
+    """
+
+    def __init__(self, model, device: str, pad_token_id: int, padding_side: str, buckets: list,
+                 batch_sizes: list = (1,), cache_tokens: int = 512):
+        self.device = device
+        self.pad_token_id = pad_token_id
+        self.left = padding_side == "left"
+        self.buckets = sorted(buckets)
+        self.batch_sizes = sorted(set(batch_sizes))
+        self.cache_tokens = cache_tokens
+        # Các cặp (batch size, bucket) đã được compile khi warmup
+        self.ready = set()
+        self._state = threading.local()
+        # Mỗi cặp shape là một graph riêng, không để dynamo bỏ cuộc và chạy eager ngầm
+        torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit,
+                                                    2 * len(self.buckets) * len(self.batch_sizes))
+        # PeftModel gọi forward của mô hình transformers bên trong
+        target = model.get_base_model() if hasattr(model, "get_base_model") else model
+        self._install(target)
+        self._install(target.get_encoder())
+
+    def _install(self, module: torch.nn.Module):
+        eager = module.forward
+        compiled = torch.compile(eager, dynamic=False)
+        state = self._state
+
+        def forward(*args, **kwargs):
+            return compiled(*args, **kwargs) if getattr(state, "on", False) else eager(*args, **kwargs)
+
+        module.forward = forward
+
+    @contextmanager
+    def active(self, on: bool = True):
+        """
+        Runs the model calls of the current thread through the compiled graphs while `on`.
+        """
+        previous = getattr(self._state, "on", False)
+        self._state.on = on
+        try:
+            yield
+        finally:
+            self._state.on = previous
+
+    def is_active(self) -> bool:
+        return getattr(self._state, "on", False)
+
+    def plan(self, batch_size: int, width: int, max_new_tokens: int) -> tuple:
+        """
+        Picks the compiled shape for a call.
+        parameters:
+            batch_size (int): The number of sequences.
+            width (int): The padded input length.
+            max_new_tokens (int): The generation limit.
+        returns:
+            tuple: `(batch size, bucket)` to pad to, or None to run eagerly.
+        """
+        if max_new_tokens > self.cache_tokens:
+            return None
+        batch = next((size for size in self.batch_sizes if size >= batch_size), None)
+        bucket = next((size for size in self.buckets if size >= width), None)
+        if batch is None or bucket is None or (batch, bucket) not in self.ready:
+            return None
+        return batch, bucket
+
+    def pad(self, kwargs: dict, batch_ids: list, plan: tuple) -> tuple:
+        """
+        Pads the inputs of a call to its planned shape. Extra rows repeat the first sequence
+        and are dropped from the outputs by the caller.
+        returns:
+            tuple: The padded generate kwargs and `batch_ids`.
+        """
+        batch, bucket = plan
+        input_ids, attention_mask = kwargs["input_ids"], kwargs["attention_mask"]
+        rows, width = input_ids.shape
+        BUCKET_PADDING.observe((bucket - width) * rows)
+        padding = (bucket - width, 0) if self.left else (0, bucket - width)
+        input_ids = F.pad(input_ids, padding, value=self.pad_token_id)
+        attention_mask = F.pad(attention_mask, padding, value=0)
+        if batch > rows:
+            input_ids = torch.cat([input_ids, input_ids[:1].expand(batch - rows, -1)])
+            attention_mask = torch.cat([attention_mask, attention_mask[:1].expand(batch - rows, -1)])
+            if batch_ids is not None:
+                batch_ids = batch_ids + [batch_ids[0]] * (batch - rows)
+        return {**kwargs, "input_ids": input_ids, "attention_mask": attention_mask}, batch_ids
+
+    def generate_kwargs(self, kwargs: dict) -> dict:
+        """
+        Switches a call to the static cache, sized `cache_tokens` for every call so the decode
+        graph does not depend on the generation limit, which a stopping criterion enforces instead.
+        """
+        stopping = StoppingCriteriaList(kwargs.get("stopping_criteria") or [])
+        # Chuỗi decoder gồm decoder_start_token và các token sinh ra
+        stopping.append(LengthCriteria(kwargs["max_new_tokens"] + 1))
+        return {**kwargs, "max_new_tokens": self.cache_tokens, "cache_implementation": "static",
+                "stopping_criteria": stopping}
+
+    def warmup(self, generate, ids: list):
+        """
+        Compiles every (batch size, bucket) pair.
+        parameters:
+            generate: Called as `generate(input_ids=..., attention_mask=..., max_new_tokens=...)`
+                with compiled execution active.
+            ids (list): Token ids repeated to fill each bucket.
+        """
+        for bucket in self.buckets:
+            row = (ids * (bucket // max(1, len(ids)) + 1))[:bucket]
+            for batch in self.batch_sizes:
+                input_ids = torch.tensor([row] * batch, device=self.device)
+                kwargs = self.generate_kwargs({"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids),
+                                               "max_new_tokens": 2})
+                with self.active():
+                    generate(**kwargs)
+                self.ready.add((batch, bucket))
+                logger.info("Compiled generate for batch size %d, %d input tokens.", batch, bucket)
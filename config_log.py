@@ -1,17 +1,191 @@
-import logging.config
+"""
+Logging setup shared by every module.
+
+Records are handed to a `QueueHandler` and written by a background `QueueListener`
+thread, so request threads never wait on the disk or on the file handler lock.
+The file rotates by size (or by time with LOG_ROTATE_WHEN) and records are either
+plain text or, with LOG_FORMAT=json, one JSON object per line carrying the
+`request_id`/`thread_id` bound with `log_context` and any `extra` fields (timings).
+
+High-volume messages (e.g. one per chunk) are logged with `extra=SAMPLED` and only one
+in every LOG_SAMPLE_EVERY of them is kept.
+
+Rotation is not safe across processes, so each forked worker (prefork.py) writes and rotates
+its own file, LOG_FILE with the worker pid before the extension (`logging.1234.log`). Worker
+processes started with spawn (batch_summarize.py) switch with `use_process_log_file`.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
 import os
+import queue
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+log_file_path = os.getenv("LOG_FILE", "logging.log")
+# Mức log và định dạng: "text" hoặc "json" (mỗi dòng một object JSON)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Xoay vòng file log theo dung lượng, hoặc theo thời gian nếu đặt LOG_ROTATE_WHEN (vd: "midnight", "H")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN") or None
+# Chỉ giữ 1 trên N bản ghi được đánh dấu SAMPLED
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "20"))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Truyền vào `extra=` cho các log lặp lại nhiều lần trong một request
+SAMPLED = {"sampled": True}
+
+# Thuộc tính có sẵn của LogRecord; phần còn lại là field truyền qua `extra`
+_RECORD_ATTRS = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "taskName"}
+
+_context = contextvars.ContextVar("log_context", default={})
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    Binds fields (e.g. request_id, thread_id) to every record logged in the current context.
+    """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def iter_in_context(iterable, **fields):
+    """
+    Iterates `iterable` with `fields` bound around each step, for generators that are
+    advanced from other threads (e.g. a streamed response run in a thread pool).
+    """
+    iterator = iter(iterable)
+    while True:
+        with log_context(**fields):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+class ContextFilter(logging.Filter):
+    """
+    Copies the fields bound with `log_context` onto the record.
+    """
+
+    def filter(self, record):
+        for key, value in _context.get().items():
+            setattr(record, key, value)
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keeps one in every `every` records marked with `extra=SAMPLED`, counted per call site.
+    """
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self._seen = {}
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False):
+            return True
+        site = (record.pathname, record.lineno)
+        # Không cần khóa: đếm lệch vài bản ghi khi có tranh chấp thì vẫn chấp nhận được
+        count = self._seen.get(site, 0)
+        self._seen[site] = count + 1
+        return count % self.every == 0
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "time": self.formatTime(record, DATE_FORMAT),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key != "sampled":
+                payload[key] = value
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def process_log_path(path: str, pid: int) -> str:
+    """
+    Returns the log file of a forked worker: `path` with `pid` inserted before the extension.
+    """
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{pid}{ext}"
+
+
+def _file_handler(path: str) -> logging.Handler:
+    if LOG_ROTATE_WHEN:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT, DATE_FORMAT))
+    return handler
+
+
+_queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+_queue_handler.addFilter(SampleFilter(LOG_SAMPLE_EVERY))
+_queue_handler.addFilter(ContextFilter())
+_listener = None
+
+
+def _start_listener(path: str = log_file_path):
+    global _listener
+    _queue_handler.queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, _file_handler(path), respect_handler_level=True)
+    _listener.start()
+
+
+def _start_child_listener():
+    # Thread ghi log không còn sau fork (chế độ prefork): process con có hàng đợi, listener và file log riêng
+    _start_listener(process_log_path(log_file_path, os.getpid()))
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def use_process_log_file():
+    """
+    Moves this process's logging to its own file, `process_log_path(LOG_FILE, pid)`.
+    Called in worker processes started with spawn, which import this module afresh and so
+    would otherwise share (and rotate) the parent's LOG_FILE.
+    """
+    previous = _listener
+    _stop_listener()
+    for handler in previous.handlers:
+        handler.close()
+    _start_child_listener()
 
-log_file_path = 'logging.log'
 
-logging.basicConfig(
-    level=logging.INFO,
-    filename=log_file_path,
-    filemode='a', 
-    encoding='utf-8',
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+root = logging.getLogger()
+root.setLevel(LOG_LEVEL)
+root.addHandler(_queue_handler)
+_start_listener()
+os.register_at_fork(after_in_child=_start_child_listener)
+# Ghi nốt các bản ghi còn trong hàng đợi khi thoát
+atexit.register(_stop_listener)
 
 def get_logger(name):
     logger = logging.getLogger(name)
-    return logger
\ No newline at end of file
+    return logger
@@ -0,0 +1,288 @@
+import os
+import queue
+import threading
+
+import torch
+from transformers.cache_utils import EncoderDecoderCache
+
+from config_log import get_logger
+logger = get_logger(__name__)
+
+# Các họ mô hình dùng relative position bias ở decoder: pad trái KV cache không làm lệch
+# vị trí tương đối, nên có thể gộp các chuỗi có độ dài khác nhau vào cùng một batch
+SUPPORTED_MODEL_TYPES = ("t5", "mt5", "umt5")
+
+
+def _pad(tensor: torch.Tensor, length: int, dim: int, value=0, left: bool = False) -> torch.Tensor:
+    missing = length - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = missing
+    filler = tensor.new_full(shape, value)
+    return torch.cat([filler, tensor] if left else [tensor, filler], dim=dim)
+
+
+class _Session:
+    """
+    One streaming request inside the engine.
+    """
+
+    def __init__(self, input_ids: list, max_new_tokens: int, sampling: dict, cancel_event: threading.Event):
+        self.input_ids = input_ids
+        self.max_new_tokens = max_new_tokens
+        self.do_sample = sampling.get("do_sample", False)
+        self.temperature = sampling.get("temperature", 1.0)
+        self.top_p = sampling.get("top_p", 1.0)
+        self.repetition_penalty = sampling.get("repetition_penalty", 1.0)
+        self.cancel_event = cancel_event
+        self.tokens = []
+        self.printed = 0
+        self.finished = False
+        self.output = queue.Queue()
+
+    def emit(self, tokenizer, final: bool = False):
+        # Giống TextIteratorStreamer: chỉ đẩy ra các từ đã hoàn chỉnh, phần còn lại khi kết thúc
+        text = tokenizer.decode(self.tokens, skip_special_tokens=True)
+        end = len(text) if final else text.rfind(" ") + 1
+        if end > self.printed:
+            self.output.put(text[self.printed:end])
+            self.printed = end
+
+
+class StreamingEngine:
+    """
+    Continuous batching for streaming summarization.
+
+    A single decode loop runs over a dynamic batch: new requests are prefilled and join
+    at step boundaries, finished or cancelled ones leave, and each sequence's text is
+    pushed to its own output queue. Sampling settings (`do_sample`, `temperature`,
+    `top_p`, `repetition_penalty`) are applied per sequence.
+    """
+
+    def __init__(self, model, tokenizer, device: str, max_batch_size: int = 8):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_batch_size = max(1, max_batch_size)
+        config = model.config
+        self.decoder_start_token_id = config.decoder_start_token_id
+        self.pad_token_id = config.pad_token_id
+        eos = model.generation_config.eos_token_id
+        self.eos_token_ids = set(eos if isinstance(eos, (list, tuple)) else [eos])
+
+        self._start()
+        # Thread nền không còn sau fork (chế độ prefork): khởi động lại trong process con
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._pending = queue.Queue()
+        # Request đã nhận nhưng chưa vào batch (batch đang đầy)
+        self._backlog = []
+        self._sessions = []
+        # Trạng thái batch: token đã sinh (pad trái), mask decoder, KV cache dạng tuple và đầu ra encoder (pad phải)
+        self._history = None
+        self._dec_mask = None
+        self._past = None
+        self._enc_states = None
+        self._enc_mask = None
+        self._thread = threading.Thread(target=self._run, name="streaming-engine", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def supports(config) -> bool:
+        """
+        Checks whether the model architecture can be batched by this engine.
+        """
+        return config.model_type in SUPPORTED_MODEL_TYPES
+
+    def stream(self, input_ids: list, max_new_tokens: int, sampling: dict, cancel_event: threading.Event = None,
+               stats: dict = None):
+        """
+        Queues a sequence and yields its decoded text as the shared decode loop produces it.
+        parameters:
+            input_ids (list): The model-ready input ids.
+            max_new_tokens (int): The generation limit.
+            sampling (dict): The sampling arguments of the request.
+            cancel_event (threading.Event): Removes the sequence from the batch when set.
+            stats (dict): If given, receives the number of generated tokens under "generated".
+        """
+        session = _Session(input_ids, max_new_tokens, sampling, cancel_event or threading.Event())
+        self._pending.put(session)
+        try:
+            while True:
+                item = session.output.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            if not session.finished:
+                session.cancel_event.set()
+            if stats is not None:
+                stats["generated"] = len(session.tokens)
+
+    def _run(self):
+        with torch.inference_mode():
+            while True:
+                joiners = self._take_pending()
+                try:
+                    if self._sessions:
+                        self._step()
+                    if joiners:
+                        self._admit(joiners)
+                    self._retire()
+                except Exception as e:
+                    logger.error("Streaming engine step failed: %s", e)
+                    for session in self._sessions + joiners:
+                        session.finished = True
+                        session.output.put(e)
+                    self._sessions = []
+                    self._past = None
+
+    def _take_pending(self) -> list:
+        # Khi không có việc thì chờ request mới, ngược lại chỉ lấy những gì đang có sẵn
+        if not self._sessions and not self._backlog:
+            self._backlog.append(self._pending.get())
+        while True:
+            try:
+                self._backlog.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        # Request bị hủy khi còn chờ (kể cả lúc batch đầy) được kết thúc ngay để stream() không chờ mãi
+        waiting = []
+        for session in self._backlog:
+            if session.cancel_event.is_set():
+                session.finished = True
+                session.output.put(None)
+            else:
+                waiting.append(session)
+        free = max(0, self.max_batch_size - len(self._sessions))
+        joiners, self._backlog = waiting[:free], waiting[free:]
+        return joiners
+
+    def _forward(self, history, dec_mask, past, enc_states, enc_mask):
+        outputs = self.model(
+            encoder_outputs=(enc_states,),
+            attention_mask=enc_mask,
+            decoder_input_ids=history if past is None else history[:, -1:],
+            decoder_attention_mask=dec_mask,
+            past_key_values=None if past is None else EncoderDecoderCache.from_legacy_cache(past),
+            use_cache=True,
+            return_dict=True,
+        )
+        past = outputs.past_key_values
+        if hasattr(past, "to_legacy_cache"):
+            past = past.to_legacy_cache()
+        return outputs.logits[:, -1, :], past
+
+    def _sample(self, logits, history, sessions) -> torch.Tensor:
+        logits = logits.float()
+        penalty = torch.tensor([s.repetition_penalty for s in sessions], device=logits.device)[:, None]
+        seen = torch.gather(logits, 1, history)
+        seen = torch.where(seen < 0, seen * penalty, seen / penalty)
+        logits = logits.scatter(1, history, seen)
+
+        greedy = logits.argmax(dim=-1)
+        do_sample = torch.tensor([s.do_sample for s in sessions], device=logits.device)
+        if not do_sample.any():
+            return greedy
+
+        temperature = torch.tensor([s.temperature for s in sessions], device=logits.device)[:, None]
+        top_p = torch.tensor([s.top_p for s in sessions], device=logits.device)[:, None]
+        probs = torch.softmax(logits / temperature, dim=-1)
+        sorted_probs, sorted_idx = probs.sort(dim=-1, descending=True)
+        # Giữ nhóm token nhỏ nhất có tổng xác suất >= top_p (luôn giữ token đầu tiên)
+        sorted_probs[(sorted_probs.cumsum(dim=-1) - sorted_probs) > top_p] = 0
+        sampled = sorted_idx.gather(1, torch.multinomial(sorted_probs, 1)).squeeze(1)
+        return torch.where(do_sample, sampled, greedy)
+
+    def _append(self, history, dec_mask, tokens, sessions):
+        for session, token in zip(sessions, tokens.tolist()):
+            session.tokens.append(token)
+            if token in self.eos_token_ids or len(session.tokens) >= session.max_new_tokens:
+                session.finished = True
+            session.emit(self.tokenizer, final=session.finished)
+        history = torch.cat([history, tokens[:, None]], dim=1)
+        dec_mask = torch.cat([dec_mask, torch.ones_like(tokens)[:, None]], dim=1)
+        return history, dec_mask
+
+    def _step(self):
+        logits, self._past = self._forward(self._history, self._dec_mask, self._past, self._enc_states, self._enc_mask)
+        tokens = self._sample(logits, self._history, self._sessions)
+        self._history, self._dec_mask = self._append(self._history, self._dec_mask, tokens, self._sessions)
+
+    def _admit(self, joiners: list):
+        # Prefill: chạy encoder và bước decode đầu tiên cho các request mới trong một batch riêng
+        inputs = self.tokenizer.pad({"input_ids": [s.input_ids for s in joiners]}, return_tensors="pt").to(self.device)
+        enc_states = self.model.get_encoder()(**inputs, return_dict=True).last_hidden_state
+        enc_mask = inputs["attention_mask"]
+        history = torch.full((len(joiners), 1), self.decoder_start_token_id, dtype=torch.long, device=self.device)
+        dec_mask = torch.ones_like(history)
+        logits, past = self._forward(history, dec_mask, None, enc_states, enc_mask)
+        tokens = self._sample(logits, history, joiners)
+        history, dec_mask = self._append(history, dec_mask, tokens, joiners)
+
+        if not self._sessions:
+            self._history, self._dec_mask, self._past = history, dec_mask, past
+            self._enc_states, self._enc_mask = enc_states, enc_mask
+            self._sessions = list(joiners)
+            return
+
+        # Gộp vào batch đang chạy: pad trái phía decoder, pad phải phía encoder
+        dec_len = max(self._history.shape[1], history.shape[1])
+        enc_len = max(self._enc_states.shape[1], enc_states.shape[1])
+
+        def merge(old, new, length, dim, value=0, left=False):
+            return torch.cat([_pad(old, length, dim, value, left), _pad(new, length, dim, value, left)], dim=0)
+
+        self._history = merge(self._history, history, dec_len, 1, self.pad_token_id, left=True)
+        self._dec_mask = merge(self._dec_mask, dec_mask, dec_len, 1, left=True)
+        self._enc_states = merge(self._enc_states, enc_states, enc_len, 1)
+        self._enc_mask = merge(self._enc_mask, enc_mask, enc_len, 1)
+        self._past = tuple(
+            (
+                merge(old[0], new[0], dec_len - 1, 2, left=True),
+                merge(old[1], new[1], dec_len - 1, 2, left=True),
+                merge(old[2], new[2], enc_len, 2),
+                merge(old[3], new[3], enc_len, 2),
+            )
+            for old, new in zip(self._past, past)
+        )
+        self._sessions.extend(joiners)
+
+    def _retire(self):
+        keep = []
+        for i, session in enumerate(self._sessions):
+            if session.finished or session.cancel_event.is_set():
+                session.finished = True
+                session.output.put(None)
+            else:
+                keep.append(i)
+        if len(keep) == len(self._sessions):
+            return
+        if not keep:
+            self._sessions, self._past = [], None
+            return
+
+        index = torch.tensor(keep, device=self.device)
+        self._sessions = [self._sessions[i] for i in keep]
+        history = self._history.index_select(0, index)
+        dec_mask = self._dec_mask.index_select(0, index)
+        enc_mask = self._enc_mask.index_select(0, index)
+        # Bỏ phần pad chung không còn cần thiết sau khi các chuỗi dài rời batch
+        lead = int((dec_mask.cumsum(dim=1) == 0).sum(dim=1).min())
+        enc_len = int(enc_mask.sum(dim=1).max())
+        self._history, self._dec_mask = history[:, lead:], dec_mask[:, lead:]
+        self._enc_states = self._enc_states.index_select(0, index)[:, :enc_len]
+        self._enc_mask = enc_mask[:, :enc_len]
+        self._past = tuple(
+            (
+                layer[0].index_select(0, index)[:, :, lead:],
+                layer[1].index_select(0, index)[:, :, lead:],
+                layer[2].index_select(0, index)[:, :, :enc_len],
+                layer[3].index_select(0, index)[:, :, :enc_len],
+            )
+            for layer in self._past
+        )
@@ -0,0 +1,63 @@
+"""
+Extractive pre-selection for long articles.
+
+Sentences are scored with vectorized NumPy: TF-IDF over the model's own token ids, cosine
+similarity to the document centroid, and a prior favouring early sentences (news put the
+essentials in the lede). The best sentences that fit the model window are kept in document
+order, so a long article needs one abstractive pass instead of one per chunk.
+"""
+import numpy as np
+
+import chunker
+
+# Trọng số của vị trí câu so với độ tương đồng với trọng tâm văn bản
+POSITION_WEIGHT = 0.3
+
+
+def score_sentences(encoding: chunker.Encoding, position_weight: float = POSITION_WEIGHT) -> np.ndarray:
+    """
+    Scores every sentence of an encoded document.
+    parameters:
+        encoding (chunker.Encoding): The encoded document.
+        position_weight (float): The share of the score given to the position prior.
+    returns:
+        np.ndarray: One score per sentence, higher is more informative.
+    """
+    lengths = np.array([tok_end - tok_start for _, _, tok_start, tok_end in encoding.sentences])
+    n = len(lengths)
+    # Chỉ giữ các token id có mặt trong văn bản làm cột của ma trận câu x từ
+    terms, columns = np.unique(np.asarray(encoding.ids[:lengths.sum()], dtype=np.int64), return_inverse=True)
+    rows = np.repeat(np.arange(n), lengths)
+    tf = np.zeros((n, len(terms)), dtype=np.float32)
+    np.add.at(tf, (rows, columns), 1.0)
+
+    df = np.count_nonzero(tf, axis=0)
+    tfidf = tf * (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+    tfidf /= np.maximum(np.linalg.norm(tfidf, axis=1, keepdims=True), 1e-8)
+    centroid = tfidf.mean(axis=0)
+    similarity = tfidf @ (centroid / max(np.linalg.norm(centroid), 1e-8))
+
+    position = 1.0 / np.sqrt(1.0 + np.arange(n))
+    return (1 - position_weight) * similarity / max(similarity.max(), 1e-8) + position_weight * position
+
+
+def select_sentences(encoding: chunker.Encoding, budget: int, position_weight: float = POSITION_WEIGHT) -> list:
+    """
+    Picks the highest scoring sentences whose total length fits the token budget.
+    parameters:
+        encoding (chunker.Encoding): The encoded document.
+        budget (int): The maximum number of tokens of the selection.
+        position_weight (float): The share of the score given to the position prior.
+    returns:
+        list: The indices of the selected sentences, in document order.
+    """
+    if not encoding.sentences:
+        return []
+    scores = score_sentences(encoding, position_weight)
+    selected, used = [], 0
+    for i in np.argsort(-scores, kind="stable"):
+        _, _, tok_start, tok_end = encoding.sentences[i]
+        if used + tok_end - tok_start <= budget:
+            selected.append(int(i))
+            used += tok_end - tok_start
+    return sorted(selected)
@@ -0,0 +1,171 @@
+import threading
+from collections import OrderedDict
+
+import chunker
+from summarimer import CHUNKS, MAX_INPUT_TOKENS, CHUNK_SUMMARY_TOKENS
+
+from config_log import get_logger
+logger = get_logger(__name__)
+
+
+class IncrementalSummarizer:
+    """
+    Re-summarizes updated documents (live blogs, developing stories) per `thread_id`.
+
+    For each thread the chunk texts and their summaries from the previous request are kept.
+    Chunks that appear unchanged in the new text are reused, and only the new or modified
+    regions are chunked and sent to generation, so the work is proportional to the diff.
+    """
+
+    def __init__(self, summarizer, max_threads: int = 1000, single_pass=None):
+        self.summarizer = summarizer
+        self.max_threads = max_threads
+        # Văn bản vừa một lượt encode không cần chia chunk; gọi như `Summarimer.summarize`,
+        # kèm `encoding` đã tính khi định tuyến
+        self.single_pass = single_pass or summarizer.summarize
+        self._threads = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, key: tuple) -> tuple:
+        with self._lock:
+            state = self._threads.get(key)
+            if state is not None:
+                self._threads.move_to_end(key)
+            return state
+
+    def _store(self, key: tuple, state: tuple):
+        with self._lock:
+            self._threads[key] = state
+            self._threads.move_to_end(key)
+            while len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+
+    def segment(self, text: str, previous: list) -> list:
+        """
+        Aligns the new text with the chunks of the previous request.
+        parameters:
+            text (str): The new version of the document.
+            previous (list): `(chunk_text, summary)` pairs from the previous request.
+        returns:
+            list: Segments in document order as `(start, end, summary)` character spans of
+            `text`, with the summary of reused chunks and None for regions that have to be
+            chunked again.
+        """
+        segments, cursor = [], 0
+        for chunk_text, summary in previous:
+            position = text.find(chunk_text, cursor)
+            if position < 0:
+                continue
+            if text[cursor:position].strip():
+                segments.append((cursor, position, None))
+            segments.append((position, position + len(chunk_text), summary))
+            cursor = position + len(chunk_text)
+        if text[cursor:].strip():
+            segments.append((cursor, len(text), None))
+        return segments
+
+    def summarize(self, thread_id: str, text: str, max_cap: int = 512, ratio: float = 0.7, adapter: str = None,
+                  long_mode: str = None) -> str:
+        """
+        Summarizes the text, reusing the chunk summaries of the thread's previous request.
+
+        Args:
+            thread_id (str): The ID of the thread.
+            text (str): The text to summarize.
+            adapter (str): The named LoRA adapter, None for the default one.
+            long_mode (str): The long-document mode, None for the default one.
+
+        Returns:
+            str: The summarized text.
+        """
+        summarizer = self.summarizer
+        long_mode = summarizer.resolve_long_mode(long_mode)
+        encoding = summarizer.encode(text)
+        # Chế độ extractive luôn tóm tắt trong một lượt, không có chunk nào để dùng lại
+        if len(encoding.ids) <= MAX_INPUT_TOKENS or long_mode == "extractive":
+            # Dùng lại encoding vừa tính để không tokenize văn bản lần thứ hai
+            return self.single_pass(text, max_cap=max_cap, ratio=ratio, adapter=adapter, long_mode=long_mode,
+                                    encoding=encoding)
+
+        cache_key = None
+        if summarizer.cache is not None:
+            cache_key = summarizer.cache_key(text, max_cap, ratio, adapter, long_mode)
+            summary = summarizer.cache.get(cache_key)
+            if summary is not None:
+                logger.info("Cache hit, returning cached summary.")
+                return summary
+        summary = self._summarize_chunked(thread_id, text, encoding, adapter, long_mode)
+        if cache_key is not None:
+            summarizer.cache.put(cache_key, summary)
+        return summary
+
+    def _plan(self, n_chunks: int, long_mode: str) -> tuple:
+        # Ở chế độ hierarchical, độ dài tóm tắt tầng 1 và số chunk được giữ theo kế hoạch ngân sách decode
+        # của cả tài liệu: (độ dài tóm tắt mỗi chunk, số chunk đầu được tóm tắt)
+        if long_mode == "hierarchical":
+            chunk_tokens, _, _, kept = self.summarizer.plan_decode_budget(n_chunks)
+            return chunk_tokens, kept
+        return CHUNK_SUMMARY_TOKENS, n_chunks
+
+    def _align(self, text: str, previous: list) -> list:
+        """
+        Builds the chunk list of the new text from the previous one.
+        returns:
+            list: `(chunk_text, summary)` for reused chunks and `(chunker.Chunk, None)` for new ones.
+        """
+        chunks, last_start = [], 0
+        for start, end, summary in self.segment(text, previous):
+            if summary is not None:
+                chunks.append((text[start:end], summary))
+                last_start = start
+                continue
+            # Phần mới nối liền sau một chunk cũ: chia lại cùng chunk đó để không sinh ra chunk vụn.
+            # Vùng được cắt từ chính văn bản để text của chunk mới vẫn tìm thấy được ở lần cập nhật sau
+            merged = chunks and chunks[-1][1] is not None
+            region = text[last_start:end] if merged else text[start:end]
+            new_chunks = self.summarizer.split_into_chunks(region, MAX_INPUT_TOKENS)
+            if merged and new_chunks and new_chunks[0].text == chunks[-1][0]:
+                new_chunks = new_chunks[1:]
+            elif merged:
+                chunks.pop()
+            chunks.extend((chunk, None) for chunk in new_chunks)
+        return chunks
+
+    def _summarize_chunked(self, thread_id: str, text: str, encoding, adapter: str, long_mode: str) -> str:
+        """
+        Summarizes a text over MAX_INPUT_TOKENS chunk by chunk, without consulting the cache.
+        """
+        summarizer = self.summarizer
+        # Tóm tắt của từng chunk phụ thuộc adapter: mỗi cặp (thread, adapter) có trạng thái riêng
+        key = (thread_id, adapter)
+        previous_tokens, previous = self._load(key) or (None, [])
+        chunks = self._align(text, previous) if previous else []
+        chunk_tokens, kept = self._plan(len(chunks), long_mode)
+        if not previous or previous_tokens != chunk_tokens:
+            # Độ dài tóm tắt tầng 1 đổi theo kế hoạch mới: không dùng lại được tóm tắt cũ
+            chunks = [(chunk, None) for chunk in summarizer.split_into_chunks(text, MAX_INPUT_TOKENS, encoding=encoding)]
+            chunk_tokens, kept = self._plan(len(chunks), long_mode)
+        CHUNKS.observe(len(chunks))
+        # Ngân sách decode không đủ cho cả tài liệu: bỏ các chunk cuối như reduce_chunks
+        chunks = chunks[:kept]
+
+        pending = [chunk for chunk, summary in chunks if summary is None]
+        logger.info("Thread %s: %d chunks, %d to summarize, %d reused.",
+                    thread_id, len(chunks), len(pending), len(chunks) - len(pending))
+        new_summaries = iter(summarizer.summarize_chunks(pending, max_new_tokens=chunk_tokens, adapter=adapter))
+
+        state = []
+        for chunk, summary in chunks:
+            if summary is None:
+                state.append((chunk.text, next(new_summaries)))
+            else:
+                state.append((chunk, summary))
+        self._store(key, (chunk_tokens, state))
+
+        summaries = [summary for _, summary in state]
+        if long_mode == "hierarchical":
+            # Tầng 1 đã có: reduce_chunks chạy các tầng còn lại trong cùng ngân sách MAX_DECODE_TOKENS
+            first_level = [chunker.Chunk(chunk_text, []) for chunk_text, _ in state]
+            final_chunk = summarizer.reduce_chunks(first_level, adapter, summaries=summaries)
+            return summarizer.summarize_chunks([final_chunk], max_new_tokens=summarizer.output_budget, adapter=adapter)[0]
+        return summarizer.join_summaries(summaries)
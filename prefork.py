@@ -0,0 +1,129 @@
+"""
+Pre-fork serving: the model is loaded once in the parent process, then N uvicorn workers are
+forked and share its weights copy-on-write, so each extra worker adds little resident memory.
+
+    python prefork.py --workers 4 --port 8000
+
+The parent logs RSS/PSS per worker (from /proc/<pid>/smaps_rollup) once the workers are up
+and every `--report-interval` seconds. PSS splits shared pages between the processes that map
+them, so the sum of PSS is the real memory footprint of the whole server.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import time
+
+import uvicorn
+
+from config_log import get_logger
+logger = get_logger(__name__)
+
+
+def memory_usage(pid: int) -> dict:
+    """
+    Reads the memory counters of a process.
+    parameters:
+        pid (int): The process id.
+    returns:
+        dict: Rss, Pss, Shared and Private memory in MiB.
+    """
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": round(fields.get("Rss", 0.0), 1),
+        "pss_mb": round(fields.get("Pss", 0.0), 1),
+        "shared_mb": round(fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0), 1),
+        "private_mb": round(fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0), 1),
+    }
+
+
+def report_memory(parent: int, workers: list) -> str:
+    """
+    Formats a per-process memory table and logs it.
+    parameters:
+        parent (int): The parent pid.
+        workers (list): The worker pids.
+    returns:
+        str: The report.
+    """
+    lines = [f"{'process':<16}{'rss_mb':>10}{'pss_mb':>10}{'shared_mb':>11}{'private_mb':>12}"]
+    total_pss = 0.0
+    for name, pid in [("parent", parent)] + [(f"worker {pid}", pid) for pid in workers]:
+        try:
+            usage = memory_usage(pid)
+        except FileNotFoundError:
+            continue
+        total_pss += usage["pss_mb"]
+        lines.append(f"{name:<16}{usage['rss_mb']:>10}{usage['pss_mb']:>10}{usage['shared_mb']:>11}{usage['private_mb']:>12}")
+    lines.append(f"{'total pss':<16}{'':>10}{round(total_pss, 1):>10}")
+    report = "\n".join(lines)
+    logger.info("Memory per process:\n%s", report)
+    return report
+
+
+def serve_worker(app, sock: socket.socket):
+    config = uvicorn.Config(app, log_config=None)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the summarization API with pre-forked workers.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--report-interval", type=float, default=0, help="Seconds between memory reports (0: once)")
+    args = parser.parse_args()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # Nạp mô hình một lần ở process cha. Không chạy suy luận ở đây: thread pool của torch
+    # khởi tạo trước fork có thể treo trong process con; warmup chạy trong từng worker
+    import server
+    server.load_model()
+    app = server.app
+
+    # Đóng băng các object hiện có để GC không chạm vào (và sao chép) các trang bộ nhớ dùng chung
+    gc.collect()
+    gc.freeze()
+
+    workers = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            serve_worker(app, sock)
+            os._exit(0)
+        workers.append(pid)
+    logger.info("Forked %d workers: %s", len(workers), workers)
+
+    def shutdown(signum, frame):
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    # Chờ các worker khởi động xong rồi đo bộ nhớ
+    time.sleep(5)
+    print(report_memory(os.getpid(), workers), flush=True)
+    while workers:
+        if args.report_interval > 0:
+            time.sleep(args.report_interval)
+            print(report_memory(os.getpid(), workers), flush=True)
+        finished = [pid for pid in workers if os.waitpid(pid, os.WNOHANG if args.report_interval > 0 else 0)[0]]
+        workers = [pid for pid in workers if pid not in finished]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Text normalization applied to every request before tokenization.
+
+Pasted articles often carry HTML fragments, NFD diacritics (macOS, some CMS exports),
+repeated whitespace and news-site boilerplate (bylines, "Xem thêm"/related-article blocks,
+photo captions). All of it is tokenized and encoded for nothing, and it can push an article
+over the chunking threshold. Patterns are compiled once at import; `normalize` is a handful
+of linear regex passes over the text.
+"""
+import html
+import re
+import unicodedata
+
+# Thẻ HTML: script/style bị bỏ cả nội dung, thẻ khối được thay bằng xuống dòng
+SCRIPT_STYLE = re.compile(r"<(script|style|noscript)\b[^>]*>.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+BLOCK_TAG = re.compile(r"</?(?:p|div|br|li|ul|ol|h[1-6]|tr|table|section|article|figure|figcaption|blockquote)\b[^>]*>", re.IGNORECASE)
+TAG = re.compile(r"</?[a-zA-Z][^>]*>")
+
+RELATED = r"(?:xem thêm|đọc thêm|tin liên quan|bài liên quan|tin cùng chuyên mục|có thể bạn quan tâm)"
+# Khối tin liên quan: dòng chỉ có tiêu đề khối, kéo theo tối đa 5 dòng tiêu đề bài liền sau
+# (dòng ngắn không kết thúc bằng dấu câu như một đoạn văn)
+RELATED_BLOCK = re.compile(
+    rf"^[ \t]*{RELATED}[ \t]*:?[ \t]*\n(?:[ \t]*\S(?:[^\n]{{0,149}}[^\s.!?…:])?[ \t]*(?:\n|\Z)){{0,5}}",
+    re.IGNORECASE | re.MULTILINE,
+)
+# Dòng tin liên quan: ">> Xem thêm ..." hoặc "Xem thêm: <tiêu đề>", không đụng câu bắt đầu bằng cùng cụm từ
+RELATED_LINE = re.compile(
+    rf"^[ \t]*(?:>>+[ \t]*{RELATED}\b[^\n]*|{RELATED}[ \t]*:[^\n]*)$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# Dòng nguồn/tác giả: "(Theo TTXVN)", "Nguồn: VnExpress", "Bài và ảnh: ..."
+BYLINE = re.compile(
+    r"^[ \t]*\((?:theo|nguồn)\b[^)\n]{1,60}\)\.?[ \t]*$"
+    r"|^[ \t]*(?:nguồn|tác giả|phóng viên|nhóm pv|pv|bài và ảnh|bài, ảnh|bài|ảnh)[ \t]*:[^\n.!?]{1,60}$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# "Theo <báo>" ở dòng cuối: chỉ bỏ khi sau "Theo" toàn là tên riêng viết hoa ("Theo Tuổi Trẻ"),
+# không bỏ câu như "Theo ông Nam thì ..."
+FINAL_SOURCE = re.compile(r"(?:\A|\n)[ \t]*Theo[ \t]+([^\n.!?,:]{1,40})\.?\s*\Z")
+# Chú thích ảnh/video: dòng bắt đầu bằng "Video:", đuôi "Ảnh: <tác giả>" sau dấu kết câu,
+# và "(Ảnh: ...)" chèn giữa câu
+CAPTION_LINE = re.compile(r"^[ \t]*(?:video|clip|đồ họa|nguồn ảnh)[ \t]*:[^\n]*$", re.IGNORECASE | re.MULTILINE)
+CAPTION_SUFFIX = re.compile(
+    r"(?<=[.!?)])[ \t]*\(?(?:ảnh|video|đồ họa)[ \t]*:[^\n.()]{1,60}\)?[ \t]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+CAPTION_INLINE = re.compile(r"[ \t]*\((?:ảnh|nguồn|video|đồ họa)[ \t]*:[^)\n]{0,80}\)", re.IGNORECASE)
+
+SPACES = re.compile(r"[^\S\n]+")
+NEWLINES = re.compile(r"[ \t]*\n[\s]*")
+
+
+def strip_html(text: str) -> str:
+    """
+    Removes HTML tags and decodes entities, keeping block boundaries as newlines.
+    """
+    if "<" in text:
+        text = SCRIPT_STYLE.sub(" ", text)
+        text = COMMENT.sub(" ", text)
+        text = BLOCK_TAG.sub("\n", text)
+        text = TAG.sub(" ", text)
+    if "&" in text:
+        text = html.unescape(text)
+    return text
+
+
+def _strip_source(match: re.Match) -> str:
+    words = match.group(1).split()
+    return "" if words and all(word[0].isupper() or word[0].isdigit() for word in words) else match.group(0)
+
+
+def strip_boilerplate(text: str) -> str:
+    """
+    Removes related-article blocks, bylines and photo captions common in Vietnamese news.
+    """
+    text = RELATED_BLOCK.sub("", text)
+    text = RELATED_LINE.sub("", text)
+    text = BYLINE.sub("", text)
+    text = FINAL_SOURCE.sub(_strip_source, text)
+    text = CAPTION_LINE.sub("", text)
+    text = CAPTION_SUFFIX.sub("", text)
+    return CAPTION_INLINE.sub("", text)
+
+
+def normalize(text: str) -> str:
+    """
+    Normalizes a pasted article before tokenization.
+    parameters:
+        text (str): The raw text, possibly with HTML and boilerplate.
+    returns:
+        str: NFC text without tags or boilerplate, with spaces collapsed and one newline between paragraphs.
+    """
+    # NFC trước để các mẫu tiếng Việt (dạng dựng sẵn) khớp cả văn bản NFD
+    text = unicodedata.normalize("NFC", text.replace("\r\n", "\n").replace("\r", "\n"))
+    text = strip_html(text)
+    text = SPACES.sub(" ", text)
+    text = strip_boilerplate(text)
+    return NEWLINES.sub("\n", text).strip()
@@ -1,12 +1,30 @@
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException
+from fastapi import Request as HTTPRequest
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import asynccontextmanager
+from typing import Literal, Optional
 import asyncio
+import contextvars
+import json
+import threading
+import time
+import uuid
 import torch
 
 from summarimer import Summarimer
+from batcher import MicroBatcher
+from cache import SummaryCache, EncoderCache
+from incremental import IncrementalSummarizer
+from adapters import parse_adapters
+from compiled import parse_buckets
+from admission import AdmissionController, Overloaded, DeadlineExceeded
+from bulk import parse_items, bucket_by_length, summarize_bucket
+import metrics
 
-from config_log import get_logger
+from config_log import get_logger, log_context, iter_in_context
 import os
 from dotenv import load_dotenv
 
@@ -14,11 +32,172 @@ from dotenv import load_dotenv
 load_dotenv()
 BASE_MODEL = os.getenv("BASE_MODEL")
 PEFT_MODEL = os.getenv("PEFT_MODEL")
+# Snapshot đã gộp LoRA (tạo bằng bake.py); nếu có thì dùng thay cho BASE_MODEL + PEFT_MODEL
+MERGED_MODEL = os.getenv("MERGED_MODEL") or None
+# Backend suy luận: peft (fp32), int8 hoặc onnx; thư mục gốc lưu đồ thị ONNX đã xuất
+# (mỗi mô hình một thư mục con, mặc định ~/.cache/summarimer/onnx)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "peft")
+ONNX_DIR = os.getenv("ONNX_DIR") or None
+# Mô hình draft nhỏ cho assisted decoding (dùng chung tokenizer) và số token đề xuất mỗi bước
+DRAFT_MODEL = os.getenv("DRAFT_MODEL") or None
+DRAFT_TOKENS = int(os.getenv("DRAFT_TOKENS", "5"))
+# Các LoRA adapter khác trên cùng mô hình nền ("tên=đường_dẫn,..."), chọn bằng trường `adapter` của request,
+# và dung lượng tối đa (MiB) của các adapter được nạp cùng lúc
+ADAPTERS = parse_adapters(os.getenv("ADAPTERS", ""))
+ADAPTER_MEMORY_MB = float(os.getenv("ADAPTER_MEMORY_MB", "256"))
+# Cấu hình gộp batch cho /summary
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+# Cấu hình sinh song song các chunk của văn bản dài
+CHUNK_BATCH_SIZE = int(os.getenv("CHUNK_BATCH_SIZE", "1"))
+MAX_BATCH_TOKENS = int(os.getenv("MAX_BATCH_TOKENS", "8192"))
+# Chế độ tóm tắt văn bản dài mặc định ("concat", "hierarchical" hoặc "extractive", chọn lại được theo
+# từng request bằng trường `long_mode`) và ngân sách token sinh
+LONG_MODE = os.getenv("LONG_MODE", "concat")
+OUTPUT_BUDGET = int(os.getenv("OUTPUT_BUDGET", "256"))
+MAX_DECODE_TOKENS = int(os.getenv("MAX_DECODE_TOKENS")) if os.getenv("MAX_DECODE_TOKENS") else None
+# Cache tóm tắt: số mục trong bộ nhớ (0 để tắt), file SQLite tùy chọn và giải mã greedy
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "1024"))
+CACHE_PATH = os.getenv("CACHE_PATH") or None
+DETERMINISTIC = os.getenv("DETERMINISTIC", "false").lower() in ("1", "true", "yes")
+# Chia core cho các worker suy luận: "NxT" (N worker, mỗi worker T core và T thread torch) hoặc danh sách
+# core từng worker "0-7;8-15". Bỏ trống để mọi lượt generate dùng chung pool thread của torch
+CPU_WORKERS = os.getenv("CPU_WORKERS") or None
+# Chế độ compile với static KV cache: các bucket độ dài đầu vào (bỏ trống để tắt), các batch size được compile
+# và số vị trí của static cache (giới hạn token sinh mỗi lượt; lượt cần nhiều hơn chạy eager)
+COMPILE_BUCKETS = parse_buckets(os.getenv("COMPILE_BUCKETS", ""))
+COMPILE_BATCH_SIZES = parse_buckets(os.getenv("COMPILE_BATCH_SIZES", f"1,{BATCH_MAX_SIZE}"))
+STATIC_CACHE_TOKENS = int(os.getenv("STATIC_CACHE_TOKENS", "512"))
+# Chuẩn hóa văn bản trước khi tóm tắt: NFC, bỏ thẻ HTML, khoảng trắng thừa và phần thừa của bài báo
+PREPROCESS = os.getenv("PREPROCESS", "true").lower() in ("1", "true", "yes")
+# Dung lượng (MiB) cache trạng thái encoder, dùng lại khi cùng bài được tóm tắt với độ dài khác (0 để tắt)
+ENCODER_CACHE_MB = float(os.getenv("ENCODER_CACHE_MB", "256"))
+# Kích thước batch tối đa của engine continuous batching cho /summary_stream (0 để tắt)
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "0"))
+# Số thread_id được nhớ để tóm tắt lại tăng dần (0 để tắt)
+INCREMENTAL_MAX_THREADS = int(os.getenv("INCREMENTAL_MAX_THREADS", "1000"))
+# Hàng đợi suy luận: số request chạy đồng thời, số request được chờ và thời hạn mặc định (giây)
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "8"))
+MAX_QUEUE = int(os.getenv("MAX_QUEUE", "64"))
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "30"))
+# Số bucket của /summary_batch được xử lý song song
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", "2"))
 
 logger = get_logger(__name__)
 
+# Văn bản tiếng Việt mẫu cho ba nhánh định tuyến (ngắn, vừa, dài) dùng để warmup
+_WARMUP_PARAGRAPH = (
+    "Sáng nay, Ủy ban nhân dân thành phố Hà Nội đã tổ chức hội nghị tổng kết tình hình kinh tế - xã hội "
+    "năm qua và triển khai nhiệm vụ trọng tâm cho năm tới. Theo báo cáo, tổng sản phẩm trên địa bàn tăng "
+    "khoảng 6,5%, thu ngân sách vượt dự toán, nhiều công trình giao thông quan trọng được đưa vào sử dụng. "
+    "Lãnh đạo thành phố yêu cầu các sở, ngành tiếp tục cải cách thủ tục hành chính, đẩy nhanh giải ngân "
+    "vốn đầu tư công và chăm lo đời sống người dân, đặc biệt là các hộ có hoàn cảnh khó khăn. "
+)
+WARMUP_TEXTS = [
+    _WARMUP_PARAGRAPH.split(". ")[0] + ".",
+    _WARMUP_PARAGRAPH * 3,
+    _WARMUP_PARAGRAPH * 20,
+]
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+logger.info("Using device: %s", device)
+
+# Trạng thái khởi động, dùng cho /healthz và /readyz
+state = {"status": "starting", "error": None, "load_seconds": None, "warmup_seconds": None}
+summarizer = None
+batcher = None
+incremental = None
+
+
+def load_model():
+    """
+    Loads the summarization model and the components built on it.
+    Safe to call more than once; only the first call loads.
+    """
+    global summarizer, batcher, incremental
+    if summarizer is not None:
+        return
+    state["status"] = "loading"
+    startup = time.perf_counter()
+    summarizer = Summarimer(
+        base_model=MERGED_MODEL or BASE_MODEL,
+        mmodel_name=None if MERGED_MODEL else PEFT_MODEL,
+        device=device,
+        chunk_batch_size=CHUNK_BATCH_SIZE,
+        max_batch_tokens=MAX_BATCH_TOKENS,
+        long_mode=LONG_MODE,
+        output_budget=OUTPUT_BUDGET,
+        max_decode_tokens=MAX_DECODE_TOKENS,
+        cache=SummaryCache(max_entries=CACHE_SIZE, path=CACHE_PATH) if CACHE_SIZE > 0 else None,
+        deterministic=DETERMINISTIC,
+        stream_batch_size=STREAM_BATCH_SIZE,
+        backend=INFERENCE_BACKEND,
+        onnx_dir=ONNX_DIR,
+        draft_model=DRAFT_MODEL,
+        draft_tokens=DRAFT_TOKENS,
+        adapters=ADAPTERS,
+        adapter_memory_mb=ADAPTER_MEMORY_MB,
+        encoder_cache=EncoderCache(max_bytes=int(ENCODER_CACHE_MB * 1024 * 1024)) if ENCODER_CACHE_MB > 0 else None,
+        workers=CPU_WORKERS,
+        compile_buckets=COMPILE_BUCKETS,
+        compile_batch_sizes=COMPILE_BATCH_SIZES,
+        static_cache_tokens=STATIC_CACHE_TOKENS,
+    )
+    batcher = MicroBatcher(
+        summarizer,
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait_ms=BATCH_MAX_WAIT_MS,
+        max_concurrent_batches=len(summarizer.workers.workers) if summarizer.workers is not None else 1,
+    )
+    incremental = IncrementalSummarizer(
+        summarizer,
+        max_threads=INCREMENTAL_MAX_THREADS,
+        single_pass=lambda text, **kwargs: batcher.submit(text, **kwargs).result(),
+    ) if INCREMENTAL_MAX_THREADS > 0 else None
+    state["load_seconds"] = round(time.perf_counter() - startup, 2)
+    logger.info("Model loaded successfully in %ss", state['load_seconds'])
+
 
-app = FastAPI()
+def prepare():
+    """
+    Loads the model (if not already loaded, e.g. by prefork.py) and runs warmup generations.
+    """
+    try:
+        load_model()
+        state["status"] = "warming_up"
+        start = time.perf_counter()
+        summarizer.warmup(WARMUP_TEXTS)
+        state["warmup_seconds"] = round(time.perf_counter() - start, 2)
+        state["status"] = "ready"
+        logger.info("Warmup finished in %ss, server is ready", state['warmup_seconds'])
+    except Exception as e:
+        state["status"] = "failed"
+        state["error"] = str(e)
+        logger.error("Model startup failed: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nạp mô hình ở thread nền để server nhận kết nối (và trả lời /healthz) ngay
+    threading.Thread(target=prepare, name="model-startup", daemon=True).start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def request_log_context(http_request: HTTPRequest, call_next):
+    """
+    Tags every record logged while serving a request with its id, and logs the response time.
+    """
+    request_id = http_request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    start = time.perf_counter()
+    with log_context(request_id=request_id):
+        response = await call_next(http_request)
+        logger.info("%s %s %d", http_request.method, http_request.url.path, response.status_code,
+                    extra={"duration_ms": round((time.perf_counter() - start) * 1000, 1)})
+    response.headers["X-Request-ID"] = request_id
+    return response
 
 
 class Request(BaseModel):
@@ -28,9 +207,17 @@ class Request(BaseModel):
     Attributes:
         thread_id (str): The ID of the thread.
         message (str): The text to summarize.
+        priority (str): 'interactive' requests are served before 'bulk' ones.
+        deadline_ms (int): Maximum time to wait for an inference slot, in milliseconds.
+        adapter (str): The LoRA adapter to summarize with (a name from ADAPTERS), None for PEFT_MODEL.
+        long_mode (str): How to summarize texts over the model window, None for LONG_MODE.
     """
     thread_id: str
     message: str
+    priority: Literal["interactive", "bulk"] = "interactive"
+    deadline_ms: Optional[int] = None
+    adapter: Optional[str] = None
+    long_mode: Optional[Literal["concat", "hierarchical", "extractive"]] = None
 
 class Response(BaseModel):
     """
@@ -43,23 +230,114 @@ class Response(BaseModel):
     role: str
     content: str
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-logger.info(f"Using device: {device}")
-# Load the summarization model
-summarizer = Summarimer(
-    base_model=BASE_MODEL,
-    mmodel_name=PEFT_MODEL,
-    framework="pt",
-    device=device
+admission = AdmissionController(
+    max_concurrency=MAX_CONCURRENCY,
+    max_queue=MAX_QUEUE,
+    timeout=REQUEST_TIMEOUT,
+)
+# Thread chạy phần suy luận của các request đã được cấp slot. Mỗi request giữ slot chỉ dùng một
+# thread mỗi lúc, nên MAX_CONCURRENCY thread là đủ và việc chờ slot không chiếm thread nào
+inference_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="inference")
+
+QUEUE_WAIT_SECONDS = metrics.histogram("summarimer_queue_wait_seconds", "Time a request waits for an inference slot.")
+metrics.gauge("summarimer_requests_in_flight", "Requests holding an inference slot.", callback=lambda: admission.running)
+metrics.gauge("summarimer_requests_queued", "Requests waiting for an inference slot.", callback=lambda: admission.queued)
+metrics.gauge(
+    "summarimer_encoder_cache_hit_rate", "Encoder state cache hit rate since startup.",
+    callback=lambda: summarizer.encoder_cache.stats()["hit_rate"] if summarizer is not None and summarizer.encoder_cache is not None else 0.0,
+)
+metrics.gauge(
+    "summarimer_encoder_cache_bytes", "Memory held by cached encoder states.",
+    callback=lambda: summarizer.encoder_cache.bytes if summarizer is not None and summarizer.encoder_cache is not None else 0,
 )
-logger.info("Model loaded successfully")
+metrics.gauge(
+    "summarimer_draft_acceptance_rate", "Share of draft model tokens accepted since startup.",
+    callback=lambda: summarizer.draft_acceptance_rate() if summarizer is not None else 0.0,
+)
+metrics.gauge(
+    "summarimer_worker_load", "Generate calls queued or running on the inference workers.",
+    callback=lambda: summarizer.workers.load() if summarizer is not None and summarizer.workers is not None else 0,
+)
+metrics.gauge(
+    "summarimer_cache_hit_rate", "Summary cache hit rate since startup.",
+    callback=lambda: summarizer.cache.stats()["hit_rate"] if summarizer is not None and summarizer.cache is not None else 0.0,
+)
+
+async def run_inference(fn, *args):
+    """
+    Runs blocking inference work on `inference_executor`, keeping the log context.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(inference_executor, context.run, fn, *args)
+
+async def admit(request: Request) -> float:
+    """
+    Waits for an inference slot, turning overload into an early HTTP error.
+
+    Args:
+        request (Request): The incoming request.
+
+    Returns:
+        float: The admission time, to be passed to `admission.release`.
+    """
+    if state["status"] != "ready":
+        raise HTTPException(status_code=503, detail="Model is not ready", headers={"Retry-After": "5"})
+    try:
+        summarizer.check_adapter(request.adapter)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    deadline = time.monotonic() + request.deadline_ms / 1000 if request.deadline_ms else None
+    start = time.monotonic()
+    try:
+        admitted_at = await admission.acquire_async(request.priority, deadline)
+        QUEUE_WAIT_SECONDS.observe(admitted_at - start, priority=request.priority)
+        return admitted_at
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
 
+@app.get("/healthz")
+def healthz():
+    """
+    Liveness: 200 while the process is up and serving HTTP, 503 once the model failed to load
+    so the orchestrator restarts it.
+    """
+    if state["status"] == "failed":
+        return JSONResponse(status_code=503, content={"status": "failed", "error": state["error"]})
+    return {"status": "alive", "model": state["status"]}
+
+@app.get("/readyz")
+def readyz():
+    """
+    Readiness: 200 only once the model is loaded and warmed up, 503 otherwise.
+    """
+    return JSONResponse(status_code=200 if state["status"] == "ready" else 503, content=state)
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Per-stage latency/size histograms and server gauges in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def summarize_request(request: Request) -> str:
+    """
+    Summarizes the message of an admitted request (blocking).
+    """
+    with log_context(thread_id=request.thread_id):
+        message = summarizer.preprocess(request.message) if PREPROCESS else request.message
+        if incremental is not None:
+            return incremental.summarize(request.thread_id, message, adapter=request.adapter,
+                                         long_mode=request.long_mode)
+        return batcher.submit(message, adapter=request.adapter, long_mode=request.long_mode).result()
+
 @app.post("/summary")
-def summarize_text(request: Request) -> Response:
+async def summarize_text(request: Request) -> Response:
     """
     Summarizes the given text using the loaded model.
     
@@ -69,13 +347,25 @@ def summarize_text(request: Request) -> Response:
     Returns:
         str: The summarized text.
     """
-    summary = summarizer.summarize(
-        request.message,
-        )
+    admitted_at = await admit(request)
+    try:
+        summary = await run_inference(summarize_request, request)
+    finally:
+        admission.release(admitted_at)
     return Response(content=summary, role='machine')
 
+def open_stream(request: Request, cancel_event: threading.Event):
+    """
+    Preprocesses the message of an admitted request and returns its summary stream (blocking).
+    """
+    with log_context(thread_id=request.thread_id):
+        message = summarizer.preprocess(request.message) if PREPROCESS else request.message
+    return iter_in_context(summarizer.summarize_stream(message, cancel_event=cancel_event, adapter=request.adapter,
+                                                       long_mode=request.long_mode),
+                           thread_id=request.thread_id)
+
 @app.post("/summary_stream")
-def summarize_text_stream(request: Request):
+async def summarize_text_stream(request: Request):
     """
     Summarizes the given text using the loaded model with streaming response.
     
@@ -85,11 +375,112 @@ def summarize_text_stream(request: Request):
     Returns:
         StreamingResponse: A streaming response with the summarized text.
     """
+    admitted_at = await admit(request)
+    cancel_event = threading.Event()
+    released = threading.Event()
+
+    def finish():
+        # Gọi từ finally của body, từ background task và khi dựng response lỗi: chỉ lần đầu có tác dụng.
+        # Body có thể không bao giờ chạy (client đi trước lần gửi đầu), khi đó background task trả slot
+        if not released.is_set():
+            released.set()
+            cancel_event.set()
+            admission.release(admitted_at)
+
+    try:
+        stream = await run_inference(open_stream, request, cancel_event)
+    except BaseException:
+        finish()
+        raise
+
+    async def generate():
+        # Giữ slot cho tới khi stream kết thúc; khi client ngắt kết nối, Starlette hủy
+        # generator này và cancel_event dừng việc sinh sau vài bước decode
+        completed = False
+        try:
+            while True:
+                token = await run_inference(next, stream, None)
+                if token is None:
+                    break
+                yield f"data: {token}\n\n"
+            completed = True
+        finally:
+            if not completed:
+                logger.info("Client disconnected, cancelling generation.")
+            finish()
+
+    try:
+        return StreamingResponse(generate(), media_type="text/event-stream", background=BackgroundTask(finish))
+    except BaseException:
+        finish()
+        raise
+
+def run_bulk_bucket(bucket: list) -> list:
+    """
+    Summarizes one bucket of a bulk request under a 'bulk' priority admission slot.
+
+    Args:
+        bucket (list): Dicts with `id` and `message`.
+
+    Returns:
+        list: Result dicts with `id` and either `summary` or `error`.
+    """
+    start = time.monotonic()
+    while True:
+        try:
+            admitted_at = admission.acquire("bulk", time.monotonic() + REQUEST_TIMEOUT)
+            break
+        except (Overloaded, DeadlineExceeded) as e:
+            # Job hàng loạt không bị từ chối, chỉ chờ tới lượt
+            time.sleep(e.retry_after)
+    QUEUE_WAIT_SECONDS.observe(admitted_at - start, priority="bulk")
+    try:
+        failed = []
+        if PREPROCESS:
+            cleaned = []
+            for item in bucket:
+                try:
+                    cleaned.append({**item, "message": summarizer.preprocess(item["message"])})
+                except Exception as e:
+                    logger.error("Bulk item %s failed in preprocessing: %s", item["id"], e)
+                    failed.append({"id": item["id"], "error": str(e)})
+            bucket = cleaned
+        return failed + (summarize_bucket(summarizer, bucket) if bucket else [])
+    finally:
+        admission.release(admitted_at)
+
+@app.post("/summary_batch")
+async def summarize_batch(http_request: HTTPRequest):
+    """
+    Summarizes many articles in one call.
+
+    The body is NDJSON (or a JSON array) of `{"id": ..., "message": ...}` items, with an optional
+    `adapter`. Items are bucketed by adapter and length, summarized in batches, and one NDJSON line per item is streamed back
+    as soon as its bucket finishes, so results arrive out of order, tagged by id.
+
+    Returns:
+        StreamingResponse: NDJSON lines `{"id": ..., "summary": ...}` or `{"id": ..., "error": ...}`.
+    """
+    if state["status"] != "ready":
+        raise HTTPException(status_code=503, detail="Model is not ready", headers={"Retry-After": "5"})
+    body = (await http_request.body()).decode("utf-8")
+    items = parse_items(body)
+    valid = [item for item in items if "message" in item]
+    invalid = [item for item in items if "message" not in item]
+    buckets = bucket_by_length(valid, BATCH_MAX_SIZE)
+    logger.info("Bulk request: %d items in %d buckets, %d invalid.", len(valid), len(buckets), len(invalid))
+
     def generate():
-        for token in summarizer.summarize_stream(request.message):
-            yield f"data: {token}\n\n"
+        for item in invalid:
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+        executor = ThreadPoolExecutor(max_workers=BULK_WORKERS)
+        try:
+            futures = [executor.submit(run_bulk_bucket, bucket) for bucket in buckets]
+            for future in as_completed(futures):
+                for result in future.result():
+                    yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            # Client ngắt kết nối: huỷ các bucket chưa chạy, không chờ các bucket đang chạy
+            executor.shutdown(wait=False, cancel_futures=True)
 
-    return StreamingResponse(
-        generate(), 
-        media_type="text/event-stream"
-    )
\ No newline at end of file
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
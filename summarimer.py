@@ -1,65 +1,446 @@
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, pipeline
-from peft import PeftModel
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
 
-from transformers import TextIteratorStreamer
+from transformers import TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
 import threading
+import time
+from contextlib import nullcontext
+import torch
+import torch.nn.functional as F
+from transformers.modeling_outputs import BaseModelOutput
 
-from config_log import get_logger
+import chunker
+import extractive
+import metrics
+import preprocess
+from adapters import AdapterManager
+from backends import build_model, manifest_digest, model_manifest
+from cache import make_key
+from compiled import CompiledGenerate, COMPILED_CALLS
+from engine import StreamingEngine
+from workers import WorkerPool, parse_layout
+from config_log import get_logger, SAMPLED
 logger = get_logger(__name__)
 
+# Số token tối đa mô hình nhận cho một lần encode
+MAX_INPUT_TOKENS = 1024
+# Văn bản ngắn hơn ngưỡng này được trả về nguyên văn
+MIN_SUMMARY_TOKENS = 100
+
+# Cách xử lý văn bản dài hơn MAX_INPUT_TOKENS
+LONG_MODES = ("concat", "hierarchical", "extractive")
+
+# Độ dài tối đa của tóm tắt từng chunk và mức tối thiểu khi phải co lại để vừa ngân sách decode
+CHUNK_SUMMARY_TOKENS = 256
+MIN_CHUNK_SUMMARY_TOKENS = 32
+
+# Tham số sinh cho văn bản vừa và cho từng chunk của văn bản dài
+GENERATION_KWARGS = dict(do_sample=True, temperature=0.3, repetition_penalty=1.2, top_p=0.9)
+CHUNK_GENERATION_KWARGS = dict(do_sample=True, temperature=0.5, repetition_penalty=1.2, top_p=0.9)
+# Giải mã greedy, cho kết quả tái lập được (dùng khi cần cache ổn định)
+DETERMINISTIC_GENERATION_KWARGS = dict(do_sample=False, repetition_penalty=1.2)
+
+# Số đo theo từng giai đoạn của summarize/summarize_stream, xuất ra ở /metrics
+INPUT_TOKENS = metrics.histogram("summarimer_input_tokens", "Input length in tokens, by length route.", metrics.TOKEN_BUCKETS)
+CHUNKS = metrics.histogram("summarimer_chunks", "Number of chunks a long input is split into.", metrics.COUNT_BUCKETS)
+TOKENIZE_SECONDS = metrics.histogram("summarimer_tokenize_seconds", "Time spent tokenizing an input.")
+ENCODER_SECONDS = metrics.histogram("summarimer_encoder_seconds", "Time spent in the encoder forward pass.")
+DECODE_SECONDS = metrics.histogram("summarimer_decode_seconds", "Time spent in generate outside the encoder.")
+GENERATED_TOKENS = metrics.histogram("summarimer_generated_tokens", "Tokens generated per sequence.", metrics.TOKEN_BUCKETS)
+TTFT_SECONDS = metrics.histogram("summarimer_time_to_first_token_seconds", "Streaming time to the first text chunk.")
+TOKENS_PER_SECOND = metrics.histogram("summarimer_stream_tokens_per_second", "Streaming generation rate.", metrics.RATE_BUCKETS)
+DRAFT_PROPOSED = metrics.counter("summarimer_draft_proposed_tokens_total", "Tokens proposed by the draft model.")
+DRAFT_ACCEPTED = metrics.counter("summarimer_draft_accepted_tokens_total", "Draft tokens accepted by the main model.")
+PREPROCESS_SECONDS = metrics.histogram("summarimer_preprocess_seconds", "Time spent normalizing an input.")
+PREPROCESS_CHARS_SAVED = metrics.histogram(
+    "summarimer_preprocess_chars_saved", "Characters removed from an input by normalization.", metrics.TOKEN_BUCKETS)
+
+
+def route_of(token_len: int) -> str:
+    """
+    Names the length branch `summarize` takes for an input of `token_len` tokens.
+    """
+    if token_len < MIN_SUMMARY_TOKENS:
+        return "short"
+    return "medium" if token_len <= MAX_INPUT_TOKENS else "long"
+
+
+class CancelCriteria(StoppingCriteria):
+    """
+    Stops generation at the next decode step once the given event is set.
+    """
+
+    def __init__(self, cancel_event: threading.Event):
+        self.cancel_event = cancel_event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.cancel_event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+class CountingStreamer(TextIteratorStreamer):
+    """
+    A TextIteratorStreamer that also counts the generated tokens.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.generated = 0
+        self._prompt_seen = False
+
+    def put(self, value):
+        # Lần put đầu tiên là prompt (decoder_start_token), bỏ qua giống skip_prompt
+        if self._prompt_seen:
+            self.generated += value.numel()
+        self._prompt_seen = True
+        super().put(value)
 
 
 class Summarimer:
-    def __init__(self, base_model: str, mmodel_name : str, device: str , framework : str = 'pt'):
-        self.base_model = AutoModelForSeq2SeqLM.from_pretrained(base_model)
-        self.model = PeftModel.from_pretrained(self.base_model, mmodel_name)
+    def __init__(self, base_model: str, mmodel_name : str, device: str ,
+                 chunk_batch_size: int = 1, max_batch_tokens: int = 8192,
+                 long_mode: str = "concat", output_budget: int = 256, max_decode_tokens: int = None,
+                 cache=None, deterministic: bool = False, stream_batch_size: int = 0,
+                 backend: str = "peft", onnx_dir: str = None,
+                 draft_model: str = None, draft_tokens: int = 5,
+                 adapters: dict = None, adapter_memory_mb: float = 256, encoder_cache=None,
+                 workers: str = None, compile_buckets: list = None, compile_batch_sizes: list = (1,),
+                 static_cache_tokens: int = 512):
+        # Lượt tóm tắt cuối luôn chạy: ngân sách decode phải đủ cho nó (kiểm tra trước khi nạp trọng số)
+        if max_decode_tokens is not None and max_decode_tokens < output_budget:
+            raise ValueError(f"max_decode_tokens ({max_decode_tokens}) must be at least output_budget ({output_budget})")
+        start = time.perf_counter()
+        # mmodel_name=None: `base_model` là snapshot đã gộp LoRA (bake.py), nạp bằng mmap từ safetensors
+        self.base_model = AutoModelForSeq2SeqLM.from_pretrained(base_model, low_cpu_mem_usage=True)
+        load_time = time.perf_counter() - start
+        # Backend suy luận: "peft" (fp32), "int8" (gộp LoRA + lượng tử hóa động) hoặc "onnx"
+        self.backend = backend
+        self.model = build_model(self.base_model, mmodel_name, backend, device, onnx_dir=onnx_dir)
         self.device = device
-        self.tokenizer = AutoTokenizer.from_pretrained(mmodel_name)
-        self.summarizer = pipeline(   
-                task="summarization",
-                model= self.model,
-                tokenizer= self.tokenizer,
-                framework = framework,
-                )
+        # Gồm cả dấu vân tay trọng số: mô hình huấn luyện lại tại chỗ không dùng lại cache cũ
+        self.model_id = (f"{base_model}+{mmodel_name}:{backend}"
+                         f"@{manifest_digest(model_manifest(self.base_model, mmodel_name))}")
+        self.tokenizer = AutoTokenizer.from_pretrained(mmodel_name or base_model)
+        logger.info("Summarimer ready in %.2fs (weights %.2fs, adapter=%s, backend=%s).",
+                    time.perf_counter() - start, load_time,
+                    'merged snapshot' if mmodel_name is None else mmodel_name, backend)
+        # Số chunk tối đa mỗi lần generate và giới hạn tổng số token (batch x độ dài) của một batch
+        self.chunk_batch_size = max(1, chunk_batch_size)
+        self.max_batch_tokens = max_batch_tokens
+        # Chế độ xử lý văn bản dài: "concat" nối tóm tắt các chunk, "hierarchical" tóm tắt
+        # lại đệ quy tới khi vừa `output_budget` token, tổng số token sinh không vượt `max_decode_tokens`,
+        # "extractive" chọn các câu quan trọng nhất vừa một lượt encode rồi tóm tắt một lần.
+        # Có thể chọn lại theo từng request
+        if long_mode not in LONG_MODES:
+            raise ValueError(f"Unknown long_mode: {long_mode}")
+        self.long_mode = long_mode
+        self.output_budget = output_budget
+        self.max_decode_tokens = max_decode_tokens
+        # Cache tóm tắt (cache.SummaryCache) đặt trước summarize/summarize_stream
+        self.cache = cache
+        # Cache trạng thái encoder (cache.EncoderCache): cùng đầu vào với tham số decode khác thì bỏ qua encoder.
+        # ONNX Runtime tự chạy encoder bên trong generate nên không dùng được
+        self.encoder_cache = encoder_cache if backend != "onnx" else None
+        self.generation_kwargs = DETERMINISTIC_GENERATION_KWARGS if deterministic else GENERATION_KWARGS
+        self.chunk_generation_kwargs = DETERMINISTIC_GENERATION_KWARGS if deterministic else CHUNK_GENERATION_KWARGS
+        # Continuous batching cho streaming (0 = mỗi request một thread generate riêng)
+        self.engine = None
+        if stream_batch_size > 0:
+            if adapters:
+                # Vòng decode chung của engine chạy liên tục, không nhường model khi phải đổi adapter
+                logger.warning("Continuous batching is disabled when several adapters are served.")
+            elif backend != "onnx" and StreamingEngine.supports(self.model.config):
+                self.engine = StreamingEngine(self.model, self.tokenizer, device, max_batch_size=stream_batch_size)
+            else:
+                logger.warning("Continuous batching is not supported for model type %s, "
+                               "streaming with per-request threads.", self.model.config.model_type)
+        prefix = getattr(self.model.config, "prefix", None) or ""
+        self.prefix_ids = self.tokenizer(prefix, add_special_tokens=False)["input_ids"] if prefix else []
+        self._encoder_timing = threading.local()
+        self._instrument_encoder()
+        # Các LoRA adapter khác nạp theo yêu cầu trên cùng mô hình nền, chọn theo từng request
+        self.adapters = None
+        if adapters:
+            if backend != "peft" or not mmodel_name:
+                raise ValueError("Multiple adapters need the peft backend with PEFT_MODEL, not a merged model")
+            self.adapters = AdapterManager(self.model, adapters, memory_budget_mb=adapter_memory_mb)
+        # Assisted decoding: mô hình draft nhỏ đề xuất token, mô hình chính kiểm tra trong một lượt forward
+        self.draft = None
+        self._decoder_calls = threading.local()
+        if draft_model:
+            self._load_draft(draft_model, draft_tokens)
+        # Worker suy luận gắn với từng nhóm core, mỗi worker có số thread torch riêng (vd "4x8"; None: chạy
+        # generate ngay trên thread gọi). Engine continuous batching vẫn chạy trên thread riêng của nó
+        self.workers = WorkerPool(parse_layout(workers)) if workers else None
+        # Chế độ compile: đầu vào được pad tới các bucket độ dài `compile_buckets`, decoder dùng static cache
+        # `static_cache_tokens` vị trí, encoder và bước decode chạy bằng torch.compile (compile trong `warmup`)
+        self.compiled = None
+        if compile_buckets:
+            if backend != "peft" or self.adapters is not None or self.draft is not None:
+                logger.warning("Compiled generation needs the peft backend without extra adapters or a draft model, "
+                               "generating eagerly.")
+            else:
+                self.compiled = CompiledGenerate(self.model, device, self.tokenizer.pad_token_id, self.tokenizer.padding_side,
+                                                 compile_buckets, compile_batch_sizes, static_cache_tokens)
+
+    def _load_draft(self, draft_model: str, draft_tokens: int):
+        """
+        Loads the draft model used for assisted generation and counts the decoder passes of
+        both models to measure how many proposed tokens are accepted.
+        parameters:
+            draft_model (str): A small seq2seq model sharing the tokenizer of the main model.
+            draft_tokens (int): The number of tokens the draft proposes per verification step.
+        """
+        if self.backend == "onnx":
+            logger.warning("Assisted decoding is not supported by the onnx backend, ignoring the draft model.")
+            return
+        if AutoTokenizer.from_pretrained(draft_model).get_vocab() != self.tokenizer.get_vocab():
+            raise ValueError(f"Draft model {draft_model} must share the tokenizer of the main model")
+        self.draft = AutoModelForSeq2SeqLM.from_pretrained(draft_model, low_cpu_mem_usage=True).to(self.device).eval()
+        self.draft.generation_config.num_assistant_tokens = draft_tokens
+        calls = self._decoder_calls
+
+        def count(name):
+            def hook(module, args, output):
+                setattr(calls, name, getattr(calls, name, 0) + 1)
+            return hook
+
+        self.model.get_decoder().register_forward_hook(count("main"))
+        self.draft.get_decoder().register_forward_hook(count("draft"))
+        logger.info("Assisted decoding with draft model %s (%d tokens per step).", draft_model, draft_tokens)
+        if self.engine is not None:
+            logger.info("Streaming uses continuous batching, which decodes without the draft model.")
+
+    def _encoder_outputs(self, batch_ids: list, width: int, adapter: str = None):
+        """
+        Builds the encoder outputs of a padded batch from the encoder cache, running the encoder
+        only on the sequences that are not cached yet.
+        parameters:
+            batch_ids (list): The input ids of each sequence.
+            width (int): The padded length of the batch.
+            adapter (str): The adapter active for the call, None for the default one.
+        returns:
+            BaseModelOutput | None: The outputs to pass to `generate`, or None when there is no encoder cache.
+        """
+        if self.encoder_cache is None or batch_ids is None:
+            return None
+        model_id = self.model_identity(adapter)
+        keys = [self.encoder_cache.key(model_id, ids) for ids in batch_ids]
+        states = [self.encoder_cache.get(key) for key in keys]
+        missing = [i for i, state in enumerate(states) if state is None]
+        left = self.tokenizer.padding_side == "left"
+        if missing:
+            compiled = self.compiled is not None and self.compiled.is_active()
+            # Trong chế độ compile, encoder chỉ chạy bản compile khi cả batch (đã pad theo bucket) đều chưa có trong cache
+            padding = dict(padding="max_length", max_length=width) if compiled else {}
+            inputs = self.tokenizer.pad({"input_ids": [batch_ids[i] for i in missing]}, return_tensors="pt",
+                                        **padding).to(self.device)
+            with torch.no_grad(), self.compiled.active(len(missing) == len(batch_ids)) if compiled else nullcontext():
+                hidden = self.model.get_encoder()(**inputs, return_dict=True).last_hidden_state
+            for row, i in enumerate(missing):
+                length = len(batch_ids[i])
+                states[i] = (hidden[row, -length:] if left else hidden[row, :length]).clone()
+                self.encoder_cache.put(keys[i], states[i])
+        padded = [F.pad(state, (0, 0, width - len(state), 0) if left else (0, 0, 0, width - len(state))) for state in states]
+        return BaseModelOutput(last_hidden_state=torch.stack(padded))
+
+    def _generate(self, adapter: str = None, batch_ids: list = None, **kwargs):
+        """
+        Calls `generate` with `adapter` (None for the default one) active for the whole call.
+        `batch_ids` (the unpadded input ids) enables the encoder cache.
+        """
+        self.check_adapter(adapter)
+        # Hook của encoder ghi thời gian vào thread đang chạy generate (thread stream hoặc một worker)
+        self._encoder_timing.total = 0.0
+        start = time.perf_counter()
+        if self.adapters is None:
+            outputs = self._run_generate(adapter, batch_ids, **kwargs)
+        else:
+            with self.adapters.use(adapter):
+                outputs = self._run_generate(adapter, batch_ids, **kwargs)
+        DECODE_SECONDS.observe(time.perf_counter() - start - self._encoder_timing.total)
+        return outputs
+
+    def _run_generate(self, adapter: str, batch_ids: list, **kwargs):
+        """
+        Calls `generate`, reusing cached encoder states and with the draft model as assistant
+        when one is configured. In compiled mode, calls with a warmed-up shape are padded to it.
+        """
+        if self.compiled is not None:
+            rows = kwargs["input_ids"].shape[0]
+            plan = self.compiled.plan(rows, kwargs["input_ids"].shape[1], kwargs["max_new_tokens"])
+            if plan is not None and "streamer" in kwargs and plan[0] != rows:
+                # Streamer chỉ nhận batch size 1, không thêm hàng pad
+                plan = None
+            COMPILED_CALLS.inc(path="eager" if plan is None else "compiled")
+            if plan is not None:
+                kwargs, batch_ids = self.compiled.pad(kwargs, batch_ids, plan)
+                with self.compiled.active():
+                    encoder_outputs = self._encoder_outputs(batch_ids, kwargs["input_ids"].shape[1], adapter)
+                    if encoder_outputs is not None:
+                        kwargs["encoder_outputs"] = encoder_outputs
+                    return self.model.generate(**self.compiled.generate_kwargs(kwargs))[:rows]
+        encoder_outputs = self._encoder_outputs(batch_ids, kwargs["input_ids"].shape[1], adapter)
+        if encoder_outputs is not None:
+            kwargs["encoder_outputs"] = encoder_outputs
+        if self.draft is None:
+            return self.model.generate(**kwargs)
+        calls = self._decoder_calls
+        calls.main = calls.draft = 0
+        outputs = self.model.generate(**kwargs, assistant_model=self.draft)
+        # Mỗi lượt kiểm tra của mô hình chính nhận các token draft đúng và thêm một token của chính nó
+        generated = outputs.shape[1] - 1
+        DRAFT_PROPOSED.inc(calls.draft)
+        DRAFT_ACCEPTED.inc(max(0, min(calls.draft, generated - calls.main)))
+        return outputs
+
+    def model_identity(self, adapter: str = None) -> str:
+        """
+        Identifies the weights used with `adapter`, for cache keys.
+        """
+        return self.model_id if adapter is None else f"{self.model_id}+{adapter}={self.adapters.paths[adapter]}"
+
+    def check_adapter(self, adapter: str):
+        """
+        Raises ValueError if `adapter` is neither None (the default adapter) nor a configured adapter name.
+        """
+        if adapter is not None and (self.adapters is None or adapter not in self.adapters.paths):
+            raise ValueError(f"Unknown adapter: {adapter}")
+
+    def draft_acceptance_rate(self) -> float:
+        """
+        Returns the share of draft tokens accepted by the main model since startup.
+        """
+        proposed = DRAFT_PROPOSED.value()
+        return DRAFT_ACCEPTED.value() / proposed if proposed else 0.0
+
+    def _instrument_encoder(self):
+        """
+        Times every encoder forward pass with hooks, so generate calls (batched, streamed or
+        run by the streaming engine) report encoder and decode time separately.
+        """
+        get_encoder = getattr(self.model, "get_encoder", None)
+        encoder = get_encoder() if get_encoder is not None else None
+        if not isinstance(encoder, torch.nn.Module):
+            # ONNX Runtime: encoder không phải module torch, chỉ đo tổng thời gian generate
+            return
+        timing = self._encoder_timing
+
+        def before(module, args):
+            timing.start = time.perf_counter()
+
+        def after(module, args, output):
+            elapsed = time.perf_counter() - timing.start
+            timing.total = getattr(timing, "total", 0.0) + elapsed
+            ENCODER_SECONDS.observe(elapsed)
+
+        encoder.register_forward_pre_hook(before)
+        encoder.register_forward_hook(after)
     
-    def estimate_max_length(self, text: str, max_cap: int, ratio: float ) -> int:
+    def preprocess(self, text: str) -> str:
+        """
+        Normalizes a raw request text (NFC, HTML, whitespace, news boilerplate) before summarization.
+
+        Args:
+            text (str): The raw text.
+
+        Returns:
+            str: The normalized text.
+        """
+        start = time.perf_counter()
+        normalized = preprocess.normalize(text)
+        PREPROCESS_SECONDS.observe(time.perf_counter() - start)
+        # Đếm ký tự thay vì token: không tokenize cả văn bản thêm hai lần cho mỗi request
+        saved = max(len(text) - len(normalized), 0)
+        PREPROCESS_CHARS_SAVED.observe(saved)
+        if saved:
+            logger.info("Preprocessing removed %d characters (%d -> %d).", saved, len(text), len(normalized))
+        return normalized
+
+    def encode(self, text: str) -> chunker.Encoding:
+        """
+        Tokenizes the text once with the model tokenizer.
+
+        Args:
+            text (str): The text to encode.
+
+        Returns:
+            chunker.Encoding: The token ids and sentence boundaries.
+        """
+        start = time.perf_counter()
+        encoding = chunker.encode(self.tokenizer, text)
+        TOKENIZE_SECONDS.observe(time.perf_counter() - start)
+        return encoding
+
+    def estimate_max_length(self, text: str, max_cap: int, ratio: float, token_len: int = None) -> int:
         """
         Estimates the maximum length of the text.
         
         Args:
             text (str): The text to estimate the length for.
+            token_len (int): The token count of `text`, if already known.
         
         Returns:
             int: The estimated maximum length.
         """
-        length_text = int(len(text.split()) * 1.5 * ratio) if int(len(text.split()) * 1.5 * ratio) else int(len(text.split()) * 1.5 )
+        if token_len is None:
+            token_len = len(self.encode(text).ids)
+        length_text = int(token_len * ratio) if int(token_len * ratio) else token_len
         return min(length_text, max_cap)
 
-    def split_into_chunks(self, text: str, max_tokens: int) -> list:
+    def split_into_chunks(self, text: str, max_tokens: int, encoding: chunker.Encoding = None) -> list:
         """
         Splits the text into chunks based on the maximum number of tokens.
         parameters:
             text (str): The text to split.
-            max_tokens (int): The maximum number of tokens per chunk.
+            max_tokens (int): The maximum number of model input tokens per chunk.
+            encoding (chunker.Encoding): The output of `encode` for `text`, if already computed.
         returns:
-            list: A list of text chunks.
-        """
-        sentences = text.split('. ')
-        chunks, current_chunk = [], []
-
-        current_len = 0
-        for sentence in sentences:
-            token_len = int(len(sentence.split())  * 1.5 )
-            if current_len + token_len > max_tokens:
-                chunks.append('. '.join(current_chunk))
-                current_chunk = [sentence]
-                current_len = token_len
-            else:
-                current_chunk.append(sentence)
-                current_len += token_len
-        if current_chunk:
-            chunks.append('. '.join(current_chunk))
-        return chunks
+            list: A list of `chunker.Chunk` carrying the chunk text and its input ids.
+        """
+        if encoding is None:
+            encoding = self.encode(text)
+        return chunker.pack(self.tokenizer, text, encoding, max_tokens, prefix_ids=self.prefix_ids)
+
+    def input_ids(self, encoding: chunker.Encoding) -> list:
+        """
+        Builds model-ready input ids for a document that fits in one encoder pass.
+        parameters:
+            encoding (chunker.Encoding): The encoded document.
+        returns:
+            list: The input ids, with the task prefix and special tokens.
+        """
+        budget = MAX_INPUT_TOKENS - self.tokenizer.num_special_tokens_to_add(False) - len(self.prefix_ids)
+        return self.prefix_ids + self.tokenizer.build_inputs_with_special_tokens(encoding.ids[:budget])
+
+    def extract(self, text: str, encoding: chunker.Encoding) -> chunker.Chunk:
+        """
+        Keeps the most informative sentences of a long document that fit one encoder pass.
+        parameters:
+            text (str): The document.
+            encoding (chunker.Encoding): The output of `encode` for `text`.
+        returns:
+            chunker.Chunk: The selected sentences, in document order, with model-ready input ids.
+        """
+        budget = MAX_INPUT_TOKENS - self.tokenizer.num_special_tokens_to_add(False) - len(self.prefix_ids)
+        selected = [encoding.sentences[i] for i in extractive.select_sentences(encoding, budget)]
+        ids = [token for _, _, tok_start, tok_end in selected for token in encoding.ids[tok_start:tok_end]]
+        if not ids:
+            # Không câu nào vừa ngân sách (câu đầu quá dài): giữ phần đầu văn bản như chế độ cắt bớt
+            return chunker.Chunk(text, self.input_ids(encoding))
+        logger.info("Extracted %d of %d sentences (%d of %d tokens).",
+                    len(selected), len(encoding.sentences), len(ids), len(encoding.ids))
+        return chunker.Chunk(
+            " ".join(text[char_start:char_end].strip() for char_start, char_end, _, _ in selected),
+            self.prefix_ids + self.tokenizer.build_inputs_with_special_tokens(ids),
+        )
+
+    def resolve_long_mode(self, long_mode: str = None) -> str:
+        """
+        Returns the long-document mode of a request, defaulting to the one set at construction.
+        """
+        long_mode = long_mode or self.long_mode
+        if long_mode not in LONG_MODES:
+            raise ValueError(f"Unknown long_mode: {long_mode}")
+        return long_mode
 
     def join_summaries(self, summaries: list) -> str:
         """
@@ -71,114 +452,509 @@ class Summarimer:
         """
         return ' '.join(summaries)
 
-    def summarize(self, text: str, max_cap: int = 512 , ratio : float = 0.7) -> str:
+    def _model_inputs(self, input_ids: list) -> dict:
+        """
+        Wraps the input ids of a single sequence as generate-ready tensors.
+        parameters:
+            input_ids (list): The input ids.
+        returns:
+            dict: `input_ids` and `attention_mask` tensors on the model device.
+        """
+        ids = torch.tensor([input_ids], device=self.device)
+        return {"input_ids": ids, "attention_mask": torch.ones_like(ids)}
+
+    def _generate_batch(self, batch_ids: list, max_new_tokens: list, adapter: str = None, **gen_kwargs) -> list:
+        """
+        Runs a single padded, batched generate call over already encoded inputs.
+        parameters:
+            batch_ids (list): The input ids of each sequence.
+            max_new_tokens (list): Per-sequence generation limits, aligned with `batch_ids`.
+            adapter (str): The named adapter to generate with, None for the default one.
+            **gen_kwargs: Extra sampling arguments forwarded to `generate`.
+        returns:
+            list: The decoded summaries, in the same order as `batch_ids`.
+        """
+        if self.draft is not None and len(batch_ids) > 1:
+            # Assisted generation chỉ chạy với batch size 1: sinh lần lượt từng chuỗi
+            return [self._generate_batch([ids], [limit], adapter, **gen_kwargs)[0] for ids, limit in zip(batch_ids, max_new_tokens)]
+        inputs = self.tokenizer.pad({"input_ids": batch_ids}, return_tensors="pt").to(self.device)
+
+        def run():
+            return self._generate(adapter, batch_ids, **inputs, max_new_tokens=max(max_new_tokens), **gen_kwargs)
+
+        outputs = self.workers.run(run) if self.workers is not None else run()
+
+        summaries = []
+        for output, limit in zip(outputs, max_new_tokens):
+            # Bỏ decoder_start_token và cắt theo giới hạn riêng của từng văn bản,
+            # tương đương với việc gọi generate riêng với max_new_tokens=limit
+            tokens = output[1:limit + 1]
+            GENERATED_TOKENS.observe(int((tokens != self.tokenizer.pad_token_id).sum()))
+            summaries.append(self.tokenizer.decode(tokens, skip_special_tokens=True).strip())
+        return summaries
+
+    def batch_chunks(self, chunks: list) -> list:
+        """
+        Groups consecutive chunks into generate batches.
+        parameters:
+            chunks (list): The chunks to group.
+        returns:
+            list: A list of batches, each a list of chunks, keeping the original order.
+        """
+        batches, current, current_max = [], [], 0
+        for chunk in chunks:
+            token_len = len(chunk.input_ids)
+            padded_len = max(current_max, token_len)
+            # Batch được pad tới chunk dài nhất nên chi phí bộ nhớ là số chunk x độ dài lớn nhất
+            if current and (len(current) >= self.chunk_batch_size
+                            or padded_len * (len(current) + 1) > self.max_batch_tokens):
+                batches.append(current)
+                current, padded_len = [], token_len
+            current.append(chunk)
+            current_max = padded_len
+        if current:
+            batches.append(current)
+        return batches
+
+    def summarize_chunks(self, chunks: list, max_new_tokens: int = 256, adapter: str = None,
+                         cancel_event: threading.Event = None) -> list:
+        """
+        Summarizes the chunks of a long document, `chunk_batch_size` chunks per generate call.
+        parameters:
+            chunks (list): The `chunker.Chunk` list to summarize.
+            max_new_tokens (int): The generation limit for each chunk.
+            adapter (str): The named adapter to generate with, None for the default one.
+            cancel_event (threading.Event): Stops generation and skips the remaining batches when set.
+        returns:
+            list: The chunk summaries, in the same order as `chunks` (only the first ones if cancelled).
+        """
+        stopping = {}
+        if cancel_event is not None:
+            stopping["stopping_criteria"] = StoppingCriteriaList([CancelCriteria(cancel_event)])
+        summaries = []
+        for batch in self.batch_chunks(chunks):
+            if cancel_event is not None and cancel_event.is_set():
+                logger.info("Cancelled, skipping %d remaining chunks.", len(chunks) - len(summaries))
+                break
+            summaries.extend(self._generate_batch(
+                [chunk.input_ids for chunk in batch],
+                [max_new_tokens] * len(batch),
+                adapter,
+                **self.chunk_generation_kwargs,
+                **stopping,
+            ))
+        return summaries
+
+    def plan_decode_budget(self, n_chunks: int) -> tuple:
+        """
+        Plans the map-reduce levels for a long document before any generation runs.
+        parameters:
+            n_chunks (int): The number of first-level chunks.
+        returns:
+            tuple: `(chunk_tokens, levels, total, kept)` - the per-chunk summary length, the
+            number of intermediate levels, the upper bound on generated tokens for the document
+            (at most `max_decode_tokens`) and how many leading chunks are summarized.
+        """
+        window = MAX_INPUT_TOKENS - self.tokenizer.num_special_tokens_to_add(False) - len(self.prefix_ids)
+        # Mỗi nhóm phải gộp được ít nhất 2 tóm tắt để số chunk giảm qua từng tầng
+        chunk_tokens = min(CHUNK_SUMMARY_TOKENS, window // 2)
+        while True:
+            levels, total = self._plan_levels(n_chunks, chunk_tokens, window)
+            if self.max_decode_tokens is None or total <= self.max_decode_tokens:
+                return chunk_tokens, levels, total, n_chunks
+            if chunk_tokens <= MIN_CHUNK_SUMMARY_TOKENS:
+                break
+            chunk_tokens = max(MIN_CHUNK_SUMMARY_TOKENS, chunk_tokens // 2)
+        # Tóm tắt ngắn nhất vẫn vượt ngân sách: chỉ giữ các chunk đầu (phần quan trọng nhất của bài báo).
+        # Với một chunk tổng là output_budget, luôn nằm trong ngân sách (kiểm tra ở __init__)
+        kept = n_chunks - 1
+        while kept > 1 and self._plan_levels(kept, chunk_tokens, window)[1] > self.max_decode_tokens:
+            kept -= 1
+        return self.plan_decode_budget(kept)
+
+    def _plan_levels(self, n_chunks: int, chunk_tokens: int, window: int) -> tuple:
+        fan_in = window // chunk_tokens
+        levels, n, total = 0, n_chunks, self.output_budget
+        while n > 1:
+            total += n * chunk_tokens
+            n = -(-n // fan_in)
+            levels += 1
+        return levels, total
+
+    def reduce_chunks(self, chunks: list, adapter: str = None, summaries: list = None,
+                      cancel_event: threading.Event = None) -> chunker.Chunk:
+        """
+        Summarizes and regroups chunk summaries level by level until they fit one encoder pass.
+        parameters:
+            chunks (list): The first-level `chunker.Chunk` list.
+            adapter (str): The named adapter to generate with, None for the default one.
+            summaries (list): The first-level summaries, if already generated with the per-chunk
+                length of `plan_decode_budget(len(chunks))` for its kept chunks.
+            cancel_event (threading.Event): Stops the reduction between and during generate calls
+                when set; the returned chunk is then meaningless.
+        returns:
+            chunker.Chunk: The input for the final summarization pass.
+        """
+        chunk_tokens, levels, total, kept = self.plan_decode_budget(len(chunks))
+        if kept < len(chunks):
+            logger.warning("Decode budget too small for %d chunks, summarizing the first %d.", len(chunks), kept)
+            chunks = chunks[:kept]
+            summaries = summaries[:kept] if summaries is not None else None
+        logger.info("Hierarchical plan: %d chunks, %d levels, %d tokens per chunk summary, "
+                    "at most %d generated tokens.", len(chunks), levels, chunk_tokens, total)
+        # Số token còn được phép sinh cho các tầng trung gian (phần còn lại dành cho lượt cuối)
+        remaining = total - self.output_budget
+        for level in range(levels):
+            if len(chunks) <= 1:
+                break
+            level_tokens = min(chunk_tokens, remaining // len(chunks))
+            if level_tokens < MIN_CHUNK_SUMMARY_TOKENS:
+                break
+            if level > 0 or summaries is None:
+                summaries = self.summarize_chunks(chunks, max_new_tokens=level_tokens, adapter=adapter,
+                                                  cancel_event=cancel_event)
+            if cancel_event is not None and cancel_event.is_set():
+                return chunks[0]
+            remaining -= level_tokens * len(chunks)
+            joined = self.join_summaries(summaries)
+            chunks = self.split_into_chunks(joined, max_tokens=MAX_INPUT_TOKENS)
+            logger.info("Level %d: reduced to %d chunks.", level + 1, len(chunks))
+
+        if len(chunks) > 1:
+            # Hết ngân sách: lượt cuối dùng phần đầu vừa cửa sổ mô hình
+            logger.warning("Decode budget exhausted with %d chunks left, truncating the final input.", len(chunks))
+            joined = self.join_summaries([chunk.text for chunk in chunks])
+            return chunker.Chunk(joined, self.input_ids(self.encode(joined)))
+        return chunks[0]
+
+    def summarize_batch(self, texts: list, max_cap: int = 512, ratio: float = 0.7, adapter: str = None,
+                        long_mode: str = None, encodings: list = None) -> list:
+        """
+        Summarizes several texts at once, batching the ones in the summarization range
+        (and, in extractive mode, the extracts of long ones) into a single padded generate call.
+
+        Args:
+            texts (list): The texts to summarize.
+            adapter (str): The named adapter to use for every text, None for the default one.
+            long_mode (str): One of `LONG_MODES`, None for the default one.
+            encodings (list): The `encode` output of each text if already computed, None entries
+                for the ones still to encode.
+
+        Returns:
+            list: The summaries, in the same order as `texts`.
+        """
+        self.check_adapter(adapter)
+        long_mode = self.resolve_long_mode(long_mode)
+        results = [None] * len(texts)
+        keys = [self.cache_key(text, max_cap, ratio, adapter, long_mode) for text in texts] if self.cache is not None else None
+        batch_idx, batch_ids, batch_lengths = [], [], []
+        for i, text in enumerate(texts):
+            if keys is not None:
+                results[i] = self.cache.get(keys[i])
+                if results[i] is not None:
+                    continue
+            encoding = encodings[i] if encodings is not None and encodings[i] is not None else self.encode(text)
+            tokenized_len = len(encoding.ids)
+            if MIN_SUMMARY_TOKENS <= tokenized_len <= MAX_INPUT_TOKENS:
+                INPUT_TOKENS.observe(tokenized_len, route="medium")
+                max_length = self.estimate_max_length(text, max_cap=max_cap, ratio=ratio, token_len=tokenized_len)
+                if max_length <= 0:
+                    raise ValueError("max_length must be greater than 0")
+                batch_idx.append(i)
+                batch_ids.append(self.input_ids(encoding))
+                batch_lengths.append(max_length)
+            elif tokenized_len > MAX_INPUT_TOKENS and long_mode == "extractive":
+                INPUT_TOKENS.observe(tokenized_len, route="long")
+                extract = self.extract(text, encoding)
+                batch_idx.append(i)
+                batch_ids.append(extract.input_ids)
+                batch_lengths.append(self.estimate_max_length(extract.text, max_cap, ratio, token_len=len(extract.input_ids)))
+            else:
+                # Văn bản quá ngắn hoặc quá dài đi theo luồng xử lý thông thường
+                results[i] = self._summarize(text, max_cap=max_cap, ratio=ratio, encoding=encoding, adapter=adapter,
+                                             long_mode=long_mode)
+                if keys is not None:
+                    self.cache.put(keys[i], results[i])
+
+        if batch_idx:
+            logger.info("Summarizing a batch of %d texts in one generate call.", len(batch_idx))
+            summaries = self._generate_batch(batch_ids, batch_lengths, adapter, **self.generation_kwargs)
+            for i, summary in zip(batch_idx, summaries):
+                results[i] = summary
+                if keys is not None:
+                    self.cache.put(keys[i], summary)
+        return results
+
+    def warmup(self, texts: list):
+        """
+        Runs throwaway summarizations so the first real request does not pay for lazy
+        initialization. The cache is bypassed.
+
+        Args:
+            texts (list): Representative inputs, ideally covering every length branch.
+                The last one is also streamed to warm up the streaming path.
+        """
+        if self.compiled is not None:
+            ids = self.tokenizer(texts[0], add_special_tokens=False)["input_ids"]
+            compile_all = lambda: self.compiled.warmup(lambda **kwargs: self.model.generate(**kwargs, **self.generation_kwargs), ids)
+            # Kernel của inductor giữ số thread lúc compile: compile trên một worker để khớp số thread của worker
+            start = time.perf_counter()
+            if self.workers is not None:
+                self.workers.run(compile_all)
+            else:
+                compile_all()
+            logger.info("Compiled %d shapes in %.1fs.", len(self.compiled.ready), time.perf_counter() - start)
+        for text in texts:
+            self._summarize(text, max_cap=512, ratio=0.7)
+        # Chạy thử cả luồng streaming
+        for _ in self._summarize_stream(texts[-1], 512, 0.7, threading.Event()):
+            pass
+
+    def cache_key(self, text: str, max_cap: int, ratio: float, adapter: str = None, long_mode: str = None) -> str:
+        """
+        Builds the cache key of a request from the text, model identity and generation settings.
+
+        Args:
+            text (str): The text to summarize.
+            adapter (str): The named adapter, None for the default one.
+            long_mode (str): The long-document mode, None for the default one.
+
+        Returns:
+            str: The cache key.
+        """
+        params = dict(
+            max_cap=max_cap,
+            ratio=ratio,
+            long_mode=long_mode or self.long_mode,
+            output_budget=self.output_budget,
+            max_decode_tokens=self.max_decode_tokens,
+            sampling=self.generation_kwargs,
+            chunk_sampling=self.chunk_generation_kwargs,
+        )
+        return make_key(text, self.model_identity(adapter), params)
+
+    def summarize(self, text: str, max_cap: int = 512 , ratio : float = 0.7, adapter: str = None,
+                  long_mode: str = None, encoding: chunker.Encoding = None) -> str:
         """
         Summarizes the given text using the loaded model.
         
         Args:
             text (str): The text to summarize.
+            adapter (str): The named adapter to use, None for the default one.
+            long_mode (str): One of `LONG_MODES` for texts over MAX_INPUT_TOKENS, None for the default one.
+            encoding (chunker.Encoding): The output of `encode` for `text`, if already computed.
         
         Returns:
             str: The summarized text.
         """
-        tokenized_len  = len(text.split()) * 1.5
-        if tokenized_len < 100:
-            logger.info(f"Text is too short to summarize, returning original text.")
+        self.check_adapter(adapter)
+        long_mode = self.resolve_long_mode(long_mode)
+        if self.cache is None:
+            return self._summarize(text, max_cap=max_cap, ratio=ratio, encoding=encoding, adapter=adapter,
+                                   long_mode=long_mode)
+
+        key = self.cache_key(text, max_cap, ratio, adapter, long_mode)
+        summary = self.cache.get(key)
+        if summary is None:
+            summary = self._summarize(text, max_cap=max_cap, ratio=ratio, encoding=encoding, adapter=adapter,
+                                      long_mode=long_mode)
+            self.cache.put(key, summary)
+        else:
+            logger.info("Cache hit, returning cached summary.")
+        return summary
+
+    def _summarize(self, text: str, max_cap: int, ratio: float, encoding: chunker.Encoding = None,
+                   adapter: str = None, long_mode: str = None) -> str:
+        """
+        Summarizes the text without consulting the cache.
+        """
+        long_mode = long_mode or self.long_mode
+        if encoding is None:
+            encoding = self.encode(text)
+        tokenized_len = len(encoding.ids)
+        INPUT_TOKENS.observe(tokenized_len, route=route_of(tokenized_len))
+        if tokenized_len < MIN_SUMMARY_TOKENS:
+            logger.info("Text is too short to summarize, returning original text.")
             return text
-        elif 100 <= tokenized_len <= 1024:
-            logger.info(f"Text is within the summarization range, proceeding with summarization.")
-            max_length = self.estimate_max_length(text, max_cap= max_cap, ratio= ratio)
+        elif MIN_SUMMARY_TOKENS <= tokenized_len <= MAX_INPUT_TOKENS:
+            logger.info("Text is within the summarization range, proceeding with summarization.")
+            max_length = self.estimate_max_length(text, max_cap= max_cap, ratio= ratio, token_len= tokenized_len)
             if max_length <= 0:
                 raise ValueError("max_length must be greater than 0")
-            summary = self.summarizer(
-                text,
-                max_new_tokens= max_length,
-                do_sample= True,
-                temperature= 0.3,
-                repetition_penalty=1.2,
-                top_p=0.9,
-            )
-            return summary[0]['summary_text']
+            return self._generate_batch([self.input_ids(encoding)], [max_length], adapter, **self.generation_kwargs)[0]
+        elif long_mode == "extractive":
+            logger.info("Text is too long, summarizing its key sentences in one pass.")
+            extract = self.extract(text, encoding)
+            max_length = self.estimate_max_length(extract.text, max_cap, ratio, token_len=len(extract.input_ids))
+            return self._generate_batch([extract.input_ids], [max_length], adapter, **self.generation_kwargs)[0]
         else:
-            logger.info(f"Text is too long, splitting into chunks for summarization.")
+            logger.info("Text is too long, splitting into chunks for summarization.")
             # Nếu quá dài, nên chia nhỏ trước
-            chunks = self.split_into_chunks(text, max_tokens=1024)
-            summaries = [self.summarizer(chunk, max_new_tokens= 256, do_sample= True, temperature= 0.5, repetition_penalty= 1.2, top_p= 0.9)[0]['summary_text'] for chunk in chunks]
+            chunks = self.split_into_chunks(text, max_tokens=MAX_INPUT_TOKENS, encoding=encoding)
+            CHUNKS.observe(len(chunks))
+            if long_mode == "hierarchical":
+                final_chunk = self.reduce_chunks(chunks, adapter)
+                return self.summarize_chunks([final_chunk], max_new_tokens=self.output_budget, adapter=adapter)[0]
+            summaries = self.summarize_chunks(chunks, max_new_tokens=CHUNK_SUMMARY_TOKENS, adapter=adapter)
             return self.join_summaries(summaries)
 
-    def summarize_stream(self, text: str, max_cap: int = 512, ratio: float = 0.7):
+    def summarize_stream(self, text: str, max_cap: int = 512, ratio: float = 0.7, cancel_event: threading.Event = None,
+                         adapter: str = None, long_mode: str = None):
         """
         Trả về generator streaming các token tóm tắt.
+        Khi `cancel_event` được set (ví dụ client ngắt kết nối), việc sinh dừng sau vài bước
+        decode và các chunk còn lại bị bỏ qua. `adapter` chọn LoRA adapter theo tên (None: adapter mặc định),
+        `long_mode` chọn cách xử lý văn bản dài (None: chế độ mặc định).
         """
-        tokenized_len = len(text.split()) * 1.5
-        if tokenized_len < 100:
-            logger.info(f"Text is too short to summarize, returning original text.")
+        self.check_adapter(adapter)
+        long_mode = self.resolve_long_mode(long_mode)
+        if cancel_event is None:
+            cancel_event = threading.Event()
+        if self.cache is None:
+            yield from self._summarize_stream(text, max_cap, ratio, cancel_event, adapter, long_mode)
+            return
+
+        key = self.cache_key(text, max_cap, ratio, adapter, long_mode)
+        summary = self.cache.get(key)
+        if summary is not None:
+            logger.info("Cache hit, replaying cached summary.")
+            for token in summary.split():
+                yield token + " "
+            return
+
+        parts = []
+        for part in self._summarize_stream(text, max_cap, ratio, cancel_event, adapter, long_mode):
+            parts.append(part)
+            yield part
+        # Chỉ lưu khi stream chạy hết, không bị hủy giữa chừng
+        if not cancel_event.is_set():
+            self.cache.put(key, "".join(parts).strip())
+
+    def _summarize_stream(self, text: str, max_cap: int, ratio: float, cancel_event: threading.Event,
+                          adapter: str = None, long_mode: str = None):
+        """
+        Streams the summary without consulting the cache.
+        """
+        long_mode = long_mode or self.long_mode
+        encoding = self.encode(text)
+        tokenized_len = len(encoding.ids)
+        INPUT_TOKENS.observe(tokenized_len, route=route_of(tokenized_len))
+        if tokenized_len < MIN_SUMMARY_TOKENS:
+            logger.info("Text is too short to summarize, returning original text.")
             for token in text.split():
                 yield token + " "
             return
-        elif 100 <= tokenized_len <= 1024:
-            logger.info(f"Text is within the summarization range, proceeding with streaming summarization.")
+        elif MIN_SUMMARY_TOKENS <= tokenized_len <= MAX_INPUT_TOKENS:
+            logger.info("Text is within the summarization range, proceeding with streaming summarization.")
             # estimate độ dài tối đa
-            max_length = self.estimate_max_length(text, max_cap, ratio)
+            max_length = self.estimate_max_length(text, max_cap, ratio, token_len=tokenized_len)
             if max_length <= 0:
                 raise ValueError("max_length phải > 0")
-            
-            # chuẩn hóa đầu vào thành tokens
-            inputs = self.tokenizer(text, return_tensors="pt").to(self.device)
-            
-            # khởi tạo streamer
-            streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
-            
-            # prepare generate kwargs
-            gen_kwargs = dict(
-                **inputs,
-                max_new_tokens=max_length,
-                do_sample=True,
-                temperature=0.3,
-                repetition_penalty=1.2,
-                top_p=0.9,
-                streamer=streamer,
-            )
-            
-            # chạy generate trên một thread riêng
-            thread = threading.Thread(target=self.model.generate, kwargs=gen_kwargs)
-            thread.start()
-            
-            # yield dần từng token
-            for chunk in streamer:
-                yield chunk
 
-            thread.join()
+            # dùng lại token ids đã tokenize khi định tuyến
+            yield from self._stream_generate(self.input_ids(encoding), max_length, self.generation_kwargs, cancel_event, adapter)
+        elif long_mode == "extractive":
+            logger.info("Text is too long, streaming a summary of its key sentences.")
+            extract = self.extract(text, encoding)
+            max_length = self.estimate_max_length(extract.text, max_cap, ratio, token_len=len(extract.input_ids))
+            yield from self._stream_generate(extract.input_ids, max_length, self.generation_kwargs, cancel_event, adapter)
+        elif long_mode == "hierarchical":
+            logger.info("Text is too long, reducing chunk summaries before streaming the final pass.")
+            chunks = self.split_into_chunks(text, max_tokens=MAX_INPUT_TOKENS, encoding=encoding)
+            CHUNKS.observe(len(chunks))
+            final_chunk = self.reduce_chunks(chunks, adapter, cancel_event=cancel_event)
+            if cancel_event.is_set():
+                logger.info("Stream cancelled while reducing chunk summaries.")
+                return
+            # Chỉ stream lượt tóm tắt cuối cùng
+            yield from self._stream_generate(final_chunk.input_ids, self.output_budget, self.chunk_generation_kwargs, cancel_event, adapter)
         else:
-            logger.info(f"Text is too long, splitting into chunks for streaming summarization.")
+            logger.info("Text is too long, splitting into chunks for streaming summarization.")
             # Nếu quá dài, chia nhỏ trước
-            chunks = self.split_into_chunks(text, max_tokens=1024)
-            
+            chunks = self.split_into_chunks(text, max_tokens=MAX_INPUT_TOKENS, encoding=encoding)
+            CHUNKS.observe(len(chunks))
+
             for i, chunk in enumerate(chunks):
-                logger.info(f"Processing chunk {i+1}/{len(chunks)}")
-                # Xử lý từng chunk và stream kết quả
-                inputs = self.tokenizer(chunk, return_tensors="pt").to(self.device)
-                streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
-                
-                gen_kwargs = dict(
-                    **inputs,
-                    max_new_tokens=256,
-                    do_sample=True,
-                    temperature=0.5,
-                    repetition_penalty=1.2,
-                    top_p=0.9,
-                    streamer=streamer,
-                )
-                
-                thread = threading.Thread(target=self.model.generate, kwargs=gen_kwargs)
-                thread.start()
-                
+                if cancel_event.is_set():
+                    logger.info("Stream cancelled, skipping %d remaining chunks.", len(chunks) - i)
+                    return
+                logger.info("Processing chunk %d/%d", i + 1, len(chunks), extra=SAMPLED)
                 # Stream kết quả của chunk hiện tại
-                for chunk_result in streamer:
-                    yield chunk_result
-                
-                thread.join()
-                
+                yield from self._stream_generate(chunk.input_ids, CHUNK_SUMMARY_TOKENS, self.chunk_generation_kwargs, cancel_event, adapter)
+
                 # Thêm khoảng trắng giữa các chunk nếu không phải chunk cuối
                 if i < len(chunks) - 1:
-                    yield " "
\ No newline at end of file
+                    yield " "
+
+    def _stream_generate(self, input_ids: list, max_new_tokens: int, sampling: dict, cancel_event: threading.Event,
+                         adapter: str = None):
+        """
+        Runs generate on a separate thread and yields the decoded text as it is produced.
+        parameters:
+            input_ids (list): The input ids of the sequence.
+            max_new_tokens (int): The generation limit.
+            sampling (dict): The sampling arguments forwarded to `generate`.
+            cancel_event (threading.Event): Stops generation when set.
+            adapter (str): The named adapter to generate with, None for the default one.
+        """
+        start = time.perf_counter()
+        first = None
+        if self.engine is not None:
+            stats = {}
+            for chunk in self.engine.stream(input_ids, max_new_tokens, sampling, cancel_event, stats=stats):
+                if first is None:
+                    first = time.perf_counter()
+                    TTFT_SECONDS.observe(first - start)
+                yield chunk
+            # Engine chạy encoder khi nhận request: thời gian decode tính từ token đầu tiên
+            if first is not None:
+                DECODE_SECONDS.observe(time.perf_counter() - first)
+            self._observe_stream(start, stats.get("generated", 0))
+            return
+
+        # khởi tạo streamer
+        streamer = CountingStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+        # prepare generate kwargs
+        gen_kwargs = dict(
+            adapter=adapter,
+            batch_ids=[input_ids],
+            **self._model_inputs(input_ids),
+            max_new_tokens=max_new_tokens,
+            **sampling,
+            streamer=streamer,
+            stopping_criteria=StoppingCriteriaList([CancelCriteria(cancel_event)]),
+        )
+
+        # chạy generate trên một worker suy luận, hoặc trên một thread riêng
+        if self.workers is not None:
+            job = self.workers.submit(self._generate, **gen_kwargs)
+        else:
+            thread = threading.Thread(target=self._generate, kwargs=gen_kwargs)
+            thread.start()
+
+        # yield dần từng token
+        try:
+            for chunk in streamer:
+                if first is None:
+                    first = time.perf_counter()
+                    TTFT_SECONDS.observe(first - start)
+                yield chunk
+        finally:
+            # Generator bị đóng sớm (client ngắt kết nối): dừng thread sinh
+            if self.workers is not None:
+                if not job.done():
+                    cancel_event.set()
+                job.exception()
+            else:
+                if thread.is_alive():
+                    cancel_event.set()
+                thread.join()
+        self._observe_stream(start, streamer.generated)
+
+    @staticmethod
+    def _observe_stream(start: float, generated: int):
+        elapsed = time.perf_counter() - start
+        GENERATED_TOKENS.observe(generated)
+        if elapsed > 0:
+            TOKENS_PER_SECOND.observe(generated / elapsed)
@@ -0,0 +1,90 @@
+import os
+import re
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Không ghi log của test vào logging.log của thư mục làm việc
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "summarimer-tests.log"))
+
+from summarimer import Summarimer  # noqa: E402
+
+WORD = re.compile(r"\S+")
+
+
+class WordTokenizer:
+    """
+    A tokenizer with one token per whitespace-separated word and an EOS token, for tests
+    that only depend on token counts and offsets.
+    """
+    eos_token_id = 1
+
+    def __init__(self, is_fast: bool = True):
+        self.is_fast = is_fast
+        self.vocab = {}
+        self.words = {}
+
+    def _id(self, word: str) -> int:
+        if word not in self.vocab:
+            self.vocab[word] = len(self.vocab) + 2
+            self.words[self.vocab[word]] = word
+        return self.vocab[word]
+
+    def __call__(self, text, add_special_tokens: bool = True, return_offsets_mapping: bool = False):
+        if isinstance(text, list):
+            return {"input_ids": [self(t, add_special_tokens)["input_ids"] for t in text]}
+        matches = list(WORD.finditer(text))
+        encoded = {"input_ids": [self._id(m.group()) for m in matches]}
+        if add_special_tokens:
+            encoded["input_ids"].append(self.eos_token_id)
+        if return_offsets_mapping:
+            encoded["offset_mapping"] = [m.span() for m in matches]
+        return encoded
+
+    def num_special_tokens_to_add(self, pair: bool = False) -> int:
+        return 1
+
+    def build_inputs_with_special_tokens(self, ids: list) -> list:
+        return list(ids) + [self.eos_token_id]
+
+    def decode(self, ids, skip_special_tokens: bool = False) -> str:
+        return " ".join(self.words[i] for i in ids if i in self.words)
+
+
+class FakeSummarimer(Summarimer):
+    """
+    Summarimer with a word tokenizer and a generate that returns `max_new_tokens` words per chunk.
+    """
+
+    def __init__(self, long_mode: str = "concat", max_decode_tokens: int = None, cache=None):
+        self.tokenizer = WordTokenizer()
+        self.prefix_ids = []
+        self.long_mode = long_mode
+        self.output_budget = 256
+        self.max_decode_tokens = max_decode_tokens
+        self.cache = cache
+        self.model_id = "fake"
+        self.generation_kwargs = {}
+        self.chunk_generation_kwargs = {}
+        self.calls = []
+
+    def summarize_chunks(self, chunks, max_new_tokens=256, adapter=None, cancel_event=None):
+        self.calls.append((len(chunks), max_new_tokens))
+        return [" ".join(f"s{len(self.calls)}" for _ in range(max_new_tokens)) + "." for _ in chunks]
+
+    def summarize(self, text, max_cap=512, ratio=0.7, adapter=None, long_mode=None, encoding=None):
+        return "single pass"
+
+    def generated_tokens(self) -> int:
+        return sum(n * tokens for n, tokens in self.calls)
+
+
+def article(first: int, last: int) -> str:
+    return " ".join(f"Câu số {i} kể thêm một chi tiết mới." for i in range(first, last))
+
+
+@pytest.fixture
+def tokenizer():
+    return WordTokenizer()
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+import torch
+
+from adapters import AdapterManager, parse_adapters
+
+MIB = 1024 * 1024
+
+
+class FakePeftModel:
+    """
+    Records adapter loads and switches; every loaded adapter takes 1 MiB of fp32 parameters.
+    """
+
+    def __init__(self):
+        self.adapters = {"default"}
+        self.active = "default"
+        self.events = []
+
+    def load_adapter(self, path, adapter_name):
+        self.adapters.add(adapter_name)
+        self.events.append(("load", adapter_name))
+
+    def delete_adapter(self, name):
+        assert name != self.active, "deleted the active adapter"
+        self.adapters.remove(name)
+        self.events.append(("delete", name))
+
+    def set_adapter(self, name):
+        self.active = name
+        self.events.append(("set", name))
+
+    def named_parameters(self):
+        for name in sorted(self.adapters):
+            yield f"encoder.lora_A.{name}.weight", torch.empty(MIB // 4)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_parse_adapters():
+    assert parse_adapters(" headline=./lora-headline, finance = org/lora-finance ,") == {
+        "headline": "./lora-headline", "finance": "org/lora-finance"}
+    assert parse_adapters(None) == {}
+    with pytest.raises(ValueError):
+        parse_adapters("headline")
+    with pytest.raises(ValueError):
+        parse_adapters("=./lora")
+
+
+def test_rejects_reserved_and_unknown_names():
+    with pytest.raises(ValueError):
+        AdapterManager(FakePeftModel(), {"default": "./lora"})
+    manager = AdapterManager(FakePeftModel(), {"a": "./a"})
+    with pytest.raises(ValueError):
+        with manager.use("b"):
+            pass
+
+
+def test_adapters_take_turns_without_starving():
+    model = FakePeftModel()
+    manager = AdapterManager(model, {"a": "./a", "b": "./b"})
+    entered = []
+    release_a = threading.Event()
+
+    def run(name, hold=None):
+        with manager.use(name):
+            entered.append(name)
+            if hold is not None:
+                hold.wait(5)
+
+    first = threading.Thread(target=run, args=("a", release_a))
+    first.start()
+    wait_until(lambda: entered == ["a"])
+    # "b" phải chờ "a" chạy xong; các request "a" tới sau xếp hàng sau lần đổi adapter
+    switch = threading.Thread(target=run, args=("b",))
+    switch.start()
+    wait_until(lambda: manager._waiting.get("b") == 1)
+    late = [threading.Thread(target=run, args=("a",)) for _ in range(3)]
+    for thread in late:
+        thread.start()
+    wait_until(lambda: manager._waiting.get("a") == 3)
+    assert entered == ["a"]
+
+    release_a.set()
+    for thread in [first, switch, *late]:
+        thread.join(5)
+    assert entered == ["a", "b", "a", "a", "a"]
+    assert [event for event in model.events if event[0] == "set"] == [("set", "a"), ("set", "b"), ("set", "a")]
+
+
+def test_active_adapter_runs_concurrently():
+    manager = AdapterManager(FakePeftModel(), {"a": "./a"})
+    with manager.use("a"):
+        with manager.use("a"):
+            assert manager._users == 2
+    assert manager._users == 0
+
+
+def test_evicts_least_recently_used_adapters_over_budget():
+    model = FakePeftModel()
+    manager = AdapterManager(model, {"a": "./a", "b": "./b", "c": "./c"}, memory_budget_mb=2.5)
+    for name in ["a", "b", "a", "c"]:
+        with manager.use(name):
+            pass
+    # "b" được dùng lâu nhất trước đó nên bị gỡ, "a" và "c" vẫn nạp
+    assert [event for event in model.events if event[0] == "delete"] == [("delete", "b")]
+    assert list(manager._loaded) == ["a", "c"]
+    assert manager.memory_mb() == pytest.approx(2.0)
+
+
+def test_active_adapter_is_never_evicted():
+    model = FakePeftModel()
+    manager = AdapterManager(model, {"a": "./a", "b": "./b"}, memory_budget_mb=0)
+    with manager.use("a"):
+        assert list(manager._loaded) == ["a"]
+    with manager.use("b"):
+        assert model.active == "b"
+        assert list(manager._loaded) == ["b"]
+    assert ("delete", "b") not in model.events
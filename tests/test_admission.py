@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, DeadlineExceeded, Overloaded
+
+
+def wait_queued(admission: AdmissionController, count: int):
+    deadline = time.monotonic() + 2
+    while admission.queued < count and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert admission.queued == count
+
+
+def test_acquire_and_release_within_concurrency():
+    admission = AdmissionController(max_concurrency=2, max_queue=0)
+    first, second = admission.acquire(), admission.acquire()
+    assert admission.running == 2
+    admission.release(first)
+    admission.release(second)
+    assert admission.running == 0
+
+
+def test_full_queue_is_rejected():
+    admission = AdmissionController(max_concurrency=1, max_queue=0)
+    admission.acquire()
+    with pytest.raises(Overloaded) as error:
+        admission.acquire()
+    assert error.value.retry_after >= 1
+
+
+def test_deadline_is_enforced_while_queued():
+    admission = AdmissionController(max_concurrency=1, max_queue=1)
+    admission.acquire()
+    with pytest.raises(DeadlineExceeded):
+        admission.acquire(deadline=time.monotonic() + 0.05)
+    assert admission.queued == 0
+
+
+def test_slots_go_to_higher_priority_first():
+    admission = AdmissionController(max_concurrency=1, max_queue=4)
+    held = admission.acquire()
+    order = []
+
+    def wait(priority):
+        with admission.slot(priority):
+            order.append(priority)
+
+    threads = [threading.Thread(target=wait, args=("bulk",))]
+    threads[0].start()
+    wait_queued(admission, 1)
+    threads.append(threading.Thread(target=wait, args=("interactive",)))
+    threads[1].start()
+    wait_queued(admission, 2)
+
+    admission.release(held)
+    for thread in threads:
+        thread.join(2)
+    assert order == ["interactive", "bulk"]
+    assert admission.running == 0
+
+
+def test_async_waiters_are_woken_by_release():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=2)
+        held = await admission.acquire_async()
+        waiter = asyncio.ensure_future(admission.acquire_async())
+        await asyncio.sleep(0.01)
+        assert admission.queued == 1 and not waiter.done()
+        # Slot có thể được trả từ thread khác (thread suy luận)
+        threading.Thread(target=admission.release, args=(held,)).start()
+        admission.release(await asyncio.wait_for(waiter, 2))
+        return admission
+
+    admission = asyncio.run(scenario())
+    assert admission.running == 0 and admission.queued == 0
+
+
+def test_async_deadline_and_cancellation_leave_no_waiters():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=2)
+        await admission.acquire_async()
+        with pytest.raises(DeadlineExceeded):
+            await admission.acquire_async(deadline=time.monotonic() + 0.02)
+        waiter = asyncio.ensure_future(admission.acquire_async())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return admission
+
+    admission = asyncio.run(scenario())
+    assert admission.queued == 0 and admission.running == 1
+
+
+def test_cancelled_waiter_hands_its_granted_slot_over():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=2)
+        held = await admission.acquire_async()
+        cancelled = asyncio.ensure_future(admission.acquire_async())
+        await asyncio.sleep(0.01)
+        next_waiter = asyncio.ensure_future(admission.acquire_async())
+        await asyncio.sleep(0.01)
+        # Slot được cấp cho request đầu rồi request đó bị hủy trước khi kịp chạy
+        admission.release(held)
+        cancelled.cancel()
+        try:
+            # Tùy phiên bản Python, wait_for có thể trả kết quả đã có thay vì báo hủy
+            admission.release(await cancelled)
+        except asyncio.CancelledError:
+            pass
+        admission.release(await asyncio.wait_for(next_waiter, 2))
+        return admission
+
+    admission = asyncio.run(scenario())
+    assert admission.running == 0 and admission.queued == 0
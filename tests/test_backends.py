@@ -0,0 +1,18 @@
+from types import SimpleNamespace
+
+from backends import manifest_digest, model_manifest
+
+
+def test_manifest_digest_changes_when_weights_are_retrained_in_place(tmp_path):
+    weights = tmp_path / "model.safetensors"
+    weights.write_bytes(b"v1")
+    base_model = SimpleNamespace(name_or_path=str(tmp_path))
+    before = manifest_digest(model_manifest(base_model, None))
+    assert manifest_digest(model_manifest(base_model, None)) == before
+    weights.write_bytes(b"v2 retrained")
+    assert manifest_digest(model_manifest(base_model, None)) != before
+
+
+def test_manifest_digest_of_hub_names_is_stable():
+    base_model = SimpleNamespace(name_or_path="VietAI/vit5-base")
+    assert manifest_digest(model_manifest(base_model, "adapter")) == manifest_digest(model_manifest(base_model, "adapter"))
@@ -0,0 +1,72 @@
+import json
+
+from batch_summarize import load_checkpoint, read_windows, recover_output, save_checkpoint
+
+
+def write_lines(path, lines):
+    path.write_bytes("".join(line + "\n" for line in lines).encode("utf-8"))
+
+
+def test_read_windows_splits_into_windows(tmp_path):
+    path = tmp_path / "input.jsonl"
+    write_lines(path, [json.dumps({"id": i, "message": f"bài {i}"}) for i in range(5)])
+    windows = list(read_windows(str(path), 0, 2, "id", "message"))
+    assert [[item["id"] for item in items] for items, _ in windows] == [[0, 1], [2, 3], [4]]
+    assert windows[-1][1] == path.stat().st_size
+
+
+def test_read_windows_resumes_from_end_offset(tmp_path):
+    path = tmp_path / "input.jsonl"
+    write_lines(path, [json.dumps({"id": i, "message": "x"}) for i in range(4)])
+    _, end_offset = next(read_windows(str(path), 0, 3, "id", "message"))
+    resumed = list(read_windows(str(path), end_offset, 3, "id", "message"))
+    assert [[item["id"] for item in items] for items, _ in resumed] == [[3]]
+
+
+def test_read_windows_reports_bad_lines_as_errors(tmp_path):
+    path = tmp_path / "input.jsonl"
+    first = '{"id": "a", "message": "ok"}'
+    write_lines(path, [first, "", "not json", '{"id": "b", "message": 3}'])
+    items, _ = next(read_windows(str(path), 0, 10, "id", "message"))
+    assert items[0] == {"id": "a", "message": "ok"}
+    # Dòng trống bị bỏ qua, dòng lỗi được đánh id theo byte offset
+    assert items[1]["id"] == f"offset:{len(first) + 2}"
+    assert items[1]["error"].startswith("Invalid JSON")
+    assert items[2] == {"id": "b", "error": "Missing 'message' string"}
+
+
+def test_recover_output_truncates_partial_line(tmp_path):
+    path = tmp_path / "output.jsonl"
+    written = '{"id": 1, "summary": "a"}\n{"id": 2, "summary": "b"}\n'
+    path.write_bytes(written.encode("utf-8") + b'{"id": 3, "sum')
+    done = recover_output(str(path), {"output_offset": 0})
+    assert done == {1, 2}
+    assert path.read_bytes() == written.encode("utf-8")
+
+
+def test_recover_output_only_returns_ids_after_checkpoint(tmp_path):
+    path = tmp_path / "output.jsonl"
+    committed = b'{"id": 1, "summary": "a"}\n'
+    path.write_bytes(committed + b'{"id": 2, "summary": "b"}\n')
+    done = recover_output(str(path), {"output_offset": len(committed)})
+    assert done == {2}
+    assert path.stat().st_size == len(committed) + len(b'{"id": 2, "summary": "b"}\n')
+
+
+def test_recover_output_stops_at_invalid_line(tmp_path):
+    path = tmp_path / "output.jsonl"
+    path.write_bytes(b'{"id": 1}\ngarbage\n{"id": 2}\n')
+    assert recover_output(str(path), {"output_offset": 0}) == {1}
+    assert path.read_bytes() == b'{"id": 1}\n'
+
+
+def test_recover_output_without_file(tmp_path):
+    assert recover_output(str(tmp_path / "missing.jsonl"), {"output_offset": 0}) == set()
+
+
+def test_checkpoint_roundtrip(tmp_path):
+    output = str(tmp_path / "output.jsonl")
+    assert load_checkpoint(output) == {"input_offset": 0, "output_offset": 0, "done": 0}
+    checkpoint = {"input_offset": 120, "output_offset": 64, "done": 3}
+    save_checkpoint(output, checkpoint)
+    assert load_checkpoint(output) == checkpoint
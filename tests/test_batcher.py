@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from batcher import MicroBatcher
+
+
+class RecordingSummarizer:
+    """
+    Records each batched call and summarizes to upper case; fails on any batch containing "boom".
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def summarize_batch(self, texts, max_cap=512, ratio=0.7, adapter=None, long_mode=None, encodings=None):
+        with self.lock:
+            self.batches.append((list(texts), max_cap, ratio, adapter, long_mode, list(encodings)))
+        if "boom" in texts:
+            raise RuntimeError("generation failed")
+        return [text.upper() for text in texts]
+
+
+def test_flushes_when_batch_is_full():
+    summarizer = RecordingSummarizer()
+    batcher = MicroBatcher(summarizer, max_batch_size=3, max_wait_ms=10_000)
+    start = time.monotonic()
+    futures = [batcher.submit(text) for text in ["a", "b", "c"]]
+    assert [future.result(timeout=5) for future in futures] == ["A", "B", "C"]
+    # Không chờ hết max_wait_ms khi batch đã đầy
+    assert time.monotonic() - start < 5
+    assert [texts for texts, *_ in summarizer.batches] == [["a", "b", "c"]]
+
+
+def test_flushes_after_max_wait():
+    summarizer = RecordingSummarizer()
+    batcher = MicroBatcher(summarizer, max_batch_size=8, max_wait_ms=50)
+    start = time.monotonic()
+    futures = [batcher.submit(text) for text in ["a", "b"]]
+    assert [future.result(timeout=5) for future in futures] == ["A", "B"]
+    assert time.monotonic() - start >= 0.05
+    assert [texts for texts, *_ in summarizer.batches] == [["a", "b"]]
+
+
+def test_groups_by_generation_params_adapter_and_long_mode():
+    summarizer = RecordingSummarizer()
+    batcher = MicroBatcher(summarizer, max_batch_size=5, max_wait_ms=10_000)
+    futures = [
+        batcher.submit("a"),
+        batcher.submit("b", adapter="sport"),
+        batcher.submit("c", max_cap=128, encoding="enc-c"),
+        batcher.submit("d"),
+        batcher.submit("e", long_mode="extractive"),
+    ]
+    assert [future.result(timeout=5) for future in futures] == ["A", "B", "C", "D", "E"]
+    assert sorted(summarizer.batches) == sorted([
+        (["a", "d"], 512, 0.7, None, None, [None, None]),
+        (["b"], 512, 0.7, "sport", None, [None]),
+        (["c"], 128, 0.7, None, None, ["enc-c"]),
+        (["e"], 512, 0.7, None, "extractive", [None]),
+    ])
+
+
+@pytest.mark.parametrize("max_concurrent_batches", [1, 2])
+def test_failed_batch_fails_every_future(max_concurrent_batches):
+    summarizer = RecordingSummarizer()
+    batcher = MicroBatcher(summarizer, max_batch_size=3, max_wait_ms=10_000,
+                           max_concurrent_batches=max_concurrent_batches)
+    futures = [batcher.submit(text) for text in ["a", "boom", "c"]]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="generation failed"):
+            future.result(timeout=5)
+    # Batcher vẫn chạy tiếp sau lỗi
+    futures = [batcher.submit(text) for text in ["d", "e", "f"]]
+    assert [future.result(timeout=5) for future in futures] == ["D", "E", "F"]
@@ -0,0 +1,75 @@
+import json
+
+from bulk import bucket_by_length, parse_items, summarize_bucket
+
+
+class FakeSummarizer:
+    """
+    Summarizes to upper case and fails on any batch containing "boom".
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    def summarize_batch(self, texts, adapter=None):
+        self.batches.append((list(texts), adapter))
+        if "boom" in texts:
+            raise RuntimeError("generation failed")
+        return [text.upper() for text in texts]
+
+
+def test_parse_ndjson_keeps_valid_lines_and_reports_bad_ones():
+    body = "\n".join([
+        json.dumps({"id": "a", "message": "Một"}),
+        "{không phải json",
+        "",
+        json.dumps({"message": "Hai", "adapter": "sport"}),
+    ])
+    error, *items = parse_items(body)
+    assert error["id"] == "line:2" and error["error"].startswith("Invalid JSON")
+    assert items == [
+        {"id": "a", "message": "Một", "adapter": None},
+        {"id": "index:1", "message": "Hai", "adapter": "sport"},
+    ]
+
+
+def test_parse_json_array_validates_items():
+    body = json.dumps([{"id": 1, "message": "x"}, "text", {"id": 3}, {"id": 4, "message": "y", "adapter": 5}])
+    items = parse_items(body)
+    assert items[0] == {"id": 1, "message": "x", "adapter": None}
+    assert items[1] == {"id": "index:1", "error": "Item must be an object"}
+    assert items[2]["id"] == 3 and "message" in items[2]["error"]
+    assert items[3]["id"] == 4 and "adapter" in items[3]["error"]
+
+
+def test_invalid_json_array_is_one_error():
+    items = parse_items("[{")
+    assert len(items) == 1 and items[0]["id"] is None
+
+
+def test_buckets_group_by_adapter_and_length():
+    items = [
+        {"id": 1, "message": "x" * 30, "adapter": None},
+        {"id": 2, "message": "x" * 10, "adapter": "sport"},
+        {"id": 3, "message": "x" * 10, "adapter": None},
+        {"id": 4, "message": "x" * 20, "adapter": None},
+    ]
+    buckets = bucket_by_length(items, bucket_size=2)
+    assert [[item["id"] for item in bucket] for bucket in buckets] == [[3, 4], [1], [2]]
+
+
+def test_summarize_bucket_batches_one_call():
+    summarizer = FakeSummarizer()
+    bucket = [{"id": 1, "message": "a", "adapter": "sport"}, {"id": 2, "message": "b", "adapter": "sport"}]
+    assert summarize_bucket(summarizer, bucket) == [{"id": 1, "summary": "A"}, {"id": 2, "summary": "B"}]
+    assert summarizer.batches == [(["a", "b"], "sport")]
+
+
+def test_summarize_bucket_isolates_failing_items():
+    summarizer = FakeSummarizer()
+    bucket = [{"id": 1, "message": "a"}, {"id": 2, "message": "boom"}, {"id": 3, "message": "c"}]
+    assert summarize_bucket(summarizer, bucket) == [
+        {"id": 1, "summary": "A"},
+        {"id": 2, "error": "generation failed"},
+        {"id": 3, "summary": "C"},
+    ]
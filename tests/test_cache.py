@@ -0,0 +1,66 @@
+import torch
+
+from cache import EncoderCache, SummaryCache, make_key
+
+
+def test_make_key_ignores_trivial_text_differences():
+    params = {"max_cap": 512}
+    assert make_key("Xin  chào\n thế giới ", "m", params) == make_key("Xin chào thế giới", "m", params)
+    # Cùng chữ ở dạng NFD và NFC
+    assert make_key("Tiếng Việt", "m", params) == make_key("Tiếng Việt", "m", params)
+    assert make_key("Xin chào", "m", params) != make_key("Xin chào", "m+adapter", params)
+    assert make_key("Xin chào", "m", params) != make_key("Xin chào", "m", {"max_cap": 256})
+
+
+def test_summary_cache_evicts_least_recently_used():
+    cache = SummaryCache(max_entries=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+    assert cache.stats() == {"entries": 2, "hits": 3, "misses": 1, "hit_rate": 0.75}
+
+
+def test_summary_cache_persists_to_sqlite(tmp_path):
+    path = str(tmp_path / "summaries.sqlite")
+    SummaryCache(max_entries=1, path=path).put("a", "A")
+
+    cache = SummaryCache(max_entries=1, path=path)
+    assert cache.get("a") == "A"
+    cache.put("b", "B")
+    # Bản ghi đã bị đẩy khỏi bộ nhớ vẫn đọc lại được từ đĩa
+    assert cache.get("a") == "A"
+
+
+def test_encoder_cache_key_depends_on_model_and_ids():
+    assert EncoderCache.key("m", [1, 2, 3]) == EncoderCache.key("m", [1, 2, 3])
+    assert EncoderCache.key("m", [1, 2, 3]) != EncoderCache.key("m", [1, 2])
+    assert EncoderCache.key("m", [1, 2, 3]) != EncoderCache.key("m+adapter", [1, 2, 3])
+
+
+def test_encoder_cache_stays_within_max_bytes():
+    states = lambda: torch.zeros(4, 8)
+    size = states().numel() * states().element_size()
+    cache = EncoderCache(max_bytes=2 * size)
+    cache.put("a", states())
+    cache.put("b", states())
+    assert cache.get("a") is not None
+    cache.put("c", states())
+
+    assert cache.get("b") is None
+    assert cache.bytes == 2 * size
+    # Một trạng thái lớn hơn cả cache không được lưu
+    cache.put("d", torch.zeros(100, 8))
+    assert cache.get("d") is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_encoder_cache_replaces_an_existing_entry():
+    cache = EncoderCache(max_bytes=1024)
+    cache.put("a", torch.zeros(2, 8))
+    cache.put("a", torch.zeros(4, 8))
+    assert cache.get("a").shape == (4, 8)
+    assert cache.bytes == 4 * 8 * 4
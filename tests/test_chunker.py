@@ -0,0 +1,55 @@
+import pytest
+
+import chunker
+from conftest import WordTokenizer
+
+
+def test_sentence_spans_cover_vietnamese_punctuation():
+    text = 'Câu một. Câu hai?  "Câu ba!" Câu bốn…\nDòng mới'
+    assert [text[start:end].strip() for start, end in chunker.sentence_spans(text)] == [
+        "Câu một.", "Câu hai?", '"Câu ba!"', "Câu bốn…", "Dòng mới",
+    ]
+
+
+def test_sentence_spans_skip_blank_text():
+    assert chunker.sentence_spans("  \n\n ") == []
+
+
+@pytest.mark.parametrize("is_fast", [True, False])
+def test_encode_maps_sentences_to_token_ranges(is_fast):
+    tokenizer = WordTokenizer(is_fast=is_fast)
+    text = "Một hai ba. Bốn năm.\nSáu"
+    encoding = chunker.encode(tokenizer, text)
+
+    assert len(encoding.ids) == 6
+    assert [(tok_start, tok_end) for _, _, tok_start, tok_end in encoding.sentences] == [(0, 3), (3, 5), (5, 6)]
+    for char_start, char_end, tok_start, tok_end in encoding.sentences:
+        assert encoding.ids[tok_start:tok_end] == tokenizer(text[char_start:char_end], add_special_tokens=False)["input_ids"]
+
+
+def test_pack_keeps_sentences_whole_within_budget(tokenizer):
+    text = "A b c. D e f. G h i. J k l."
+    encoding = chunker.encode(tokenizer, text)
+    # 8 token mỗi chunk: 1 token đặc biệt, 1 token prefix, còn 6 token cho hai câu
+    chunks = chunker.pack(tokenizer, text, encoding, max_tokens=8, prefix_ids=[99])
+
+    assert [chunk.text for chunk in chunks] == ["A b c. D e f.", "G h i. J k l."]
+    for chunk in chunks:
+        assert chunk.text in text
+        assert chunk.input_ids[0] == 99 and chunk.input_ids[-1] == tokenizer.eos_token_id
+        assert len(chunk.input_ids) <= 8
+
+
+def test_pack_hard_splits_overlong_sentences(tokenizer):
+    text = "Ngắn. " + " ".join(f"w{i}" for i in range(10)) + "."
+    chunks = chunker.pack(tokenizer, text, chunker.encode(tokenizer, text), max_tokens=5)
+
+    assert chunks[0].text == "Ngắn."
+    assert all(len(chunk.input_ids) <= 5 for chunk in chunks)
+    assert sum(len(chunk.input_ids) - 1 for chunk in chunks) == len(chunker.encode(tokenizer, text).ids)
+
+
+def test_pack_rejects_budget_smaller_than_special_tokens(tokenizer):
+    text = "Một câu."
+    with pytest.raises(ValueError):
+        chunker.pack(tokenizer, text, chunker.encode(tokenizer, text), max_tokens=2, prefix_ids=[99])
@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+import torch
+from transformers import BatchEncoding, T5Config, T5ForConditionalGeneration
+
+from conftest import WordTokenizer
+from engine import StreamingEngine
+
+
+class PaddingTokenizer(WordTokenizer):
+    def pad(self, encoded: dict, return_tensors: str = "pt") -> dict:
+        ids = encoded["input_ids"]
+        width = max(len(row) for row in ids)
+        return BatchEncoding({
+            "input_ids": torch.tensor([row + [0] * (width - len(row)) for row in ids]),
+            "attention_mask": torch.tensor([[1] * len(row) + [0] * (width - len(row)) for row in ids]),
+        })
+
+    def decode(self, ids, skip_special_tokens: bool = False) -> str:
+        return " ".join(f"t{i}" for i in ids)
+
+
+@pytest.fixture(scope="module")
+def engine():
+    torch.manual_seed(0)
+    # Mô hình T5 rất nhỏ, khởi tạo ngẫu nhiên; eos nằm ngoài vocab để chuỗi chỉ dừng theo giới hạn
+    config = T5Config(vocab_size=64, d_model=16, d_kv=4, d_ff=32, num_layers=1, num_heads=2,
+                      decoder_start_token_id=0, pad_token_id=0, eos_token_id=1000)
+    model = T5ForConditionalGeneration(config).eval()
+    return StreamingEngine(model, PaddingTokenizer(), "cpu", max_batch_size=1)
+
+
+def test_stream_stops_at_the_generation_limit(engine):
+    stats = {}
+    text = "".join(engine.stream([5, 6, 7, 1], 5, {}, stats=stats))
+    assert stats["generated"] == 5
+    assert len(text.split()) == 5
+
+
+def test_cancelled_pending_stream_ends_while_the_batch_is_full(engine):
+    running_cancel = threading.Event()
+    running = engine.stream([5, 6, 7, 1], 100000, {}, running_cancel)
+    next(running)
+
+    # Batch đầy (max_batch_size=1): request thứ hai phải chờ, rồi bị hủy khi còn chờ
+    pending_cancel = threading.Event()
+    ended = threading.Event()
+
+    def consume():
+        for _ in engine.stream([8, 9, 1], 10, {}, pending_cancel):
+            pass
+        ended.set()
+
+    threading.Thread(target=consume, daemon=True).start()
+    pending_cancel.set()
+    try:
+        assert ended.wait(5)
+    finally:
+        running_cancel.set()
+        running.close()
@@ -0,0 +1,58 @@
+import numpy as np
+
+import chunker
+import extractive
+import summarimer
+from conftest import FakeSummarimer, article
+
+
+def sentence_lengths(encoding, indices):
+    return [encoding.sentences[i][3] - encoding.sentences[i][2] for i in indices]
+
+
+def test_selection_fits_budget_in_document_order(tokenizer):
+    encoding = chunker.encode(tokenizer, article(0, 40))
+    selected = extractive.select_sentences(encoding, budget=50)
+    assert selected == sorted(selected)
+    assert 0 < sum(sentence_lengths(encoding, selected)) <= 50
+
+
+def test_position_prior_favours_the_lede(tokenizer):
+    # Các câu giống hệt nhau: chỉ còn vị trí phân biệt được chúng
+    encoding = chunker.encode(tokenizer, " ".join(["Giá xăng tăng mạnh hôm nay."] * 6))
+    scores = extractive.score_sentences(encoding)
+    assert np.all(np.diff(scores) < 0)
+    assert extractive.select_sentences(encoding, budget=12) == [0, 1]
+
+
+def test_informative_sentence_beats_off_topic_one(tokenizer):
+    text = ("Bão số 3 đổ bộ vào miền Trung. Bão số 3 gây mưa lớn ở miền Trung. "
+            "Hôm nay trời đẹp quá. Bão số 3 làm ngập nhiều tuyến đường ở miền Trung.")
+    encoding = chunker.encode(tokenizer, text)
+    scores = extractive.score_sentences(encoding, position_weight=0.0)
+    assert scores[2] == scores.min()
+
+
+def test_empty_document_selects_nothing(tokenizer):
+    assert extractive.select_sentences(chunker.encode(tokenizer, ""), budget=10) == []
+
+
+def test_extract_keeps_selected_sentences_within_one_pass(monkeypatch):
+    monkeypatch.setattr(summarimer, "MAX_INPUT_TOKENS", 46)
+    fake = FakeSummarimer()
+    text = article(0, 20)
+    chunk = fake.extract(text, fake.encode(text))
+    # Ngân sách 45 token (trừ EOS): vừa đúng 5 câu 9 token
+    assert len(chunk.input_ids) == 46
+    assert chunk.text.startswith("Câu số 0 ")
+    assert chunk.text.count(".") == 5
+
+
+def test_extract_falls_back_to_truncation_when_no_sentence_fits(monkeypatch):
+    monkeypatch.setattr(summarimer, "MAX_INPUT_TOKENS", 6)
+    fake = FakeSummarimer()
+    text = article(0, 3)
+    encoding = fake.encode(text)
+    chunk = fake.extract(text, encoding)
+    assert chunk.text == text
+    assert chunk.input_ids == encoding.ids[:5] + [fake.tokenizer.eos_token_id]
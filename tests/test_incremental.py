@@ -0,0 +1,101 @@
+import pytest
+
+from cache import SummaryCache
+from conftest import FakeSummarimer, article
+from incremental import IncrementalSummarizer
+from summarimer import CHUNKS
+
+
+def test_segment_returns_spans_of_reused_and_new_regions():
+    incremental = IncrementalSummarizer(FakeSummarimer())
+    text = "Mở đầu. Đoạn A giữ nguyên. Chen vào. Đoạn B giữ nguyên. Kết."
+    previous = [("Đoạn A giữ nguyên.", "a"), ("Đoạn đã bị xóa.", "x"), ("Đoạn B giữ nguyên.", "b")]
+
+    segments = incremental.segment(text, previous)
+
+    assert [(text[start:end].strip(), summary) for start, end, summary in segments] == [
+        ("Mở đầu.", None), ("Đoạn A giữ nguyên.", "a"), ("Chen vào.", None), ("Đoạn B giữ nguyên.", "b"), ("Kết.", None),
+    ]
+
+
+def test_short_text_uses_single_pass():
+    incremental = IncrementalSummarizer(FakeSummarimer())
+    assert incremental.summarize("t", "Một bài ngắn.") == "single pass"
+
+
+def test_single_pass_gets_the_settings_and_the_encoding():
+    summarizer = FakeSummarimer()
+    calls = []
+    incremental = IncrementalSummarizer(summarizer, single_pass=lambda text, **kwargs: calls.append(kwargs) or "ok")
+
+    assert incremental.summarize("t", "Một bài ngắn.", max_cap=128, ratio=0.5, adapter="sport") == "ok"
+    assert calls[0]["max_cap"] == 128 and calls[0]["ratio"] == 0.5 and calls[0]["adapter"] == "sport"
+    assert calls[0]["encoding"] == summarizer.encode("Một bài ngắn.")
+
+
+def test_updates_only_summarize_new_chunks():
+    summarizer = FakeSummarimer()
+    incremental = IncrementalSummarizer(summarizer)
+
+    incremental.summarize("t", article(0, 600))
+    first = summarizer.calls[-1][0]
+    incremental.summarize("t", article(0, 700))
+    # Chỉ chunk cuối (gộp với phần thêm vào) được tóm tắt lại
+    assert summarizer.calls[-1][0] < first
+
+    # Lần cập nhật sau vẫn tìm lại được mọi chunk đã lưu trong văn bản
+    text = article(0, 800)
+    incremental.summarize("t", text)
+    state = incremental._threads[("t", None)][1]
+    assert all(chunk_text in text for chunk_text, _ in state)
+    assert summarizer.calls[-1][0] < first
+
+
+def test_threads_are_independent():
+    summarizer = FakeSummarimer()
+    incremental = IncrementalSummarizer(summarizer, max_threads=1)
+    incremental.summarize("a", article(0, 600))
+    incremental.summarize("b", article(0, 600))
+    assert ("a", None) not in incremental._threads
+
+
+def test_hierarchical_respects_the_decode_budget():
+    summarizer = FakeSummarimer(long_mode="hierarchical", max_decode_tokens=1200)
+    incremental = IncrementalSummarizer(summarizer)
+
+    incremental.summarize("t", article(0, 600))
+    assert summarizer.generated_tokens() <= 1200
+    # Tầng 1 dùng độ dài theo kế hoạch cho cả tài liệu, không phải CHUNK_SUMMARY_TOKENS
+    assert summarizer.calls[0][1] == summarizer.plan_decode_budget(summarizer.calls[0][0])[0]
+
+    summarizer.calls.clear()
+    incremental.summarize("t", article(0, 650))
+    assert summarizer.generated_tokens() <= 1200
+
+
+def test_long_texts_go_through_the_summary_cache():
+    summarizer = FakeSummarimer(cache=SummaryCache(max_entries=8))
+    incremental = IncrementalSummarizer(summarizer)
+    text = article(0, 600)
+
+    summary = incremental.summarize("t", text)
+    calls = len(summarizer.calls)
+    assert incremental.summarize("other", text) == summary
+    assert len(summarizer.calls) == calls
+    assert summarizer.cache.hits == 1
+
+
+def test_unknown_long_mode_is_rejected():
+    with pytest.raises(ValueError):
+        IncrementalSummarizer(FakeSummarimer()).summarize("t", article(0, 600), long_mode="nope")
+
+
+def test_chunk_count_is_observed_once_per_request():
+    summarizer = FakeSummarimer(long_mode="hierarchical", max_decode_tokens=1200)
+    incremental = IncrementalSummarizer(summarizer)
+    count = lambda: sum(series[2] for series in CHUNKS._series.values())
+
+    before = count()
+    incremental.summarize("t", article(0, 600))
+    incremental.summarize("t", article(0, 700))
+    assert count() == before + 2
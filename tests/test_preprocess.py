@@ -0,0 +1,37 @@
+import unicodedata
+
+import pytest
+
+from preprocess import normalize
+
+
+def test_normalize_strips_html_and_collapses_whitespace():
+    raw = unicodedata.normalize("NFD", "<div><p>Hà  Nội &amp; TP.HCM</p><script>x()</script><p>Đoạn hai.</p></div>")
+    assert normalize(raw) == "Hà Nội & TP.HCM\nĐoạn hai."
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("Bài viết.\nXem thêm:\nGiá vàng hôm nay tăng mạnh\nTỷ giá USD biến động\n\nĐoạn cuối.", "Bài viết.\nĐoạn cuối."),
+    ("Bài viết.\n>> Xem thêm: Giá vàng tăng mạnh\nĐoạn cuối.", "Bài viết.\nĐoạn cuối."),
+    ("Bài viết.\nTin liên quan: Giá vàng tăng mạnh", "Bài viết."),
+    ("Bài viết.\n(Theo TTXVN)", "Bài viết."),
+    ("Bài viết.\nTheo Tuổi Trẻ", "Bài viết."),
+    ("Nguồn: VnExpress\nBài viết.", "Bài viết."),
+    ("Người dân đi làm sáng nay. Ảnh: Ngọc Thành\nBài viết.", "Người dân đi làm sáng nay.\nBài viết."),
+    ("Giá xăng (Ảnh: minh họa) tăng.", "Giá xăng tăng."),
+])
+def test_boilerplate_is_removed(raw, expected):
+    assert normalize(raw) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "Tin liên quan đến vụ việc cho thấy nhiều sai phạm của doanh nghiệp.",
+    "Dự án chậm tiến độ.\nTheo ông Nam thì dự án sẽ xong",
+])
+def test_article_content_is_kept(text):
+    assert normalize(text) == text
+
+
+def test_related_block_stops_at_a_paragraph():
+    text = "Xem thêm\nNgười dân đã đến hiện trường và ghi nhận nhiều thiệt hại."
+    assert normalize(text) == "Người dân đã đến hiện trường và ghi nhận nhiều thiệt hại."
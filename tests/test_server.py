@@ -0,0 +1,32 @@
+import server
+
+
+class BulkSummarizer:
+    """
+    Fails to preprocess any message containing "boom" and upper-cases the rest.
+    """
+
+    def preprocess(self, text):
+        if "boom" in text:
+            raise ValueError("bad markup")
+        return text.strip()
+
+    def summarize_batch(self, texts, adapter=None):
+        return [text.upper() for text in texts]
+
+
+def test_bulk_preprocess_failure_is_per_item_and_releases_slot(monkeypatch):
+    monkeypatch.setattr(server, "summarizer", BulkSummarizer())
+    monkeypatch.setattr(server, "PREPROCESS", True)
+    in_flight = server.admission.running
+    results = server.run_bulk_bucket([{"id": 1, "message": " a "}, {"id": 2, "message": "boom"}])
+    assert sorted(results, key=lambda r: r["id"]) == [{"id": 1, "summary": "A"}, {"id": 2, "error": "bad markup"}]
+    assert server.admission.running == in_flight
+
+
+def test_healthz_fails_after_failed_startup(monkeypatch):
+    monkeypatch.setitem(server.state, "status", "loading")
+    assert server.healthz() == {"status": "alive", "model": "loading"}
+    monkeypatch.setitem(server.state, "status", "failed")
+    monkeypatch.setitem(server.state, "error", "weights missing")
+    assert server.healthz().status_code == 503
@@ -0,0 +1,34 @@
+import pytest
+
+import chunker
+from conftest import FakeSummarimer
+from summarimer import MIN_CHUNK_SUMMARY_TOKENS, Summarimer
+
+
+@pytest.mark.parametrize("max_decode_tokens", [256, 300, 1000, 1200, 2000, 5000])
+def test_plan_never_exceeds_the_decode_budget(max_decode_tokens):
+    summarizer = FakeSummarimer(long_mode="hierarchical", max_decode_tokens=max_decode_tokens)
+    for n_chunks in range(1, 200):
+        chunk_tokens, levels, total, kept = summarizer.plan_decode_budget(n_chunks)
+        assert total <= max_decode_tokens
+        assert 1 <= kept <= n_chunks
+        assert chunk_tokens >= MIN_CHUNK_SUMMARY_TOKENS
+
+
+def test_plan_keeps_every_chunk_when_the_budget_allows():
+    summarizer = FakeSummarimer(long_mode="hierarchical")
+    assert summarizer.plan_decode_budget(60)[3] == 60
+
+
+@pytest.mark.parametrize("n_chunks, max_decode_tokens", [(31, 1000), (60, 2000)])
+def test_reduce_chunks_generates_within_the_budget(n_chunks, max_decode_tokens):
+    summarizer = FakeSummarimer(long_mode="hierarchical", max_decode_tokens=max_decode_tokens)
+    chunks = [chunker.Chunk(f"Chunk {i}.", []) for i in range(n_chunks)]
+    summarizer.reduce_chunks(chunks)
+    # Lượt cuối sinh tối đa output_budget token
+    assert summarizer.generated_tokens() + summarizer.output_budget <= max_decode_tokens
+
+
+def test_budget_smaller_than_the_final_pass_is_rejected():
+    with pytest.raises(ValueError):
+        Summarimer("unused", None, device="cpu", output_budget=256, max_decode_tokens=100)
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from workers import WorkerPool, available_cpus, parse_layout
+
+CPUS = list(range(16))
+
+
+def test_parse_layout_splits_cpus_into_equal_workers():
+    assert parse_layout("2x4", CPUS) == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    assert parse_layout("4x4", CPUS[4:] + CPUS[:4])[0] == [4, 5, 6, 7]
+    assert parse_layout("", CPUS) == []
+    assert parse_layout(None, CPUS) == []
+
+
+def test_parse_layout_reads_core_lists():
+    assert parse_layout("0-3,8-11; 4-7,12-15", CPUS) == [[0, 1, 2, 3, 8, 9, 10, 11], [4, 5, 6, 7, 12, 13, 14, 15]]
+    assert parse_layout("0;5;9-10;", CPUS) == [[0], [5], [9, 10]]
+
+
+@pytest.mark.parametrize("spec", ["0x4", "2x0", "3x8", "0-4;4-7", "0-3;1", "12-17", "0-3;16"])
+def test_parse_layout_rejects_invalid_layouts(spec):
+    with pytest.raises(ValueError):
+        parse_layout(spec, CPUS)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def current_worker(event=None):
+    if event is not None:
+        event.wait(5)
+    return threading.current_thread().name
+
+
+def test_pool_dispatches_to_least_loaded_worker():
+    core = available_cpus()[:1]
+    pool = WorkerPool([core, core])
+    try:
+        release_first, release_second = threading.Event(), threading.Event()
+        first = pool.submit(current_worker, release_first)
+        second = pool.submit(current_worker, release_second)
+        assert pool.load() == 2
+        release_second.set()
+        assert second.result(timeout=5) == "inference-worker-1"
+        wait_until(lambda: pool.load() == 1)
+        # Worker 0 còn bận: lượt gọi tiếp theo sang worker 1
+        assert pool.run(current_worker) == "inference-worker-1"
+        release_first.set()
+        assert first.result(timeout=5) == "inference-worker-0"
+        wait_until(lambda: pool.load() == 0)
+    finally:
+        pool.close()
+
+
+def test_pool_propagates_exceptions():
+    pool = WorkerPool([available_cpus()[:1]])
+    try:
+        with pytest.raises(ZeroDivisionError):
+            pool.run(lambda: 1 / 0)
+        wait_until(lambda: pool.load() == 0)
+    finally:
+        pool.close()
+
+
+def test_pool_needs_a_worker():
+    with pytest.raises(ValueError):
+        WorkerPool([])
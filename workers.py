@@ -0,0 +1,190 @@
+"""
+Inference workers pinned to disjoint slices of CPU cores.
+
+With several requests in flight, every `generate` call otherwise runs on torch's intra-op pool
+sized for the whole machine, and the concurrent calls oversubscribe the cores. A `WorkerPool`
+runs N threads, each pinned (`sched_setaffinity` on the calling thread) to its own cores and
+with its own torch thread count, which the OpenMP backend PyTorch uses on Linux keeps per
+calling thread. PyTorch also stores the last count set by any thread in one global, and a
+thread's first parallel op re-applies that global, so with workers of different sizes the
+count is forced before the first op and re-checked before every call. OpenMP threads a
+worker spawns inherit its affinity. Calls are dispatched to the worker with the fewest queued
+and running calls.
+
+The layout is "NxT" (N workers of T cores, taken in order from the cores this process may
+use) or explicit core lists separated by ";", e.g. "0-7;8-15;16-31".
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+import metrics
+from config_log import get_logger
+logger = get_logger(__name__)
+
+WORKER_CALLS = metrics.counter("summarimer_worker_calls_total", "Generate calls run by each inference worker.")
+WORKER_WAIT_SECONDS = metrics.histogram("summarimer_worker_wait_seconds", "Time a call waits for its inference worker.")
+
+
+def available_cpus() -> list:
+    """
+    Returns the cores this process may run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _parse_cores(spec: str) -> list:
+    cores = []
+    for part in spec.split(","):
+        first, sep, last = part.strip().partition("-")
+        cores.extend(range(int(first), int(last) + 1) if sep else [int(first)])
+    return cores
+
+
+def parse_layout(spec: str, cpus: list = None) -> list:
+    """
+    Parses a worker layout such as "4x8" or "0-7;8-15".
+    parameters:
+        spec (str): "NxT" or ";"-separated core lists ("0-3,8-11;4-7,12-15").
+        cpus (list): The cores to split for "NxT", defaults to `available_cpus()`.
+    returns:
+        list: One list of core ids per worker, empty when `spec` is empty.
+    """
+    spec = (spec or "").strip()
+    if not spec:
+        return []
+    cpus = available_cpus() if cpus is None else cpus
+    if "x" in spec:
+        count, _, threads = spec.partition("x")
+        count, threads = int(count), int(threads)
+        if count < 1 or threads < 1:
+            raise ValueError(f"Invalid worker layout: {spec!r}")
+        if count * threads > len(cpus):
+            raise ValueError(f"Worker layout {spec} needs {count * threads} cores, only {len(cpus)} available")
+        return [cpus[i * threads:(i + 1) * threads] for i in range(count)]
+    layout = [_parse_cores(part) for part in spec.split(";") if part.strip()]
+    cores = [core for worker in layout for core in worker]
+    if len(cores) != len(set(cores)):
+        raise ValueError(f"Worker layout {spec} assigns a core to several workers")
+    if not set(cores) <= set(cpus):
+        raise ValueError(f"Worker layout {spec} uses cores outside {cpus}")
+    return layout
+
+
+class InferenceWorker:
+    """
+    A thread pinned to `cores` that runs queued calls one at a time.
+    """
+
+    def __init__(self, index: int, cores: list):
+        self.index = index
+        self.cores = list(cores)
+        # Số lượt gọi đang chờ hoặc đang chạy trên worker này
+        self.load = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=f"inference-worker-{index}", daemon=True)
+        self._thread.start()
+
+    def _pin(self):
+        if hasattr(os, "sched_setaffinity"):
+            try:
+                # pid 0 là thread đang chạy, không phải cả process
+                os.sched_setaffinity(0, self.cores)
+            except OSError as e:
+                logger.warning("Could not pin worker %d to cores %s: %s", self.index, self.cores, e)
+        # get_num_threads chạy lazy init của thread này trước, để nó không ghi đè số thread bên dưới
+        torch.get_num_threads()
+        torch.set_num_threads(len(self.cores))
+
+    def _apply_threads(self):
+        # Số thread OpenMP là của từng thread, nhưng có thể bị đặt lại từ giá trị chung của process
+        if torch.get_num_threads() != len(self.cores):
+            torch.set_num_threads(len(self.cores))
+
+    def _run(self):
+        self._pin()
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            fn, args, kwargs, future, queued_at = task
+            WORKER_WAIT_SECONDS.observe(time.perf_counter() - queued_at)
+            WORKER_CALLS.inc(worker=str(self.index))
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                self._apply_threads()
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def put(self, fn, args: tuple, kwargs: dict) -> Future:
+        future = Future()
+        self._queue.put((fn, args, kwargs, future, time.perf_counter()))
+        return future
+
+    def stop(self):
+        self._queue.put(None)
+
+
+class WorkerPool:
+    """
+    Dispatches calls to the least loaded of several pinned inference workers.
+    """
+
+    def __init__(self, layout: list):
+        if not layout:
+            raise ValueError("A worker pool needs at least one worker")
+        self.layout = [list(cores) for cores in layout]
+        self._closed = False
+        self._start()
+        # Thread không còn sau fork (chế độ prefork): tạo lại worker trong process con
+        os.register_at_fork(after_in_child=self._start)
+        logger.info("Started %d inference workers: %s", len(self.layout),
+                    "; ".join(f"{len(cores)} threads on {cores}" for cores in self.layout))
+
+    def _start(self):
+        if self._closed:
+            return
+        self._lock = threading.Lock()
+        self.workers = [InferenceWorker(i, cores) for i, cores in enumerate(self.layout)]
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Queues `fn(*args, **kwargs)` on the worker with the fewest pending calls.
+        returns:
+            Future: Resolves to the return value of `fn`.
+        """
+        with self._lock:
+            worker = min(self.workers, key=lambda w: w.load)
+            worker.load += 1
+        future = worker.put(fn, args, kwargs)
+        future.add_done_callback(lambda _: self._done(worker))
+        return future
+
+    def _done(self, worker: InferenceWorker):
+        with self._lock:
+            worker.load -= 1
+
+    def load(self) -> int:
+        """
+        Returns the number of calls queued or running on all workers.
+        """
+        return sum(worker.load for worker in self.workers)
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Runs `fn(*args, **kwargs)` on a worker and waits for the result.
+        """
+        return self.submit(fn, *args, **kwargs).result()
+
+    def close(self):
+        self._closed = True
+        for worker in self.workers:
+            worker.stop()